@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes de taille de batch et d'attente en file (en ms)
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+QUEUE_WAIT_BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100]
+
+# File d'attente d'un modèle (ville, type_local)
+class _ModelQueue:
+    def __init__(self):
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.worker = None
+
+# Compteurs pour régler la fenêtre de batching
+class BatchingStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_errors = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.queue_wait_counts = [0] * (len(QUEUE_WAIT_BUCKETS_MS) + 1)
+        self.queue_wait_total_ms = 0.0
+        self.queue_wait_max_ms = 0.0
+
+    def record_batch(self, size: int, waits_ms: List[float]) -> None:
+        self.n_batches += 1
+        self.n_requests += size
+        self.batch_size_counts[_bucket_index(BATCH_SIZE_BUCKETS, size)] += 1
+        for wait in waits_ms:
+            self.queue_wait_counts[_bucket_index(QUEUE_WAIT_BUCKETS_MS, wait)] += 1
+            self.queue_wait_total_ms += wait
+            self.queue_wait_max_ms = max(self.queue_wait_max_ms, wait)
+
+    def to_dict(self) -> dict:
+        return {
+            "n_requests": self.n_requests,
+            "n_batches": self.n_batches,
+            "n_errors": self.n_errors,
+            "mean_batch_size": self.n_requests / self.n_batches if self.n_batches else 0.0,
+            "batch_size_histogram": _histogram(BATCH_SIZE_BUCKETS, self.batch_size_counts),
+            "mean_queue_wait_ms": self.queue_wait_total_ms / self.n_requests if self.n_requests else 0.0,
+            "max_queue_wait_ms": self.queue_wait_max_ms,
+            "queue_wait_ms_histogram": _histogram(QUEUE_WAIT_BUCKETS_MS, self.queue_wait_counts),
+        }
+
+def _bucket_index(buckets, value) -> int:
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+def _histogram(buckets, counts) -> Dict[str, int]:
+    labels = [f"<={bound}" for bound in buckets] + [f">{buckets[-1]}"]
+    return dict(zip(labels, counts))
+
+# Regroupe les prédictions unitaires concurrentes d'un même modèle
+# pour faire un seul appel à predict par vidage de la file
+class MicroBatcher:
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray, str, str], np.ndarray],
+        max_wait_ms: float = 2.0,
+        max_batch_size: int = 64,
+        executor: Optional[Executor] = None
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size doit être supérieur ou égal à 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms ne peut pas être négatif")
+        # predict_fn(rows, ville, type_local) -> une prédiction par ligne
+        self.predict_fn = predict_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        # Pool où exécuter predict_fn, avec une méthode submit (None = dans la boucle asyncio)
+        self.executor = executor
+        self.stats = BatchingStats()
+        self._queues: Dict[Tuple[str, str], _ModelQueue] = {}
+        self._loop = None
+
+    async def submit(self, ville: str, type_local: str, row: List[float]) -> float:
+        # Ajoute une ligne à la file du modèle et attend sa prédiction
+        queue = self._get_queue((ville, type_local))
+        future = asyncio.get_running_loop().create_future()
+        queue.pending.append((row, future, time.perf_counter()))
+        queue.wakeup.set()
+        if len(queue.pending) >= self.max_batch_size:
+            queue.full.set()
+        return await future
+
+    async def close(self) -> None:
+        # Arrête les workers (les requêtes encore en file sont annulées)
+        if self._loop is not asyncio.get_running_loop():
+            # Files créées sur une autre boucle (déjà fermée) : rien à attendre
+            self._queues = {}
+            return
+        for queue in self._queues.values():
+            if queue.worker is not None:
+                queue.worker.cancel()
+            for _, future, _ in queue.pending:
+                if not future.done():
+                    future.cancel()
+        workers = [q.worker for q in self._queues.values() if q.worker is not None]
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queues = {}
+
+    def _get_queue(self, key: Tuple[str, str]) -> _ModelQueue:
+        # Les files sont liées à la boucle asyncio courante
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._queues = {}
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = _ModelQueue()
+            queue.worker = loop.create_task(self._worker(key, queue))
+            self._queues[key] = queue
+        return queue
+
+    async def _worker(self, key: Tuple[str, str], queue: _ModelQueue) -> None:
+        while True:
+            if not queue.pending:
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+            # On attend que le batch soit plein ou que la fenêtre expire
+            if len(queue.pending) < self.max_batch_size and self.max_wait > 0:
+                queue.full.clear()
+                try:
+                    await asyncio.wait_for(queue.full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            size = min(self.max_batch_size, len(queue.pending))
+            batch = [queue.pending.popleft() for _ in range(size)]
+            await self._flush(key, batch)
+
+    async def _flush(self, key: Tuple[str, str], batch) -> None:
+        # Un seul appel au modèle pour toutes les requêtes en attente
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        now = time.perf_counter()
+        self.stats.record_batch(len(batch), [(now - queued_at) * 1000 for _, _, queued_at in batch])
+        ville, type_local = key
+        try:
+            rows = np.asarray([row for row, _, _ in batch], dtype=float)
+            if self.executor is None:
+                predictions = self.predict_fn(rows, ville, type_local)
+            else:
+                predictions = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.predict_fn, rows, ville, type_local
+                )
+        except Exception as e:
+            self.stats.n_errors += 1
+            logger.error("Error in micro-batch for %s/%s: %s", ville, type_local, e)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(float(prediction))
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Cache LRU borné des prédictions, avec durée de vie optionnelle
+# Partagé entre les requêtes concurrentes (accès protégé par un verrou)
+class PredictionCache:
+    def __init__(self, max_size: int = 10000, ttl_seconds: Optional[float] = None, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size doit être supérieur ou égal à 1")
+        if ttl_seconds is not None and ttl_seconds <= 0:
+            raise ValueError("ttl_seconds doit être positif")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(ville: str, type_local: str, model_version: str, features: Dict[str, Any]) -> Tuple:
+        # Clé normalisée : seules les features utilisées par le modèle, en float
+        # (100 et 100.0 donnent la même clé, nombre_pieces n'intervient pas)
+        return (
+            ville.lower(),
+            type_local,
+            model_version,
+            float(features["surface_bati"]),
+            float(features.get("surface_terrain", 0)),
+            float(features["nombre_lots"]),
+        )
+
+    def get(self, key: Hashable) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl_seconds is not None and self._clock() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        # Vide le cache (appelé quand de nouveaux modèles sont chargés)
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,332 @@
+"""
+Compaction des modèles actifs dans un budget de précision (moins d'arbres et de nœuds).
+
+Usage : python -m app.compaction --version 2023-compact [--villes lille bordeaux]
+            [--max-rmse-increase 0.01] [--max-r2-drop 0.005] [--activate]
+
+Pour chaque (ville, type_local), sur les transactions mises de côté (même préparation et même
+séparation que app.training) :
+- les sous-arbres de faible gain sont élagués (élagage coût-complexité, seuil alpha) et les
+  feuilles sœurs de même valeur fusionnées (sans effet sur les prédictions) ;
+- un sous-ensemble d'arbres est choisi par sélection gloutonne : on ajoute à chaque étape
+  l'arbre qui réduit le plus l'erreur, jusqu'à respecter le budget ;
+- parmi les alphas essayés, la forêt la plus petite (en nœuds) qui respecte le budget est retenue.
+
+Le budget est relatif au modèle actif : RMSE au plus (1 + max_rmse_increase) fois la sienne et
+R² au plus max_r2_drop en dessous. Les transactions mises de côté sont coupées en deux : la
+première moitié guide la sélection des arbres, et le budget doit être respecté sur les deux
+moitiés ; si aucun candidat ne le respecte, le modèle actif est recopié tel quel. La nouvelle
+version est écrite comme par app.training, avec un rapport avant / après (nœuds, octets,
+latence, métriques).
+"""
+import argparse
+import copy
+import json
+import pickle
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .incremental import predict_raw
+from .logging_setup import setup_logging
+from .models.artifact import ARRAY_DTYPES, ForestArtifact, save_model_files
+from .models.forest import TREE_LEAF, _scaler_params
+from .models.model_loader import ModelLoader
+from .training import (
+    MODELS_PATH, TYPES_LOCAL, load_training_data, parse_villes, prepare_dataset, regression_metrics,
+    update_manifest,
+)
+
+# Valeurs sklearn des feuilles pour la feature et le seuil
+TREE_UNDEFINED = -2
+
+# Nombre de seuils alpha essayés (quantiles des gains des nœuds du modèle)
+N_ALPHAS = 24
+
+def compact_tree(tree, alpha: float = 0.0):
+    """
+    Copie de l'arbre élaguée au seuil alpha, feuilles sœurs identiques fusionnées.
+
+    Un nœud devient une feuille (valeur : moyenne de ses échantillons, déjà stockée par
+    sklearn) quand la réduction d'erreur de son sous-arbre par feuille ajoutée est au plus
+    alpha, comme l'élagage ccp_alpha de sklearn ; alpha = 0 ne fait que les fusions exactes.
+    """
+    tree = copy.deepcopy(tree)
+    state = tree.tree_.__getstate__()
+    nodes, values = state["nodes"], state["values"]
+    left, right = nodes["left_child"], nodes["right_child"]
+    weight = nodes["weighted_n_node_samples"]
+    risk = nodes["impurity"] * weight / weight[0]
+    is_leaf = left == TREE_LEAF
+    leaf_value = values[:, 0, 0].copy()
+    subtree_risk = risk.copy()
+    n_leaves = np.ones(len(nodes), dtype=np.int64)
+
+    # Les fils ont des indices plus grands que leur parent : parcours des feuilles vers la racine
+    for node in range(len(nodes) - 1, -1, -1):
+        if is_leaf[node]:
+            continue
+        l, r = left[node], right[node]
+        if is_leaf[l] and is_leaf[r] and leaf_value[l] == leaf_value[r]:
+            # Deux feuilles de même valeur : même prédiction avec une seule feuille
+            leaf_value[node] = leaf_value[l]
+            subtree_risk[node] = subtree_risk[l] + subtree_risk[r]
+        else:
+            children_risk = subtree_risk[l] + subtree_risk[r]
+            leaves = n_leaves[l] + n_leaves[r]
+            if alpha <= 0 or risk[node] - children_risk > alpha * (leaves - 1):
+                subtree_risk[node] = children_risk
+                n_leaves[node] = leaves
+                continue
+        is_leaf[node] = True
+        n_leaves[node] = 1
+
+    # Renumérotation en profondeur (ordre sklearn) des nœuds encore atteignables
+    order, depths, stack = [], [], [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        order.append(node)
+        depths.append(depth)
+        if not is_leaf[node]:
+            stack.append((right[node], depth + 1))
+            stack.append((left[node], depth + 1))
+    order = np.array(order)
+    new_ids = np.full(len(nodes), TREE_LEAF, dtype=np.int64)
+    new_ids[order] = np.arange(len(order))
+    new_nodes = nodes[order].copy()
+    leaves = is_leaf[order]
+    new_nodes["left_child"] = np.where(leaves, TREE_LEAF, new_ids[left[order]])
+    new_nodes["right_child"] = np.where(leaves, TREE_LEAF, new_ids[right[order]])
+    new_nodes["feature"] = np.where(leaves, TREE_UNDEFINED, new_nodes["feature"])
+    new_nodes["threshold"] = np.where(leaves, TREE_UNDEFINED, new_nodes["threshold"])
+    new_values = values[order].copy()
+    new_values[leaves, 0, 0] = leaf_value[order][leaves]
+
+    state.update(nodes=new_nodes, values=new_values, node_count=len(order), max_depth=int(max(depths)))
+    tree.tree_.__setstate__(state)
+    return tree
+
+def node_gains(trees) -> np.ndarray:
+    # Réduction d'erreur par feuille ajoutée de chaque nœud interne (candidats pour alpha)
+    gains = []
+    for tree in trees:
+        tree_ = tree.tree_
+        internal = np.flatnonzero(tree_.children_left != TREE_LEAF)
+        weight = tree_.weighted_n_node_samples
+        risk = tree_.impurity * weight / weight[0]
+        children = risk[tree_.children_left[internal]] + risk[tree_.children_right[internal]]
+        gains.append(risk[internal] - children)
+    return np.concatenate(gains) if gains else np.empty(0)
+
+def greedy_order(tree_predictions: np.ndarray, y_scaled: np.ndarray) -> List[int]:
+    """Ordre d'ajout des arbres : à chaque étape, celui qui minimise l'erreur de la moyenne"""
+    remaining = list(range(len(tree_predictions)))
+    order, total = [], np.zeros(tree_predictions.shape[1])
+    while remaining:
+        candidates = (total + tree_predictions[remaining]) / (len(order) + 1)
+        best = int(np.argmin(((candidates - y_scaled) ** 2).mean(axis=1)))
+        total += tree_predictions[remaining[best]]
+        order.append(remaining.pop(best))
+    return order
+
+def rmse_r2(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    # RMSE et R² sans la validation des métriques sklearn (appelées des milliers de fois)
+    residuals = ((y_true - y_pred) ** 2).sum()
+    total = ((y_true - y_true.mean()) ** 2).sum()
+    return {"rmse": float(np.sqrt(residuals / len(y_true))), "r2": float(1 - residuals / total) if total else 0.0}
+
+def tree_predict(tree, X_scaled: np.ndarray) -> np.ndarray:
+    # Valeur de la feuille atteinte, comme tree.predict (features float32)
+    return tree.tree_.value[tree.tree_.apply(X_scaled), 0, 0]
+
+def within_budget(metrics: Dict[str, float], base: Dict[str, float], max_rmse_increase: float,
+                  max_r2_drop: float) -> bool:
+    return (metrics["rmse"] <= base["rmse"] * (1 + max_rmse_increase)
+            and metrics["r2"] >= base["r2"] - max_r2_drop)
+
+def build_model(model, trees):
+    # Forêt (ou arbre seul) du même type que le modèle d'origine avec les arbres donnés
+    if not hasattr(model, "estimators_"):
+        return trees[0]
+    compact = copy.deepcopy(model)
+    compact.estimators_ = list(trees)
+    compact.n_estimators = len(trees)
+    return compact
+
+def compact_model(model, scaler_x, scaler_y, X_select, y_select, X_check, y_check,
+                  max_rmse_increase: float = 0.01, max_r2_drop: float = 0.005) -> Dict[str, Any]:
+    """Retourne le plus petit modèle compacté respectant le budget sur les deux moitiés"""
+    trees = list(getattr(model, "estimators_", [model]))
+    X_select_scaled = np.ascontiguousarray(scaler_x.transform(X_select), dtype=np.float32)
+    X_check_scaled = np.ascontiguousarray(scaler_x.transform(X_check), dtype=np.float32)
+    y_mean, y_scale = _scaler_params(scaler_y, 1)
+    y_select_scaled = scaler_y.transform(np.asarray(y_select, dtype=np.float64).reshape(-1, 1))[:, 0]
+    y_select, y_check = np.asarray(y_select, dtype=np.float64), np.asarray(y_check, dtype=np.float64)
+    base_select = rmse_r2(y_select, predict_raw(model, scaler_x, scaler_y, X_select))
+    base_check = regression_metrics(y_check, predict_raw(model, scaler_x, scaler_y, X_check))
+
+    gains = node_gains(trees)
+    alphas = [0.0] + sorted(set(np.quantile(gains, np.linspace(0, 1, N_ALPHAS)).tolist())) if len(gains) else [0.0]
+    candidates = []
+    for alpha in alphas:
+        pruned = [compact_tree(tree, alpha) for tree in trees]
+        predictions = np.array([tree_predict(tree, X_select_scaled) for tree in pruned])
+        check_predictions = np.array([tree_predict(tree, X_check_scaled) for tree in pruned])
+        order = greedy_order(predictions, y_select_scaled) if len(pruned) > 1 else [0]
+        total, check_total = np.zeros(len(y_select)), np.zeros(len(y_check))
+        for k, index in enumerate(order, start=1):
+            total += predictions[index]
+            check_total += check_predictions[index]
+            y_pred = total / k * y_scale[0] + y_mean[0]
+            if not within_budget(rmse_r2(y_select, y_pred), base_select, max_rmse_increase, max_r2_drop):
+                continue
+            y_check_pred = check_total / k * y_scale[0] + y_mean[0]
+            if within_budget(rmse_r2(y_check, y_check_pred), base_check, max_rmse_increase, max_r2_drop):
+                # Arbres gardés dans leur ordre d'origine
+                chosen = [pruned[i] for i in sorted(order[:k])]
+                candidates.append((sum(tree.tree_.node_count for tree in chosen), -alpha, alpha, chosen))
+                break
+
+    if not candidates:
+        return {"model": model, "alpha": None, "budget_met": False, "base": base_check, "compact": base_check}
+    # La plus petite forêt (en nœuds), métriques recalculées avec le modèle final
+    _, _, alpha, chosen = min(candidates, key=lambda c: c[:2])
+    compact = build_model(model, chosen)
+    check = regression_metrics(y_check, predict_raw(compact, scaler_x, scaler_y, X_check))
+    return {"model": compact, "alpha": alpha, "budget_met": True, "base": base_check, "compact": check}
+
+def artifact_bytes(artifact: ForestArtifact) -> int:
+    return sum(getattr(artifact, name).nbytes for name in ARRAY_DTYPES)
+
+def median_us(fn, repeat: int = 50) -> float:
+    fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(durations)
+
+def describe_model(model, scaler_x, scaler_y, X) -> Dict[str, Any]:
+    # Taille et latence d'un modèle (artefact servi par l'API), une ligne et 1000 lignes
+    # X : DataFrame des features du modèle, comme pour les scalers
+    trees = list(getattr(model, "estimators_", [model]))
+    artifact = ForestArtifact.from_estimator(model, scaler_x, scaler_y)
+    rows = np.resize(X.to_numpy(dtype=np.float64), (1000, X.shape[1]))
+    return {
+        "n_trees": len(trees),
+        "node_count": int(sum(tree.tree_.node_count for tree in trees)),
+        "max_depth": int(max(tree.tree_.max_depth for tree in trees)),
+        "pickle_bytes": len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)),
+        "artifact_bytes": artifact_bytes(artifact),
+        "latency_us": {
+            "single": median_us(lambda: artifact.predict(rows[:1])),
+            "batch_1000": median_us(lambda: artifact.predict(rows), repeat=10),
+        },
+    }
+
+def compact_combination(model_loader: ModelLoader, ville: str, type_local: str, csv_path: Path, version: str,
+                        max_rmse_increase: float = 0.01, max_r2_drop: float = 0.005, holdout: float = 0.2,
+                        seed: int = 42, pieces: Optional[int] = 4) -> Dict[str, Any]:
+    """Compacte le modèle actif d'une ville et d'un type de bien et écrit ses artefacts"""
+    from sklearn.model_selection import train_test_split
+
+    entry = model_loader.resolve(type_local, ville)
+    model, scaler_x, scaler_y, _ = model_loader.get_model_and_scalers(type_local, ville, entry.version)
+
+    X, y = prepare_dataset(load_training_data(csv_path), type_local, pieces)
+    _, X_test, _, y_test = train_test_split(X, y, test_size=holdout, random_state=seed)
+    X_select, X_check, y_select, y_check = train_test_split(X_test, y_test, test_size=0.5, random_state=seed)
+
+    started = time.perf_counter()
+    result = compact_model(model, scaler_x, scaler_y, X_select, y_select, X_check, y_check,
+                           max_rmse_increase, max_r2_drop)
+    compact = result["model"]
+    compaction_seconds = time.perf_counter() - started
+
+    before = describe_model(model, scaler_x, scaler_y, X_check)
+    after = describe_model(compact, scaler_x, scaler_y, X_check)
+    before["holdout"], after["holdout"] = result["base"], result["compact"]
+
+    files = save_model_files(model_loader.models_path, version, ville, type_local, compact, scaler_x, scaler_y)
+
+    return {
+        "ville": ville,
+        "type_local": type_local,
+        "version": version,
+        "base_version": entry.version,
+        "files": files,
+        "budget": {"max_rmse_increase": max_rmse_increase, "max_r2_drop": max_r2_drop},
+        "budget_met": result["budget_met"],
+        "alpha": result["alpha"],
+        "n_select": int(len(X_select)),
+        "n_check": int(len(X_check)),
+        "compaction_seconds": compaction_seconds,
+        "before": before,
+        "after": after,
+        "reduction": {
+            name: 1 - after[name] / before[name] if before[name] else 0.0
+            for name in ("n_trees", "node_count", "pickle_bytes", "artifact_bytes")
+        },
+    }
+
+def compact_all(villes: Dict[str, Path], version: str, models_path: Path = MODELS_PATH,
+                types_local=TYPES_LOCAL, activate: bool = False, **kwargs) -> Dict[str, Any]:
+    """Compacte tous les (ville, type_local) demandés et écrit le metrics.json de la version"""
+    started = time.perf_counter()
+    version_dir = Path(models_path) / version
+    if version_dir.exists() and any(version_dir.iterdir()):
+        raise ValueError(f"La version {version} existe déjà : {version_dir}")
+    version_dir.mkdir(parents=True, exist_ok=True)
+
+    model_loader = ModelLoader(models_path=models_path, use_artifacts=False)
+    results = [
+        compact_combination(model_loader, ville, type_local, villes[ville], version, **kwargs)
+        for ville in sorted(villes) for type_local in types_local
+    ]
+    metrics = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "mode": "compaction",
+        "seconds": time.perf_counter() - started,
+        "models": results,
+    }
+    (version_dir / "metrics.json").write_text(json.dumps(metrics, indent=2, ensure_ascii=False))
+    update_manifest(Path(models_path), results, activate)
+    return metrics
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compaction des modèles actifs dans un budget de précision")
+    parser.add_argument("--villes", nargs="+", default=["lille", "bordeaux"],
+                        help="Villes (ex : lille ou lille=chemin/vers/export.csv)")
+    parser.add_argument("--type-local", nargs="+", choices=TYPES_LOCAL, default=list(TYPES_LOCAL))
+    parser.add_argument("--version", default=datetime.now().strftime("%Y%m%d-%H%M%S") + "-compact",
+                        help="Nom de la version")
+    parser.add_argument("--max-rmse-increase", type=float, default=0.01,
+                        help="Hausse relative maximale de la RMSE (0.01 = +1 %%)")
+    parser.add_argument("--max-r2-drop", type=float, default=0.005, help="Baisse maximale du R²")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Part des données mise de côté")
+    parser.add_argument("--seed", type=int, default=42, help="Graine de la séparation")
+    parser.add_argument("--pieces", type=int, default=4, help="Nombre de pièces retenu (0 = tous)")
+    parser.add_argument("--models-path", type=Path, default=MODELS_PATH, help="Dossier des modèles")
+    parser.add_argument("--activate", action="store_true", help="Active la nouvelle version dans le manifeste")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    metrics = compact_all(
+        parse_villes(args.villes), args.version, args.models_path, tuple(args.type_local), args.activate,
+        max_rmse_increase=args.max_rmse_increase, max_r2_drop=args.max_r2_drop, holdout=args.holdout,
+        seed=args.seed, pieces=args.pieces or None,
+    )
+    keys = ("ville", "type_local", "budget_met", "alpha", "before", "after", "reduction")
+    summary = [{k: m[k] for k in keys} for m in metrics["models"]]
+    print(json.dumps({"version": metrics["version"], "seconds": metrics["seconds"], "models": summary}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Ventes comparables : les k transactions DVF les plus proches d'un bien.
+
+Un index par (ville, type_local) est construit depuis l'export DVF de la ville : surface
+bâtie, surface terrain et nombre de lots mis à l'échelle (moyenne / écart-type des ventes
+de l'index), dans un KD-tree (scipy cKDTree). Les attributs renvoyés sont stockés en types
+compacts (float32, int32, codes de section int16).
+
+L'index est enregistré dans le dossier du cache binaire du CSV (voir dataset.py) : il est
+rechargé au démarrage suivant, et reconstruit si le CSV a changé. Les recherches restreintes
+à un code postal et/ou une section utilisent un sous-index construit à la demande (ou un
+calcul direct des distances pour les petits groupes).
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .dataset import DatasetCache
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand le contenu de l'index change : les anciens fichiers sont reconstruits
+INDEX_FORMAT = 1
+
+FEATURE_COLUMNS = ["Surface reelle bati", "Surface terrain", "Nombre de lots"]
+INDEX_COLUMNS = FEATURE_COLUMNS + [
+    "Type local", "Valeur fonciere", "Date mutation", "Code postal", "Section", "No plan",
+    "Nombre pieces principales",
+]
+TYPES_LOCAL = ("Appartement", "Maison")
+
+# En dessous de cette taille, un groupe filtré est parcouru directement (sans sous-index)
+BRUTE_FORCE_MAX_ROWS = 256
+
+# Tableaux de l'index et leur type
+ARRAY_DTYPES = {
+    "points": np.float32,
+    "mean": np.float64,
+    "scale": np.float64,
+    "valeur_fonciere": np.float32,
+    "prix_m2": np.float32,
+    "surface_bati": np.float32,
+    "surface_terrain": np.float32,
+    "nombre_lots": np.int16,
+    "nombre_pieces": np.int16,
+    "date_mutation": "datetime64[D]",
+    "code_postal": np.int32,
+    "section": np.int16,
+}
+
+# Index d'une ville et d'un type de bien
+class ComparablesIndex:
+    def __init__(self, arrays: Dict[str, np.ndarray], sections: List[str], meta: Dict[str, Any]):
+        for name in ARRAY_DTYPES:
+            setattr(self, name, arrays[name])
+        self.sections = sections
+        self.meta = meta
+        self._section_codes = {section: code for code, section in enumerate(sections)}
+        self._tree = _build_tree(self.points)
+        # Sous-index par filtre (code postal, section), construits à la première recherche
+        self._groups: Dict[Tuple[Optional[int], Optional[int]], Tuple[np.ndarray, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @classmethod
+    def build(cls, df, type_local: str, **meta) -> "ComparablesIndex":
+        """Construit l'index depuis un export DVF (colonnes INDEX_COLUMNS)"""
+        data = df.loc[(df["Type local"] == type_local).to_numpy(), INDEX_COLUMNS]
+        data = data[(data["Surface reelle bati"] > 0) & data["Valeur fonciere"].notna()]
+        # Une mutation sur plusieurs lignes identiques (même parcelle, date, prix et surface) : une seule vente
+        data = data.drop_duplicates(["Date mutation", "Valeur fonciere", "Code postal", "Section", "No plan",
+                                     "Surface reelle bati"])
+        features = np.column_stack([
+            data["Surface reelle bati"].to_numpy(dtype=np.float64),
+            data["Surface terrain"].fillna(0).to_numpy(dtype=np.float64),
+            data["Nombre de lots"].fillna(0).to_numpy(dtype=np.float64),
+        ])
+        mean = features.mean(axis=0) if len(features) else np.zeros(len(FEATURE_COLUMNS))
+        scale = features.std(axis=0) if len(features) else np.ones(len(FEATURE_COLUMNS))
+        # Feature constante : pas de mise à l'échelle (comme StandardScaler)
+        scale[scale == 0] = 1.0
+
+        sections = data["Section"].astype("object").where(data["Section"].notna(), None)
+        section_names = sorted({str(section) for section in sections if section is not None})
+        section_codes = {section: code for code, section in enumerate(section_names)}
+        valeur = data["Valeur fonciere"].to_numpy(dtype=np.float64)
+        arrays = {
+            "points": (features - mean) / scale,
+            "mean": mean,
+            "scale": scale,
+            "valeur_fonciere": valeur,
+            "prix_m2": valeur / features[:, 0],
+            "surface_bati": features[:, 0],
+            "surface_terrain": features[:, 1],
+            "nombre_lots": features[:, 2],
+            "nombre_pieces": data["Nombre pieces principales"].fillna(-1).to_numpy(),
+            "date_mutation": data["Date mutation"].to_numpy(dtype="datetime64[D]"),
+            "code_postal": data["Code postal"].fillna(-1).to_numpy(),
+            "section": np.array([section_codes.get(section, -1) if section is not None else -1
+                                 for section in sections]),
+        }
+        arrays = {name: np.ascontiguousarray(array, dtype=ARRAY_DTYPES[name]) for name, array in arrays.items()}
+        return cls(arrays, section_names, {"type_local": type_local, "format": INDEX_FORMAT, **meta})
+
+    def save(self, path: Path) -> None:
+        # .npz non compressé, écrit dans un fichier temporaire puis renommé
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in ARRAY_DTYPES},
+                     meta=np.array(json.dumps({**self.meta, "sections": self.sections})))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ComparablesIndex":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {name: data[name] for name in ARRAY_DTYPES}
+        return cls(arrays, meta.pop("sections"), meta)
+
+    def _group(self, code_postal: Optional[int], section: Optional[str]):
+        # Lignes d'un filtre et leur sous-index (None si le groupe est petit)
+        section_code = None
+        if section is not None:
+            section_code = self._section_codes.get(section.upper())
+            if section_code is None:
+                return np.empty(0, dtype=np.intp), None
+        key = (code_postal, section_code)
+        group = self._groups.get(key)
+        if group is None:
+            mask = np.ones(len(self), dtype=bool)
+            if code_postal is not None:
+                mask &= self.code_postal == code_postal
+            if section_code is not None:
+                mask &= self.section == section_code
+            rows = np.flatnonzero(mask)
+            tree = _build_tree(self.points[rows]) if len(rows) > BRUTE_FORCE_MAX_ROWS else None
+            with self._lock:
+                group = self._groups.setdefault(key, (rows, tree))
+        return group
+
+    def query(self, X, k: int = 5, code_postal: Optional[int] = None,
+              section: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Les k ventes les plus proches de chaque ligne de X (features brutes, forme (n, 3)).
+
+        Retourne (distances, lignes) de forme (n, k') avec k' = min(k, ventes disponibles),
+        triées de la plus proche à la plus lointaine.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(FEATURE_COLUMNS):
+            raise ValueError(f"X doit avoir la forme (n, {len(FEATURE_COLUMNS)}), reçu {X.shape}")
+        # Même précision que les points de l'index : une vente identique est à distance 0
+        X_scaled = ((X - self.mean) / self.scale).astype(np.float32).astype(np.float64)
+        if code_postal is None and section is None:
+            rows, tree = None, self._tree
+            n_available = len(self)
+        else:
+            rows, tree = self._group(code_postal, section)
+            n_available = len(rows)
+        k = min(k, n_available)
+        if k == 0:
+            return np.empty((len(X), 0)), np.empty((len(X), 0), dtype=np.intp)
+        if tree is None:
+            # Petit groupe : distances calculées directement
+            diff = X_scaled[:, None, :] - self.points[rows][None, :, :].astype(np.float64)
+            distances = np.sqrt((diff ** 2).sum(axis=2))
+            order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            return np.take_along_axis(distances, order, axis=1), rows[order]
+        distances, found = tree.query(X_scaled, k=k)
+        distances, found = distances.reshape(len(X), k), found.reshape(len(X), k)
+        return distances, (found if rows is None else rows[found])
+
+    def describe(self, rows: np.ndarray, distances: np.ndarray) -> List[Dict[str, Any]]:
+        # Ventes d'une requête en dictionnaires (réponse de l'API)
+        return [
+            {
+                "date_mutation": str(self.date_mutation[row]) if not np.isnat(self.date_mutation[row]) else None,
+                "valeur_fonciere": round(float(self.valeur_fonciere[row]), 2),
+                "prix_m2": round(float(self.prix_m2[row]), 2),
+                "surface_bati": float(self.surface_bati[row]),
+                "surface_terrain": float(self.surface_terrain[row]),
+                "nombre_lots": int(self.nombre_lots[row]),
+                "nombre_pieces": int(self.nombre_pieces[row]) if self.nombre_pieces[row] >= 0 else None,
+                "code_postal": int(self.code_postal[row]) if self.code_postal[row] >= 0 else None,
+                "section": self.sections[self.section[row]] if self.section[row] >= 0 else None,
+                "distance": round(float(distance), 4),
+            }
+            for row, distance in zip(rows, distances)
+        ]
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAY_DTYPES)
+
+def _build_tree(points: np.ndarray):
+    from scipy.spatial import cKDTree
+    # compact_nodes : boîtes englobantes réduites aux points, recherches plus rapides
+    return cKDTree(points, leafsize=16, compact_nodes=True, balanced_tree=False)
+
+# Index de toutes les villes, chargés depuis leur fichier ou construits à la première demande
+class ComparablesService:
+    def __init__(self, datasets: Dict[str, Path], cache: Optional[DatasetCache] = None):
+        self.datasets = {ville.lower(): Path(path) for ville, path in datasets.items()}
+        self.cache = cache or DatasetCache()
+        self._indexes: Dict[Tuple[str, str], ComparablesIndex] = {}
+        self._lock = threading.Lock()
+
+    def index_path(self, ville: str, type_local: str) -> Optional[Path]:
+        # À côté du cache binaire du CSV : supprimé avec lui quand le CSV change
+        # (None si le cache n'est pas accessible en écriture : index gardé en mémoire seulement)
+        cache_path = self.cache.ensure(self.datasets[ville])
+        if cache_path is None:
+            return None
+        return cache_path / f"comparables-{type_local.lower()}.npz"
+
+    def get_index(self, ville: str, type_local: str) -> ComparablesIndex:
+        ville = ville.lower()
+        if ville not in self.datasets:
+            raise ValueError(f"Pas de données de ventes pour {ville}")
+        if type_local not in TYPES_LOCAL:
+            raise ValueError(f"Type de bien non reconnu: {type_local}")
+        index = self._indexes.get((ville, type_local))
+        if index is None:
+            with self._lock:
+                index = self._indexes.get((ville, type_local))
+                if index is None:
+                    index = self._indexes[(ville, type_local)] = self._load_or_build(ville, type_local)
+        return index
+
+    def _load_or_build(self, ville: str, type_local: str) -> ComparablesIndex:
+        source = self.datasets[ville]
+        path = self.index_path(ville, type_local)
+        sha256 = self.cache.sha256(source)
+        if path is not None and path.exists():
+            try:
+                index = ComparablesIndex.load(path)
+                if index.meta.get("format") == INDEX_FORMAT and index.meta.get("sha256") == sha256:
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Index des comparables illisible (%s), reconstruction : %s", path, e)
+        logger.info("Construction de l'index des comparables %s/%s", ville, type_local)
+        df = self.cache.load(source, INDEX_COLUMNS)
+        index = ComparablesIndex.build(df, type_local, ville=ville, sha256=sha256)
+        if path is not None:
+            try:
+                index.save(path)
+            except OSError as e:
+                logger.warning("Index des comparables non enregistré (%s) : %s", path, e)
+        return index
+
+    def load_all(self) -> None:
+        for ville in self.datasets:
+            for type_local in TYPES_LOCAL:
+                self.get_index(ville, type_local)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            indexes = dict(self._indexes)
+        return [
+            {"ville": ville, "type_local": type_local, "n_sales": len(index), "bytes": index.nbytes()}
+            for (ville, type_local), index in sorted(indexes.items())
+        ]
@@ -0,0 +1,91 @@
+import os
+
+# Paramètres de l'API lus depuis les variables d'environnement (voir .env.example)
+
+def env_bool(name: str, default: bool = False) -> bool:
+    # Lit un booléen ("1", "true", "yes", "on" => True)
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+# Micro-batching des prédictions unitaires (désactivé par défaut)
+MICROBATCH_ENABLED = env_bool("MICROBATCH_ENABLED", False)
+MICROBATCH_MAX_WAIT_MS = env_float("MICROBATCH_MAX_WAIT_MS", 2.0)
+MICROBATCH_MAX_SIZE = env_int("MICROBATCH_MAX_SIZE", 64)
+
+# Moteur d'inférence : "artifact" (artefacts compacts .forest, pickles à défaut), "sklearn"
+# (estimateurs d'origine), "native" (forêt compilée) ou "lookup" (table de prédiction exacte,
+# dans la limite de LOOKUP_TABLE_MAX_MB par modèle)
+PREDICT_ENGINE = os.getenv("PREDICT_ENGINE", "artifact").strip().lower()
+LOOKUP_TABLE_MAX_MB = env_float("LOOKUP_TABLE_MAX_MB", 64)
+
+# Sweeps (/predict/sweep) : nombre maximum de points de la grille, et prédiction par la table
+# de prédiction exacte du modèle (construite au démarrage) quel que soit le moteur
+SWEEP_MAX_POINTS = env_int("SWEEP_MAX_POINTS", 2000)
+SWEEP_USE_LOOKUP = env_bool("SWEEP_USE_LOOKUP", True)
+
+# Flux de prédiction (/predict/stream, NDJSON ou Arrow) : lignes lues, prédites et renvoyées par morceau
+STREAM_CHUNK_ROWS = env_int("STREAM_CHUNK_ROWS", 5000)
+
+# Cache des prédictions unitaires (taille 0 = désactivé, TTL 0 = pas d'expiration)
+PREDICTION_CACHE_SIZE = env_int("PREDICTION_CACHE_SIZE", 10000)
+PREDICTION_CACHE_TTL = env_float("PREDICTION_CACHE_TTL", 0)
+
+# Quantiles des prédictions par arbre renvoyés avec ?interval=true (surchargeables par ?quantiles=)
+PREDICTION_QUANTILES = os.getenv("PREDICTION_QUANTILES", "0.1,0.5,0.9")
+
+# Registre des modèles : nombre maximum de modèles en mémoire et intervalle de
+# surveillance des artefacts en secondes (0 = pas de rechargement à chaud)
+MODEL_MAX_RESIDENT = env_int("MODEL_MAX_RESIDENT", 8)
+MODEL_WATCH_INTERVAL = env_float("MODEL_WATCH_INTERVAL", 5)
+
+# Modèles servis depuis les artefacts compacts .forest (mmap) quand le manifeste en indique
+MODEL_USE_ARTIFACTS = env_bool("MODEL_USE_ARTIFACTS", True)
+
+# Chargement et warmup des modèles en arrière-plan au démarrage (sinon bloquant)
+STARTUP_BACKGROUND_WARMUP = env_bool("STARTUP_BACKGROUND_WARMUP", True)
+
+# Cache binaire des datasets CSV (vide = dossier .cache à côté de chaque CSV)
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", "")
+
+# Ventes comparables : villes indexées ("lille" -> data/lille_2022.csv, ou "lille=chemin.csv")
+COMPARABLES_VILLES = os.getenv("COMPARABLES_VILLES", "lille,bordeaux")
+
+# Statistiques de marché : villes et dossier de leurs exports DVF <ville>_*.csv (vide = data/)
+MARKET_STATS_VILLES = os.getenv("MARKET_STATS_VILLES", "lille,bordeaux")
+MARKET_STATS_DIR = os.getenv("MARKET_STATS_DIR", "")
+
+# Logs : niveau, format ("text" ou "json") et part des requêtes loggées (0 à 1)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+LOG_REQUEST_SAMPLE_RATE = env_float("LOG_REQUEST_SAMPLE_RATE", 1.0)
+
+# Exécution des prédictions : "thread" ou "process" (pool hors de la boucle asyncio)
+# ou "inline" (dans la boucle) ; 0 worker = un par CPU
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread").strip().lower()
+INFERENCE_WORKERS = env_int("INFERENCE_WORKERS", 0)
+
+# Contrôle d'admission : prédictions en cours max par modèle (au-delà : 429),
+# délai max d'une prédiction en ms (au-delà : 503, 0 = sans délai) et Retry-After en secondes
+INFERENCE_MAX_IN_FLIGHT = env_int("INFERENCE_MAX_IN_FLIGHT", 32)
+REQUEST_TIMEOUT_MS = env_float("REQUEST_TIMEOUT_MS", 5000)
+RETRY_AFTER_SECONDS = env_int("RETRY_AFTER_SECONDS", 1)
+
+# Lancement multi-workers (python -m app.server) : workers (0 = un par CPU), recyclage d'un worker
+# après N requêtes (+ aléa jusqu'à JITTER) ou au-delà de N Mo de mémoire privée (USS), 0 = jamais,
+# délai d'arrêt gracieux et intervalle du rapport mémoire dans les logs (s, 0 = aucun rapport)
+SERVER_WORKERS = env_int("SERVER_WORKERS", 0)
+SERVER_MAX_REQUESTS = env_int("SERVER_MAX_REQUESTS", 0)
+SERVER_MAX_REQUESTS_JITTER = env_int("SERVER_MAX_REQUESTS_JITTER", 0)
+SERVER_MAX_WORKER_USS_MB = env_float("SERVER_MAX_WORKER_USS_MB", 0)
+SERVER_GRACEFUL_TIMEOUT = env_float("SERVER_GRACEFUL_TIMEOUT", 30)
+SERVER_MEMORY_REPORT_INTERVAL = env_float("SERVER_MEMORY_REPORT_INTERVAL", 60)
@@ -0,0 +1,225 @@
+"""
+Cache binaire en colonnes des exports DVF (et des autres datasets CSV).
+
+Au premier chargement, le CSV est converti en un fichier .npy par colonne : colonnes
+numériques typées, colonnes texte en codes entiers + libellés dans meta.json, dates parsées.
+Les chargements suivants ouvrent les .npy en mémoire (mmap) sans relire le texte, et
+seulement pour les colonnes demandées. Type local et Commune sont rendues en catégories
+pandas, les autres colonnes texte avec le même type qu'avec pd.read_csv.
+
+Le cache est rangé à côté du CSV (<dossier>/.cache/<fichier>/), ou dans DATASET_CACHE_DIR.
+Il est identifié par le chemin, la taille, la date de modification et l'empreinte SHA-256
+du fichier source : un CSV modifié est reconverti, un CSV seulement « touché » (même contenu)
+réutilise le cache. Si le dossier du cache n'est pas accessible en écriture (montage en
+lecture seule, image de conteneur), le CSV est lu directement.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+from . import config
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand la conversion change : les anciens caches sont reconstruits
+CACHE_FORMAT = 2
+META_NAME = "meta.json"
+
+# Colonnes de dates des exports DVF (format jour/mois/année)
+DATE_COLUMNS = {"Date mutation": "%d/%m/%Y"}
+# Colonnes texte rendues en catégories pandas (les autres colonnes texte restent des objets)
+CATEGORY_COLUMNS = ("Type local", "Commune")
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Cache des datasets convertis, un dossier par fichier source
+class DatasetCache:
+    def __init__(self, cache_dir: Optional[Path] = None):
+        cache_dir = cache_dir if cache_dir is not None else config.DATASET_CACHE_DIR
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def cache_path(self, source: Path) -> Path:
+        source = Path(source).resolve()
+        if self.cache_dir is None:
+            return source.parent / ".cache" / source.name
+        # Dossier commun : le nom inclut une empreinte du chemin pour éviter les collisions
+        path_hash = hashlib.sha1(str(source).encode()).hexdigest()[:16]
+        return self.cache_dir / f"{source.stem}-{path_hash}"
+
+    def _read_meta(self, cache_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(cache_path / META_NAME, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_fresh(self, source: Path, cache_path: Path, meta: Optional[Dict[str, Any]]) -> bool:
+        if meta is None or meta.get("format") != CACHE_FORMAT or meta.get("source") != str(source):
+            return False
+        stat = source.stat()
+        if meta["size"] != stat.st_size:
+            return False
+        if meta["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        # Date changée mais même taille : on compare le contenu avant de reconvertir
+        if file_sha256(source) != meta["sha256"]:
+            return False
+        meta["mtime_ns"] = stat.st_mtime_ns
+        try:
+            self._write_meta(cache_path, meta)
+        except OSError:
+            # Cache en lecture seule : toujours valide, la date sera comparée au prochain chargement
+            pass
+        return True
+
+    def _write_meta(self, directory: Path, meta: Dict[str, Any]) -> None:
+        tmp_path = directory / f"{META_NAME}.tmp"
+        tmp_path.write_text(json.dumps(meta, ensure_ascii=False))
+        os.replace(tmp_path, directory / META_NAME)
+
+    def ensure(self, source: Path) -> Optional[Path]:
+        """Retourne le dossier du cache à jour pour ce fichier, en le construisant si besoin
+        (None si le cache ne peut pas être écrit)"""
+        source = Path(source).resolve()
+        cache_path = self.cache_path(source)
+        with self._lock:
+            if self._is_fresh(source, cache_path, self._read_meta(cache_path)):
+                self.hits += 1
+                return cache_path
+            self.misses += 1
+            try:
+                self._build(source, cache_path)
+            except OSError as e:
+                # Dossier en lecture seule, disque plein... : le CSV reste lisible sans cache
+                # (fichier source absent : la lecture directe lève l'erreur habituelle)
+                if source.exists():
+                    logger.warning("Cache binaire indisponible pour %s (%s) : lecture directe du CSV", source, e)
+                return None
+        return cache_path
+
+    def _build(self, source: Path, cache_path: Path) -> None:
+        import pandas as pd
+        logger.info("Conversion de %s dans le cache binaire %s", source, cache_path)
+        # Construction dans un dossier temporaire puis renommage : un lecteur concurrent
+        # voit soit l'ancien cache, soit le nouveau, jamais un cache partiel.
+        # Dossier créé avant la lecture du CSV : un cache impossible à écrire est détecté sans le parser
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{cache_path.name}-", dir=cache_path.parent))
+        try:
+            stat = source.stat()
+            sha256 = file_sha256(source)
+            df = pd.read_csv(source, low_memory=False)
+            columns = []
+            for i, name in enumerate(df.columns):
+                array, info = _encode_column(df[name])
+                np.save(tmp_dir / f"{i}.npy", array, allow_pickle=False)
+                columns.append({"name": name, "file": f"{i}.npy", **info})
+            self._write_meta(tmp_dir, {
+                "format": CACHE_FORMAT,
+                "source": str(source),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+                "n_rows": len(df),
+                "columns": columns,
+            })
+            if cache_path.exists():
+                shutil.rmtree(cache_path)
+            os.rename(tmp_dir, cache_path)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def load(self, source: Path, columns: Optional[List[str]] = None) -> "pd.DataFrame":
+        """Charge le dataset depuis le cache (colonnes ouvertes en mmap)"""
+        import pandas as pd
+        cache_path = self.ensure(source)
+        if cache_path is None:
+            return read_csv_columns(source, columns)
+        meta = self._read_meta(cache_path)
+        available = {column["name"]: column for column in meta["columns"]}
+        if columns is None:
+            columns = list(available)
+        missing = [name for name in columns if name not in available]
+        if missing:
+            raise ValueError(f"Colonnes absentes de {source} : {missing}")
+        data = {
+            name: _decode_column(np.load(cache_path / available[name]["file"], mmap_mode="r"), available[name])
+            for name in columns
+        }
+        return pd.DataFrame(data, index=pd.RangeIndex(meta["n_rows"]), copy=False)
+
+    def sha256(self, source: Path) -> str:
+        # Empreinte du fichier source, lue dans le cache quand il est à jour
+        cache_path = self.ensure(source)
+        if cache_path is None:
+            return file_sha256(Path(source))
+        return self._read_meta(cache_path)["sha256"]
+
+def _encode_column(series: "pd.Series"):
+    import pandas as pd
+    if series.name in DATE_COLUMNS:
+        dates = pd.to_datetime(series, format=DATE_COLUMNS[series.name], errors="coerce")
+        return dates.to_numpy(dtype="datetime64[ns]"), {"kind": "datetime"}
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(), {"kind": "numeric"}
+    # Texte : codes entiers (-1 = valeur manquante) et libellés dans meta.json
+    categorical = pd.Categorical(series.astype("object").where(series.notna(), None))
+    categories = [str(value) for value in categorical.categories]
+    kind = "category" if series.name in CATEGORY_COLUMNS else "text"
+    return np.asarray(categorical.codes), {"kind": kind, "categories": categories}
+
+def _decode_column(array: np.ndarray, info: Dict[str, Any]):
+    import pandas as pd
+    if info["kind"] == "category":
+        return pd.Categorical.from_codes(array, categories=info["categories"])
+    if info["kind"] == "text":
+        # Mêmes valeurs que pd.read_csv (NaN pour les valeurs manquantes), le type texte est
+        # celui que pandas infère à la construction du DataFrame
+        labels = np.array(info["categories"] + [np.nan], dtype=object)
+        return labels[array]
+    return array
+
+# Lecture directe du CSV (cache indisponible), avec les mêmes types que le cache
+def read_csv_columns(source: Path, columns: Optional[List[str]] = None) -> "pd.DataFrame":
+    import pandas as pd
+    df = pd.read_csv(source, usecols=columns, low_memory=False)
+    if columns is not None:
+        df = df[columns]
+    for name in df.columns:
+        if name in DATE_COLUMNS:
+            df[name] = pd.to_datetime(df[name], format=DATE_COLUMNS[name], errors="coerce").astype("datetime64[ns]")
+        elif name in CATEGORY_COLUMNS:
+            df[name] = df[name].astype("category")
+    return df
+
+# Cache par défaut (dossier .cache à côté des CSV, ou DATASET_CACHE_DIR)
+_default_cache: Optional[DatasetCache] = None
+
+def load_dataset(source: Path, columns: Optional[List[str]] = None,
+                 cache: Optional[DatasetCache] = None) -> "pd.DataFrame":
+    global _default_cache
+    if cache is None:
+        if _default_cache is None:
+            _default_cache = DatasetCache()
+        cache = _default_cache
+    return cache.load(source, columns)
@@ -0,0 +1,239 @@
+"""
+Mise à jour incrémentale des modèles avec un nouveau mois DVF, sans réentraînement complet.
+
+Usage : python -m app.incremental --new dvf_lille_2023_01.csv --ville lille --version 2023-01 [--activate]
+
+Pour chaque type de bien :
+- les scalers du modèle actif sont mis à jour avec les nouvelles transactions (partial_fit) ;
+- les arbres existants sont réexprimés dans l'échelle des nouveaux scalers (seuils et
+  valeurs des feuilles recalculés), ils prédisent donc les mêmes prix qu'avant ;
+- de nouveaux arbres, avec les hyperparamètres du modèle actif, sont entraînés sur les
+  nouvelles données (et les mois récents passés avec --recent) puis ajoutés à la forêt ;
+  seuls les --max-old-trees arbres anciens les plus récents sont conservés.
+
+Une partie des nouvelles transactions est mise de côté pour comparer le modèle mis à jour
+au modèle actif et à un réentraînement complet (mêmes hyperparamètres, sans GridSearchCV,
+sur --history et les nouvelles données). La nouvelle version est écrite comme par app.training.
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .models.forest import TREE_LEAF, _scaler_params, fold_thresholds
+from .logging_setup import setup_logging
+from .models.artifact import save_model_files
+from .models.model_loader import ModelLoader
+from .training import MODELS_PATH, TYPES_LOCAL, load_training_data, prepare_dataset, regression_metrics, update_manifest
+
+# Précision des features DVF (surfaces et nombre de lots au centième au plus)
+FEATURE_DECIMALS = 2
+
+# Hyperparamètres des arbres repris du modèle actif
+TREE_PARAMS = ("max_depth", "min_samples_split", "min_samples_leaf", "max_features")
+
+def refold_tree(tree, scaler_x_old, scaler_x_new, scaler_y_old, scaler_y_new):
+    """
+    Réexprime un arbre entraîné avec les anciens scalers dans l'échelle des nouveaux.
+
+    Les seuils sont d'abord ramenés sur les features brutes (mêmes frontières que sklearn,
+    voir fold_thresholds), puis remis à l'échelle des nouveaux scalers. Les features DVF ayant
+    au plus deux décimales, leurs branches sont conservées à l'identique. Les valeurs des
+    nœuds suivent la nouvelle échelle du prix au m².
+    """
+    tree = copy.deepcopy(tree)
+    n_features = tree.n_features_in_
+    x_mean_old, x_scale_old = _scaler_params(scaler_x_old, n_features)
+    x_mean_new, x_scale_new = _scaler_params(scaler_x_new, n_features)
+    y_mean_old, y_scale_old = _scaler_params(scaler_y_old, 1)
+    y_mean_new, y_scale_new = _scaler_params(scaler_y_new, 1)
+
+    state = tree.tree_.__getstate__()
+    nodes = state["nodes"].copy()
+    internal = nodes["left_child"] != TREE_LEAF
+    feature = nodes["feature"][internal]
+    raw = fold_thresholds(nodes["threshold"][internal], x_mean_old[feature], x_scale_old[feature])
+    # Après le passage en float32, les valeurs très proches de la frontière tombent dans le
+    # même flottant : on garde du bon côté la valeur au centième la plus proche du seuil
+    nearest = np.round(raw, FEATURE_DECIMALS)
+    scaled = ((nearest - x_mean_new[feature]) / x_scale_new[feature]).astype(np.float32)
+    scaled = np.where(nearest <= raw, scaled, np.nextafter(scaled, np.float32(-np.inf)))
+    nodes["threshold"][internal] = scaled.astype(np.float64)
+
+    ratio = y_scale_old[0] / y_scale_new[0]
+    state["values"] = state["values"] * ratio + (y_mean_old[0] - y_mean_new[0]) / y_scale_new[0]
+    nodes["impurity"] = nodes["impurity"] * ratio ** 2
+    state["nodes"] = nodes
+    tree.tree_.__setstate__(state)
+    return tree
+
+def tree_params(model) -> Dict[str, Any]:
+    # Hyperparamètres des arbres du modèle actif (forêt ou arbre seul)
+    params = model.get_params()
+    return {name: params[name] for name in TREE_PARAMS if name in params}
+
+def predict_raw(model, scaler_x, scaler_y, X) -> np.ndarray:
+    return scaler_y.inverse_transform(model.predict(scaler_x.transform(X)).reshape(-1, 1))[:, 0]
+
+def update_model(model, scaler_x, scaler_y, X_new, y_new, new_trees: int = 50,
+                 max_old_trees: Optional[int] = 200, seed: int = 42):
+    """Retourne (forêt, scaler_x, scaler_y) mis à jour avec les nouvelles données"""
+    from sklearn.ensemble import RandomForestRegressor
+
+    # Statistiques cumulées des scalers : moyenne et variance sur ancien + nouveau
+    scaler_x_new = copy.deepcopy(scaler_x).partial_fit(X_new)
+    scaler_y_new = copy.deepcopy(scaler_y).partial_fit(np.asarray(y_new, dtype=np.float64).reshape(-1, 1))
+
+    old_trees = list(getattr(model, "estimators_", [model]))
+    if max_old_trees is not None:
+        # Les arbres sont rangés du plus ancien au plus récent : on garde les derniers
+        old_trees = old_trees[-max_old_trees:] if max_old_trees > 0 else []
+    old_trees = [refold_tree(tree, scaler_x, scaler_x_new, scaler_y, scaler_y_new) for tree in old_trees]
+
+    forest = RandomForestRegressor(n_estimators=new_trees, random_state=seed, **tree_params(model))
+    forest.fit(
+        scaler_x_new.transform(X_new),
+        scaler_y_new.transform(np.asarray(y_new, dtype=np.float64).reshape(-1, 1)).ravel(),
+    )
+    forest.estimators_ = old_trees + forest.estimators_
+    forest.n_estimators = len(forest.estimators_)
+    return forest, scaler_x_new, scaler_y_new
+
+def full_retrain(model, X, y, seed: int = 42):
+    # Réentraînement complet de référence : mêmes hyperparamètres, sans recherche de grille
+    from sklearn.base import clone
+    from sklearn.preprocessing import StandardScaler
+    scaler_x = StandardScaler().fit(X)
+    scaler_y = StandardScaler().fit(np.asarray(y, dtype=np.float64).reshape(-1, 1))
+    estimator = clone(model).set_params(random_state=seed)
+    estimator.fit(scaler_x.transform(X), scaler_y.transform(np.asarray(y, dtype=np.float64).reshape(-1, 1)).ravel())
+    return estimator, scaler_x, scaler_y
+
+def _load_prepared(paths: List[Path], type_local: str, pieces: Optional[int], X_empty, y_empty):
+    # Concatène les données préparées de plusieurs exports (jeu vide si aucun fichier)
+    import pandas as pd
+    parts = [prepare_dataset(load_training_data(path), type_local, pieces) for path in paths]
+    if not parts:
+        return X_empty, y_empty
+    return pd.concat([X for X, _ in parts]), pd.concat([y for _, y in parts])
+
+def update_combination(model_loader: ModelLoader, ville: str, type_local: str, new_path: Path, version: str,
+                       recent: List[Path] = (), history: Optional[List[Path]] = None, new_trees: int = 50,
+                       max_old_trees: Optional[int] = 200, holdout: float = 0.2, seed: int = 42,
+                       pieces: Optional[int] = 4, compare: bool = True) -> Dict[str, Any]:
+    """Met à jour le modèle actif d'une ville et d'un type de bien et écrit ses artefacts"""
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+
+    entry = model_loader.resolve(type_local, ville)
+    model, scaler_x, scaler_y, _ = model_loader.get_model_and_scalers(type_local, ville, entry.version)
+
+    X_new, y_new = prepare_dataset(load_training_data(new_path), type_local, pieces)
+    X_train, X_test, y_train, y_test = train_test_split(X_new, y_new, test_size=holdout, random_state=seed)
+    X_recent, y_recent = _load_prepared(list(recent), type_local, pieces, X_train[:0], y_train[:0])
+
+    started = time.perf_counter()
+    updated, scaler_x_new, scaler_y_new = update_model(
+        model, scaler_x, scaler_y, pd.concat([X_recent, X_train]), pd.concat([y_recent, y_train]),
+        new_trees, max_old_trees, seed,
+    )
+    update_seconds = time.perf_counter() - started
+
+    report = {
+        "ville": ville,
+        "type_local": type_local,
+        "version": version,
+        "base_version": entry.version,
+        "n_new": int(len(X_train)),
+        "n_recent": int(len(X_recent)),
+        "n_holdout": int(len(X_test)),
+        "n_trees": len(updated.estimators_),
+        "n_old_trees": len(updated.estimators_) - new_trees,
+        "update_seconds": update_seconds,
+        "base": regression_metrics(y_test.to_numpy(), predict_raw(model, scaler_x, scaler_y, X_test)),
+        "incremental": regression_metrics(
+            y_test.to_numpy(), predict_raw(updated, scaler_x_new, scaler_y_new, X_test)
+        ),
+    }
+    if compare:
+        history = list(history if history is not None else recent)
+        X_hist, y_hist = _load_prepared(history, type_local, pieces, X_train[:0], y_train[:0])
+        started = time.perf_counter()
+        retrained = full_retrain(model, pd.concat([X_hist, X_train]), pd.concat([y_hist, y_train]), seed)
+        report["full_retrain_seconds"] = time.perf_counter() - started
+        report["full_retrain"] = regression_metrics(y_test.to_numpy(), predict_raw(*retrained, X_test))
+        report["delta_vs_full_retrain"] = {
+            metric: report["incremental"][metric] - report["full_retrain"][metric] for metric in ("rmse", "r2")
+        }
+
+    report["files"] = save_model_files(
+        model_loader.models_path, version, ville, type_local, updated, scaler_x_new, scaler_y_new
+    )
+    return report
+
+def update_all(new_path: Path, villes: List[str], version: str, models_path: Path = MODELS_PATH,
+               types_local=TYPES_LOCAL, activate: bool = False, **kwargs) -> Dict[str, Any]:
+    """Met à jour tous les (ville, type_local) demandés et écrit le metrics.json de la version"""
+    started = time.perf_counter()
+    version_dir = Path(models_path) / version
+    if version_dir.exists() and any(version_dir.iterdir()):
+        raise ValueError(f"La version {version} existe déjà : {version_dir}")
+    version_dir.mkdir(parents=True, exist_ok=True)
+
+    model_loader = ModelLoader(models_path=models_path)
+    results = [
+        update_combination(model_loader, ville.lower(), type_local, new_path, version, **kwargs)
+        for ville in villes for type_local in types_local
+    ]
+    metrics = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "mode": "incremental",
+        "new_data": str(new_path),
+        "seconds": time.perf_counter() - started,
+        "models": results,
+    }
+    (version_dir / "metrics.json").write_text(json.dumps(metrics, indent=2, ensure_ascii=False))
+    update_manifest(Path(models_path), results, activate)
+    return metrics
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mise à jour incrémentale des modèles avec un nouveau mois DVF")
+    parser.add_argument("--new", type=Path, required=True, help="CSV DVF des nouvelles transactions")
+    parser.add_argument("--ville", nargs="+", required=True, help="Ville(s) des nouvelles transactions")
+    parser.add_argument("--type-local", nargs="+", choices=TYPES_LOCAL, default=list(TYPES_LOCAL))
+    parser.add_argument("--recent", type=Path, nargs="*", default=[],
+                        help="Mois récents ajoutés aux données des nouveaux arbres")
+    parser.add_argument("--history", type=Path, nargs="*",
+                        help="Historique complet pour la comparaison (défaut : --recent)")
+    parser.add_argument("--version", default=datetime.now().strftime("%Y%m%d-%H%M%S"), help="Nom de la version")
+    parser.add_argument("--new-trees", type=int, default=50, help="Nombre d'arbres ajoutés")
+    parser.add_argument("--max-old-trees", type=int, default=200, help="Nombre maximum d'arbres anciens conservés")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Part des nouvelles données gardée pour l'évaluation")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    parser.add_argument("--pieces", type=int, default=4, help="Nombre de pièces retenu (0 = tous)")
+    parser.add_argument("--no-compare", action="store_true", help="Ne pas comparer à un réentraînement complet")
+    parser.add_argument("--models-path", type=Path, default=MODELS_PATH, help="Dossier des modèles")
+    parser.add_argument("--activate", action="store_true", help="Active la nouvelle version dans le manifeste")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    metrics = update_all(
+        args.new, args.ville, args.version, args.models_path, tuple(args.type_local), args.activate,
+        recent=args.recent, history=args.history, new_trees=args.new_trees, max_old_trees=args.max_old_trees,
+        holdout=args.holdout, seed=args.seed, pieces=args.pieces or None, compare=not args.no_compare,
+    )
+    keys = ("ville", "type_local", "n_trees", "update_seconds", "base", "incremental",
+            "full_retrain", "delta_vs_full_retrain")
+    summary = [{k: m[k] for k in keys if k in m} for m in metrics["models"]]
+    print(json.dumps({"version": metrics["version"], "seconds": metrics["seconds"], "models": summary}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
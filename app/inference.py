@@ -0,0 +1,204 @@
+"""
+Exécution des prédictions hors de la boucle asyncio, avec contrôle d'admission.
+
+Les calculs sklearn sont synchrones : exécutés directement dans un handler async, ils
+bloquent toutes les autres connexions du worker. InferenceExecutor les envoie dans un
+pool de threads ou de processus (INFERENCE_EXECUTOR), limite le nombre de prédictions
+en cours par modèle (INFERENCE_MAX_IN_FLIGHT) et borne l'attente de chaque requête
+(REQUEST_TIMEOUT_MS). Au-delà, la requête est rejetée tout de suite (429) ou expire
+(503), avec un en-tête Retry-After, au lieu de s'ajouter à une file sans fin.
+Les traitements de longue durée (flux) réservent une place puis s'exécutent dans un pool de
+threads dédié, borné lui aussi par INFERENCE_MAX_IN_FLIGHT.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+
+# Requête refusée par le contrôle d'admission (code HTTP et délai avant de réessayer)
+class InferenceRejected(Exception):
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Trop de prédictions en cours pour ce modèle : rejet immédiat
+class Overloaded(InferenceRejected):
+    status_code = 429
+
+# Délai de la requête dépassé avant la fin de la prédiction
+class DeadlineExceeded(InferenceRejected):
+    status_code = 503
+
+class InferenceExecutor:
+    def __init__(
+        self,
+        kind: str = "thread",
+        workers: int = 0,
+        max_in_flight: int = 32,
+        timeout_seconds: Optional[float] = None,
+        retry_after: float = 1.0,
+        initializer: Optional[Callable[[], None]] = None
+    ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Exécuteur inconnu : {kind} (valeurs acceptées : {', '.join(EXECUTOR_KINDS)})")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight doit être supérieur ou égal à 1")
+        if timeout_seconds is not None and timeout_seconds <= 0:
+            raise ValueError("Le délai des requêtes doit être positif")
+        self.kind = kind
+        # 0 = un worker par CPU
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout_seconds
+        self.retry_after = retry_after
+        self.initializer = initializer
+        self.rejected = 0
+        self.timeouts = 0
+        self.completed = 0
+        self._in_flight: Dict[Hashable, int] = defaultdict(int)
+        # Compteurs modifiés depuis la boucle (admission) et depuis les workers (fin du calcul)
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        # Pool des traitements de longue durée (flux), créé au premier usage
+        self._stream_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        """Pool sous-jacent, créé au premier usage (None en mode inline)"""
+        if self.kind == "inline":
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self) -> Executor:
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        # spawn plutôt que fork : le processus parent a déjà des threads (logs, surveillance des modèles)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer
+        )
+
+    def submit(self, fn: Callable[..., Any], *args):
+        """Interface concurrent.futures (run_in_executor, micro-batcher), sans contrôle d'admission"""
+        return self.executor.submit(fn, *args)
+
+    def _acquire(self, key: Hashable) -> None:
+        with self._lock:
+            if self._in_flight[key] >= self.max_in_flight:
+                self.rejected += 1
+                raise Overloaded(f"Trop de prédictions en cours pour {key}, réessayez plus tard", self.retry_after)
+            self._in_flight[key] += 1
+
+    def _release(self, key: Hashable, *_) -> None:
+        with self._lock:
+            self._in_flight[key] -= 1
+            self.completed += 1
+
+    def reserve(self, key: Hashable) -> Callable[..., Future]:
+        """Réserve une place sous la limite du modèle key pour un traitement de longue durée (flux),
+        sans délai ; retourne submit(fn, *args), qui l'exécute dans le pool des flux et libère la
+        place à sa fin"""
+        self._acquire(key)
+        return partial(self._submit_reserved, key)
+
+    def _submit_reserved(self, key: Hashable, fn: Callable[..., Any], *args) -> Future:
+        try:
+            if self._stream_executor is None:
+                with self._lock:
+                    if self._stream_executor is None:
+                        # Une place réservée = au plus un thread : aucun flux n'attend dans la file
+                        self._stream_executor = ThreadPoolExecutor(
+                            max_workers=self.max_in_flight, thread_name_prefix="inference-stream"
+                        )
+            future = self._stream_executor.submit(fn, *args)
+        except BaseException:
+            self._release(key)
+            raise
+        future.add_done_callback(partial(self._release, key))
+        return future
+
+    async def run(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """Exécute fn(*args) dans le pool, sous la limite de prédictions en cours du modèle key"""
+        self._acquire(key)
+        if self.kind == "inline":
+            # Pas de délai possible : le calcul s'exécute dans la boucle
+            try:
+                return fn(*args)
+            finally:
+                self._release(key)
+        try:
+            future = self.submit(fn, *args)
+        except BaseException:
+            self._release(key)
+            raise
+        # La place n'est libérée qu'à la fin réelle du calcul, même après un timeout :
+        # la limite borne bien le travail en cours dans le pool
+        future.add_done_callback(partial(self._release, key))
+        return await self._wait(asyncio.wrap_future(future))
+
+    async def run_awaitable(self, key: Hashable, awaitable: Awaitable[Any]) -> Any:
+        """Attend awaitable (ex : micro-batcher) sous la limite et le délai du modèle key"""
+        try:
+            self._acquire(key)
+        except Overloaded:
+            # La coroutine ne sera jamais attendue : on la ferme pour éviter l'avertissement
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await self._wait(awaitable)
+        finally:
+            self._release(key)
+
+    async def _wait(self, awaitable: Awaitable[Any]) -> Any:
+        if self.timeout is None:
+            return await awaitable
+        try:
+            # Le timeout annule le calcul s'il attend encore dans la file du pool
+            return await asyncio.wait_for(awaitable, self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise DeadlineExceeded(
+                f"Prédiction non terminée après {self.timeout * 1000:.0f} ms", self.retry_after
+            ) from None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = {"/".join(map(str, key)) if isinstance(key, tuple) else str(key): count
+                         for key, count in self._in_flight.items() if count}
+            return {
+                "executor": self.kind,
+                "workers": self.workers if self.kind != "inline" else 0,
+                "max_in_flight": self.max_in_flight,
+                "timeout_ms": self.timeout * 1000 if self.timeout is not None else None,
+                "in_flight": in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Arrête le pool (les calculs en file sont annulés) ; il sera recréé au prochain usage"""
+        with self._lock:
+            executors = [self._executor, self._stream_executor]
+            self._executor = self._stream_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
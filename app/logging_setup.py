@@ -0,0 +1,134 @@
+"""
+Logs de l'application : file d'attente et écriture en arrière-plan.
+
+Les handlers de l'application ne font qu'ajouter l'enregistrement dans une file
+(QueueHandler) ; le formatage (texte ou JSON) et l'écriture sont faits par le thread
+du QueueListener, hors de la boucle asyncio. Les logs de requêtes sont échantillonnés
+(LOG_REQUEST_SAMPLE_RATE), les erreurs serveur sont toujours écrites.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from . import config
+
+# Logger des requêtes HTTP (une ligne par requête échantillonnée)
+access_logger = logging.getLogger("app.access")
+
+# Attributs standard d'un LogRecord : tout le reste vient de extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+# Une ligne JSON par enregistrement, avec les champs passés dans extra
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# QueueHandler sans formatage dans le thread appelant : le message (msg % args)
+# n'est construit que par le listener, et seulement si l'enregistrement est écrit
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+# Décide, sans formater ni créer d'enregistrement, si une requête est loggée
+class RequestLogSampler:
+    def __init__(self, rate: float = 1.0):
+        if not 0 <= rate <= 1:
+            raise ValueError("Le taux d'échantillonnage doit être compris entre 0 et 1")
+        self.rate = rate
+        self._random = random.random
+
+    def should_log(self, status_code: int) -> bool:
+        if status_code >= 500:
+            return True
+        return self.rate >= 1 or (self.rate > 0 and self._random() < self.rate)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[LazyQueueHandler] = None
+_setup_lock = threading.Lock()
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None) -> None:
+    """Installe la file d'attente sur le logger racine et démarre l'écriture en arrière-plan"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        level = (level or config.LOG_LEVEL).upper()
+        fmt = (fmt or config.LOG_FORMAT).lower()
+        if fmt not in ("text", "json"):
+            raise ValueError(f"Format de log inconnu : {fmt} (valeurs acceptées : text, json)")
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(
+            JsonFormatter() if fmt == "json"
+            else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+        log_queue = queue.SimpleQueue()
+        _queue_handler = LazyQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(_queue_handler)
+        _listener.start()
+
+def shutdown_logging() -> None:
+    """Écrit les enregistrements en attente et arrête le thread d'écriture"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
+
+atexit.register(shutdown_logging)
+
+# Middleware ASGI : une ligne par requête échantillonnée (méthode, chemin, statut, durée)
+# Remplace les deux logs INFO synchrones par requête de l'ancien middleware
+class AccessLogMiddleware:
+    def __init__(self, app, sampler: Optional[RequestLogSampler] = None):
+        self.app = app
+        self.sampler = sampler or RequestLogSampler(config.LOG_REQUEST_SAMPLE_RATE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self.sampler.should_log(status[0]) and access_logger.isEnabledFor(logging.INFO):
+                duration_ms = (time.perf_counter() - started) * 1000
+                access_logger.info(
+                    "%s %s %s %.2fms", scope["method"], scope["path"], status[0], duration_ms,
+                    extra={"method": scope["method"], "path": scope["path"], "status": status[0],
+                           "duration_ms": round(duration_ms, 3)},
+                )
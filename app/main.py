@@ -1,14 +1,64 @@
+import time
+
+# Début de l'import de l'application (mesure du temps de démarrage)
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+import math
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import predict
-import logging
+from fastapi.responses import JSONResponse, PlainTextResponse
+from . import config
+from .inference import InferenceRejected
+from .logging_setup import AccessLogMiddleware, setup_logging, shutdown_logging
+from .memory import memory_report
+from .metrics import LatencyMiddleware, latency_metrics
+from .routes import comparables, predict, stats
 
-# Configuration du logger
-logging.basicConfig(level=logging.INFO)
+# Logger du module (handlers installés par setup_logging au démarrage)
 logger = logging.getLogger(__name__)
 
+# Mesures du démarrage, exposées par /health/ready
+startup_metrics = {
+    "import_seconds": None,
+    "startup_seconds": None,
+}
+
+# Chargement des modèles et warmup au démarrage plutôt qu'à l'import
+# En arrière-plan (par défaut), le serveur répond à /health/live pendant le chargement
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    lifespan_started = time.perf_counter()
+    startup_metrics["import_seconds"] = lifespan_started - _import_started
+
+    async def run_startup():
+        await asyncio.to_thread(predict.startup)
+        await asyncio.to_thread(comparables.startup)
+        await asyncio.to_thread(stats.startup)
+        # Prêt une fois les modèles, les index des comparables et les statistiques chargés
+        predict.service_state["ready"] = True
+        startup_metrics["startup_seconds"] = time.perf_counter() - _import_started
+        logger.info("Startup time: %.3fs", startup_metrics["startup_seconds"])
+
+    if config.STARTUP_BACKGROUND_WARMUP:
+        startup_task = asyncio.create_task(run_startup())
+    else:
+        await run_startup()
+        startup_task = None
+    yield
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    await predict.shutdown()
+    shutdown_logging()
+
 # Création de l'application FastAPI
 app = FastAPI(
+    lifespan=lifespan,
     title="API Prédiction Prix Immobilier",
     description="API de prédiction des prix au m² pour les logements de 4 pièces",
     version="1.0.0",
@@ -16,14 +66,6 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
-# Middleware pour logguer chaque requête HTTP
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request path: {request.url.path}")
-    response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
-    return response
-
 # Autoriser toutes les origines (CORS)
 app.add_middleware(
     CORSMiddleware,
@@ -33,13 +75,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Log des requêtes HTTP, échantillonné et écrit en arrière-plan (LOG_REQUEST_SAMPLE_RATE)
+app.add_middleware(AccessLogMiddleware)
+
+# Mesure du parsing, de la sérialisation et de la durée totale des prédictions (/metrics)
+app.add_middleware(LatencyMiddleware)
+
+# Requêtes rejetées par le contrôle d'admission : 429 (surcharge) ou 503 (délai dépassé)
+# L'en-tête Retry-After indique au client quand réessayer
+@app.exception_handler(InferenceRejected)
+async def inference_rejected_handler(request: Request, exc: InferenceRejected):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+# Erreurs de validation (422) : les nombres non finis reçus (Infinity, NaN) sont renvoyés en texte,
+# le JSON de la réponse ne peut pas les contenir
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    def finite_or_text(value: float):
+        return value if math.isfinite(value) else str(value)
+
+    return JSONResponse(
+        {"detail": jsonable_encoder(exc.errors(), custom_encoder={float: finite_or_text})},
+        status_code=422
+    )
+
 # Inclusion des routes de prédiction
 app.include_router(predict.router, prefix="", tags=["predictions"])
 
+# Inclusion de la route des ventes comparables
+app.include_router(comparables.router, prefix="", tags=["comparables"])
+
+# Inclusion des routes des statistiques de marché
+app.include_router(stats.router, prefix="", tags=["stats"])
+
 # Route racine pour vérifier que l'API fonctionne
 @app.get("/", tags=["default"])
 async def root():
     return {
         "message": "Bienvenue sur l'API de prédiction immobilière",
         "documentation": "/docs"
-    }
\ No newline at end of file
+    }
+
+# Sonde de vivacité : le processus répond
+@app.get("/health/live", tags=["health"])
+async def health_live():
+    return {"status": "alive"}
+
+# Sonde de disponibilité : modèles chargés et préchauffés
+@app.get("/health/ready", tags=["health"])
+async def health_ready():
+    state = predict.service_state
+    body = {
+        "status": "ready" if state["ready"] else "starting",
+        "error": state["error"],
+        "load_seconds": state["load_seconds"],
+        "warmup_seconds": state["warmup_seconds"],
+        **startup_metrics
+    }
+    if state["error"] is not None:
+        body["status"] = "error"
+    return JSONResponse(body, status_code=200 if state["ready"] else 503)
+
+# Latences par étape au format Prometheus
+@app.get("/metrics", tags=["metrics"], response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(
+        latency_metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# Résumé lisible des latences : p50/p99 par étape, ville, type de bien et version
+@app.get("/metrics/latency", tags=["metrics"])
+async def latency_summary():
+    return {"stages": latency_metrics.summary()}
+
+# Mémoire du worker (USS, PSS, pages partagées) et, sous app.server, du parent et des autres workers
+@app.get("/metrics/memory", tags=["metrics"])
+def memory_metrics():
+    return memory_report()
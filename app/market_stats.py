@@ -0,0 +1,286 @@
+"""
+Statistiques de marché précalculées : prix au m² par ville, code postal, type de bien et
+nombre de pièces.
+
+Chaque vente DVF (surface bâtie > 0, valeur foncière connue) appartient à 8 groupes : toutes
+les combinaisons de (code postal, type de bien, nombre de pièces) où chaque dimension est soit
+fixée, soit « toutes ». Pour chaque groupe sont précalculés, dans des tableaux compacts (une
+ligne par groupe) : le nombre de ventes, la moyenne, les quantiles STATS_QUANTILES et, par
+mois, le nombre de ventes et le prix médian. Une requête lit une ligne de ces tableaux.
+
+Les prix de chaque groupe sont aussi conservés triés (appartenances groupe / mois / prix) pour
+les quantiles demandés à la volée et pour les mises à jour : add_rows n'ajoute que les
+nouvelles ventes et ne recalcule que les groupes qu'elles touchent.
+"""
+import itertools
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dataset import DatasetCache
+
+logger = logging.getLogger(__name__)
+
+STATS_COLUMNS = [
+    "Type local", "Valeur fonciere", "Surface reelle bati", "Date mutation", "Code postal", "Section",
+    "No plan", "Nombre pieces principales",
+]
+# Quantiles précalculés pour chaque groupe
+STATS_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Clé d'un groupe : (code postal, type de bien, nombre de pièces), None = toutes les valeurs
+GroupKey = Tuple[Optional[int], Optional[str], Optional[int]]
+
+# Ventes d'un export DVF : dimensions codées (-1 = inconnue), mois et prix au m²
+def sales_columns(df) -> Dict[str, np.ndarray]:
+    data = df[(df["Surface reelle bati"] > 0) & (df["Valeur fonciere"] > 0) & df["Type local"].notna()]
+    # Une mutation sur plusieurs lignes identiques : une seule vente (comme les comparables)
+    data = data.drop_duplicates(["Date mutation", "Valeur fonciere", "Code postal", "Section", "No plan",
+                                 "Surface reelle bati", "Type local"])
+    months = data["Date mutation"].to_numpy(dtype="datetime64[M]")
+    return {
+        "code_postal": data["Code postal"].fillna(-1).to_numpy(dtype=np.int32),
+        "type_local": data["Type local"].astype(str).to_numpy(),
+        "nombre_pieces": data["Nombre pieces principales"].fillna(-1).to_numpy(dtype=np.int16),
+        # Mois depuis 1970-01 (-1 : date inconnue)
+        "month": np.where(np.isnat(months), -1, months.astype(np.int64)).astype(np.int32),
+        "prix_m2": (data["Valeur fonciere"].to_numpy(dtype=np.float64)
+                    / data["Surface reelle bati"].to_numpy(dtype=np.float64)).astype(np.float32),
+    }
+
+def sorted_quantiles(values: np.ndarray, quantiles: Sequence[float]) -> np.ndarray:
+    # Quantiles (interpolation linéaire, comme np.quantile) de valeurs déjà triées
+    if not len(values):
+        return np.full(len(quantiles), np.nan)
+    position = np.asarray(quantiles, dtype=np.float64) * (len(values) - 1)
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, len(values) - 1)
+    fraction = position - low
+    values = values.astype(np.float64)
+    return values[low] + (values[high] - values[low]) * fraction
+
+# Mois depuis 1970-01 -> "AAAA-MM"
+def month_label(month: int) -> str:
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+# Statistiques d'une ville
+class MarketStats:
+    def __init__(self, ville: str):
+        self.ville = ville
+        self.keys: Dict[GroupKey, int] = {}
+        # Appartenances (groupe, mois, prix), triées par groupe puis par prix
+        self.member_group = np.empty(0, dtype=np.int32)
+        self.member_month = np.empty(0, dtype=np.int32)
+        self.member_prix = np.empty(0, dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        # Résumé de chaque groupe (une ligne par groupe)
+        self.count = np.empty(0, dtype=np.int32)
+        self.mean = np.empty(0, dtype=np.float32)
+        self.quantiles = np.empty((0, len(STATS_QUANTILES)), dtype=np.float32)
+        # Tendance mensuelle : mois first_month + j en colonne j
+        self.first_month = 0
+        self.monthly_count = np.zeros((0, 0), dtype=np.int32)
+        self.monthly_median = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        # Nombre de ventes (groupe « toutes les ventes »)
+        group = self.keys.get((None, None, None))
+        return 0 if group is None else int(self.count[group])
+
+    @classmethod
+    def build(cls, df, ville: str) -> "MarketStats":
+        stats = cls(ville)
+        stats.add_rows(df)
+        return stats
+
+    def _memberships(self, sales: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        # (groupe, vente) pour les 8 groupes de chaque vente ; crée les groupes nouveaux
+        types, type_codes = np.unique(sales["type_local"], return_inverse=True)
+        dimensions = np.column_stack([sales["code_postal"], type_codes, sales["nombre_pieces"]]).astype(np.int64)
+        groups, rows = [], []
+        for fixed in itertools.product((False, True), repeat=3):
+            columns = [i for i, is_fixed in enumerate(fixed) if is_fixed]
+            # Une dimension inconnue (-1) n'appartient qu'aux groupes où elle vaut « toutes »
+            selected = np.flatnonzero((dimensions[:, columns] >= 0).all(axis=1))
+            values, inverse = np.unique(dimensions[selected][:, columns], axis=0, return_inverse=True)
+            ids = np.empty(len(values), dtype=np.int32)
+            for i, combination in enumerate(values):
+                fixed_values = dict(zip(columns, combination.tolist()))
+                key = (
+                    fixed_values.get(0),
+                    str(types[fixed_values[1]]) if 1 in fixed_values else None,
+                    fixed_values.get(2),
+                )
+                ids[i] = self.keys.setdefault(key, len(self.keys))
+            groups.append(ids[inverse.reshape(-1)])
+            rows.append(selected)
+        return np.concatenate(groups), np.concatenate(rows)
+
+    def copy(self) -> "MarketStats":
+        # Copie pour une mise à jour : add_rows remplace les tableaux sans les modifier en place
+        other = MarketStats.__new__(MarketStats)
+        other.__dict__.update(self.__dict__)
+        other.keys = dict(self.keys)
+        return other
+
+    def add_rows(self, df) -> int:
+        """Ajoute les ventes d'un export DVF ; retourne le nombre de ventes ajoutées"""
+        sales = sales_columns(df)
+        if not len(sales["prix_m2"]):
+            return 0
+        n_groups = len(self.keys)
+        groups, rows = self._memberships(sales)
+        # Fusion avec les appartenances existantes, triées par groupe puis par prix
+        member_group = np.concatenate([self.member_group, groups])
+        member_month = np.concatenate([self.member_month, sales["month"][rows]])
+        member_prix = np.concatenate([self.member_prix, sales["prix_m2"][rows]])
+        order = np.lexsort((member_prix, member_group))
+        self.member_group = member_group[order]
+        self.member_month = member_month[order]
+        self.member_prix = member_prix[order]
+        self.offsets = np.searchsorted(self.member_group, np.arange(len(self.keys) + 1)).astype(np.int64)
+        self._grow(n_groups, sales["month"])
+        # Seuls les groupes qui ont reçu des ventes sont recalculés
+        for group in np.unique(groups):
+            self._summarize(group)
+        return len(sales["prix_m2"])
+
+    def _grow(self, n_groups: int, months: np.ndarray) -> None:
+        # Lignes des nouveaux groupes et colonnes des nouveaux mois (nouveaux tableaux)
+        added = len(self.keys) - n_groups
+        self.count = np.concatenate([self.count, np.zeros(added, dtype=np.int32)])
+        self.mean = np.concatenate([self.mean, np.full(added, np.nan, dtype=np.float32)])
+        self.quantiles = np.vstack([self.quantiles, np.full((added, len(STATS_QUANTILES)), np.nan, dtype=np.float32)])
+        known = months[months >= 0]
+        width = self.monthly_count.shape[1]
+        first, last = self.first_month, self.first_month + width - 1
+        if len(known):
+            first = min(first, int(known.min())) if width else int(known.min())
+            last = max(last, int(known.max())) if width else int(known.max())
+        before = self.first_month - first if width else 0
+        after = (last - first + 1) - before - width
+        self.monthly_count = np.pad(self.monthly_count, ((0, added), (before, after)))
+        self.monthly_median = np.pad(self.monthly_median, ((0, added), (before, after)), constant_values=np.nan)
+        self.first_month = first
+
+    def _summarize(self, group: int) -> None:
+        start, stop = self.offsets[group], self.offsets[group + 1]
+        prix = self.member_prix[start:stop]
+        self.count[group] = len(prix)
+        self.mean[group] = prix.astype(np.float64).mean()
+        self.quantiles[group] = sorted_quantiles(prix, STATS_QUANTILES)
+        # Médiane par mois : tri stable par mois, les prix restent triés dans chaque mois
+        months = self.member_month[start:stop]
+        order = np.argsort(months, kind="stable")
+        months, prix = months[order], prix[order]
+        values, first, counts = np.unique(months, return_index=True, return_counts=True)
+        self.monthly_count[group] = 0
+        self.monthly_median[group] = np.nan
+        for month, i, n in zip(values, first, counts):
+            if month >= 0:
+                column = month - self.first_month
+                self.monthly_count[group, column] = n
+                self.monthly_median[group, column] = sorted_quantiles(prix[i:i + n], (0.5,))[0]
+
+    def lookup(self, code_postal: Optional[int] = None, type_local: Optional[str] = None,
+               nombre_pieces: Optional[int] = None, quantiles: Optional[Sequence[float]] = None
+               ) -> Optional[Dict[str, Any]]:
+        """Statistiques d'un groupe (None si aucune vente ne correspond)"""
+        group = self.keys.get((code_postal, type_local, nombre_pieces))
+        if group is None:
+            return None
+        if quantiles is None:
+            quantiles, values = STATS_QUANTILES, self.quantiles[group]
+        else:
+            values = sorted_quantiles(self.member_prix[self.offsets[group]:self.offsets[group + 1]], quantiles)
+        columns = np.flatnonzero(self.monthly_count[group])
+        counts = self.monthly_count[group, columns].tolist()
+        medians = np.round(self.monthly_median[group, columns].astype(np.float64), 2).tolist()
+        return {
+            "ville": self.ville,
+            "code_postal": code_postal,
+            "type_local": type_local,
+            "nombre_pieces": nombre_pieces,
+            "count": int(self.count[group]),
+            "prix_m2": {
+                "mean": round(float(self.mean[group]), 2),
+                **{f"p{q * 100:g}": round(float(v), 2) for q, v in zip(quantiles, values)},
+            },
+            "monthly": [
+                {"month": month_label(self.first_month + column), "count": count, "median": median}
+                for column, count, median in zip(columns.tolist(), counts, medians)
+            ],
+        }
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.member_group, self.member_month, self.member_prix, self.offsets, self.count, self.mean,
+            self.quantiles, self.monthly_count, self.monthly_median,
+        ))
+
+# Statistiques de toutes les villes, construites depuis leurs exports DVF
+class MarketStatsService:
+    """
+    Chaque ville a un ou plusieurs exports DVF : data_dir/<ville>_*.csv (ex. lille_2022.csv,
+    puis lille_2023-01.csv). refresh() ajoute les fichiers nouveaux sans recalculer le reste ;
+    un fichier déjà intégré dont le contenu a changé entraîne la reconstruction de la ville.
+    """
+    def __init__(self, villes: List[str], data_dir: Path, cache: Optional[DatasetCache] = None):
+        self.villes = [ville.lower() for ville in villes]
+        self.data_dir = Path(data_dir)
+        self.cache = cache or DatasetCache()
+        self._stats: Dict[str, MarketStats] = {}
+        # Fichiers intégrés de chaque ville et leur empreinte
+        self._sources: Dict[str, Dict[Path, str]] = {}
+        self._lock = threading.Lock()
+
+    def sources(self, ville: str) -> List[Path]:
+        return sorted(self.data_dir.glob(f"{ville}_*.csv"))
+
+    def refresh(self) -> List[str]:
+        """Intègre les exports nouveaux ou modifiés ; retourne les fichiers lus"""
+        loaded = []
+        with self._lock:
+            for ville in self.villes:
+                sources = self.sources(ville)
+                known = self._sources.get(ville, {})
+                hashes = {source: self.cache.sha256(source) for source in sources}
+                stats = self._stats.get(ville)
+                if stats is None or any(hashes.get(source) != sha for source, sha in known.items()):
+                    # Première construction, ou fichier modifié / supprimé : reconstruction
+                    stats, known = MarketStats(ville), {}
+                elif len(known) < len(sources):
+                    stats, known = stats.copy(), dict(known)
+                for source in sources:
+                    if source not in known:
+                        added = stats.add_rows(self.cache.load(source, STATS_COLUMNS))
+                        logger.info("Statistiques de marché %s : %d ventes ajoutées depuis %s", ville, added, source)
+                        known[source] = hashes[source]
+                        loaded.append(str(source))
+                # Remplacement atomique : les lectures en cours gardent l'ancienne version
+                self._stats[ville] = stats
+                self._sources[ville] = known
+        return loaded
+
+    def get(self, ville: str) -> MarketStats:
+        ville = ville.lower()
+        if ville not in self.villes:
+            raise ValueError(f"Pas de statistiques de marché pour {ville}")
+        stats = self._stats.get(ville)
+        if stats is None:
+            self.refresh()
+            stats = self._stats.get(ville)
+        return stats
+
+    def info(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            stats = dict(self._stats)
+            sources = {ville: list(files) for ville, files in self._sources.items()}
+        return [
+            {"ville": ville, "n_sales": len(item), "n_groups": len(item.keys), "bytes": item.nbytes(),
+             "sources": [str(source) for source in sources.get(ville, [])]}
+            for ville, item in sorted(stats.items())
+        ]
@@ -0,0 +1,75 @@
+"""
+Mémoire des processus, lue dans /proc (Linux) : RSS, PSS, pages partagées et pages privées (USS).
+
+- RSS : pages résidentes du processus, partagées ou non ;
+- PSS : chaque page partagée est divisée par le nombre de processus qui la partagent
+  (la somme des PSS des workers est la mémoire réellement occupée) ;
+- USS : pages privées du processus (Private_Clean + Private_Dirty), libérées à son arrêt ;
+- shared : pages partagées avec d'autres processus (copy-on-write après fork, fichiers mmap).
+"""
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Variable d'environnement des workers lancés par app.server : PID du processus parent
+SERVER_PID_ENV = "APP_SERVER_PID"
+WORKER_ID_ENV = "APP_WORKER_ID"
+
+def process_memory(pid: Optional[int] = None) -> Optional[Dict[str, int]]:
+    """Mémoire d'un processus en octets (None si /proc n'est pas lisible)"""
+    proc = Path("/proc") / (str(pid) if pid else "self")
+    # smaps_rollup (Linux 4.14+) : totaux déjà calculés ; sinon somme des zones de smaps
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            text = (proc / name).read_text()
+            break
+        except OSError:
+            continue
+    else:
+        return None
+    fields: Dict[str, int] = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        parts = value.split()
+        if len(parts) == 2 and parts[1] == "kB":
+            fields[key] = fields.get(key, 0) + int(parts[0]) * 1024
+    return {
+        "rss_bytes": fields.get("Rss", 0),
+        "pss_bytes": fields.get("Pss", 0),
+        "uss_bytes": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared_bytes": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "swap_bytes": fields.get("Swap", 0),
+    }
+
+def child_pids(parent: int) -> List[int]:
+    # Processus dont le parent est `parent` (champ 4 de /proc/<pid>/stat)
+    children = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # Le nom du processus (champ 2, entre parenthèses) peut contenir des espaces
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1 and int(fields[1]) == parent:
+            children.append(int(entry.name))
+    return sorted(children)
+
+def memory_report() -> Dict[str, Any]:
+    """Mémoire du processus courant et, sous app.server, du parent et de tous les workers"""
+    report: Dict[str, Any] = {"pid": os.getpid(), "process": process_memory()}
+    server_pid = os.environ.get(SERVER_PID_ENV)
+    if server_pid:
+        report["worker_id"] = int(os.environ.get(WORKER_ID_ENV, -1))
+        report["server"] = {"pid": int(server_pid), **(process_memory(int(server_pid)) or {})}
+        report["workers"] = [
+            {"pid": pid, **memory}
+            for pid in child_pids(int(server_pid))
+            if (memory := process_memory(pid)) is not None
+        ]
+        report["total_pss_bytes"] = report["server"].get("pss_bytes", 0) + sum(
+            worker["pss_bytes"] for worker in report["workers"]
+        )
+    return report
@@ -0,0 +1,204 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Étapes mesurées sur le chemin d'une prédiction
+STAGES = ("parse", "validation", "encode", "scale", "predict", "inverse_transform", "quantiles", "serialize", "total")
+LABEL_NAMES = ("ville", "type_local", "model_version")
+
+# Bornes des histogrammes de latence (en secondes, de 10 µs à 10 s)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Labels d'une requête portant sur plusieurs modèles (ex : /predict/batch)
+MIXED_LABELS = ("*", "*", "*")
+
+# Ajoute les séries de source à celles de target (copie des listes)
+def _add_series(target: Dict[Tuple[str, ...], List[float]], source: Dict[Tuple[str, ...], List[float]]) -> None:
+    for key, series in list(source.items()):
+        total = target.get(key)
+        if total is None:
+            target[key] = list(series)
+        else:
+            for i, value in enumerate(series):
+                total[i] += value
+
+# Histogrammes de latence par (étape, ville, type_local, version du modèle)
+# Sans verrou sur le chemin chaud : chaque thread écrit dans son propre shard,
+# les shards ne sont additionnés qu'à la lecture (/metrics)
+class LatencyHistograms:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        # Shard de chaque thread vivant ; ceux des threads terminés (un par flux, pools
+        # recréés...) sont additionnés dans _base puis oubliés : le nombre de shards reste borné
+        self._shards: List[Tuple[threading.Thread, Dict[Tuple[str, ...], List[float]]]] = []
+        self._base: Dict[Tuple[str, ...], List[float]] = {}
+        # Verrou pris une seule fois par thread, à la création de son shard
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple[str, ...], List[float]]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._fold_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_dead_shards(self) -> None:
+        # Sous _shards_lock : un thread terminé n'écrit plus dans son shard
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                _add_series(self._base, shard)
+        self._shards = alive
+
+    def observe(self, stage: str, labels: Tuple[str, str, str], seconds: float) -> None:
+        # Compteurs par bucket (le dernier = +Inf) suivis de la somme des durées
+        shard = self._shard()
+        key = (stage,) + tuple(labels)
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        # Somme des shards de tous les threads (copie : les écritures continuent pendant la lecture)
+        merged: Dict[Tuple[str, ...], List[float]] = {}
+        with self._shards_lock:
+            self._fold_dead_shards()
+            _add_series(merged, self._base)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            _add_series(merged, shard)
+        return merged
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            self._base.clear()
+            for _, shard in self._shards:
+                shard.clear()
+
+    def quantile(self, series: List[float], q: float) -> Optional[float]:
+        # Estimation par interpolation linéaire dans le bucket (comme histogram_quantile)
+        counts = series[:-1]
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self) -> List[Dict[str, object]]:
+        # p50/p99 et moyenne par série, en millisecondes
+        rows = []
+        for key, series in sorted(self.snapshot().items()):
+            count = sum(series[:-1])
+            p50, p99 = self.quantile(series, 0.5), self.quantile(series, 0.99)
+            rows.append({
+                "stage": key[0],
+                **dict(zip(LABEL_NAMES, key[1:])),
+                "count": count,
+                "mean_ms": series[-1] / count * 1000 if count else 0.0,
+                "p50_ms": p50 * 1000 if p50 is not None else None,
+                "p99_ms": p99 * 1000 if p99 is not None else None,
+            })
+        return rows
+
+    def render_prometheus(self, name: str = "predict_stage_duration_seconds") -> str:
+        # Format texte Prometheus (histogramme cumulatif, _sum et _count)
+        lines = [
+            f"# HELP {name} Durée de chaque étape d'une prédiction, en secondes.",
+            f"# TYPE {name} histogram",
+        ]
+        for key, series in sorted(self.snapshot().items()):
+            labels = ",".join(
+                f'{label}="{_escape(value)}"' for label, value in zip(("stage",) + LABEL_NAMES, key)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {series[-1]!r}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+# Histogrammes partagés par l'application
+latency_metrics = LatencyHistograms()
+
+# Suivi d'une requête HTTP : objet mutable placé dans une ContextVar par le middleware,
+# complété par le handler (début, fin, labels du modèle utilisé)
+class RequestTrace:
+    __slots__ = ("started", "handler_started", "handler_finished", "labels")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.handler_started = None
+        self.handler_finished = None
+        self.labels = None
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+def handler_started() -> None:
+    # Fin du parsing : corps lu, JSON décodé et schéma pydantic validé
+    trace = current_trace.get()
+    if trace is not None:
+        trace.handler_started = time.perf_counter()
+
+def handler_finished(labels: Tuple[str, str, str]) -> None:
+    # Début de la sérialisation de la réponse
+    trace = current_trace.get()
+    if trace is not None:
+        trace.handler_finished = time.perf_counter()
+        trace.labels = labels
+
+# Middleware ASGI : mesure le parsing (entrée -> handler), la sérialisation
+# (handler -> début de la réponse) et la durée totale des requêtes de prédiction
+class LatencyMiddleware:
+    def __init__(self, app, histograms: LatencyHistograms = latency_metrics):
+        self.app = app
+        self.histograms = histograms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace(time.perf_counter())
+        token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self._record(trace, time.perf_counter())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+
+    def _record(self, trace: RequestTrace, response_started: float) -> None:
+        # Seules les requêtes passées par un handler de prédiction sont mesurées
+        if trace.labels is None or trace.handler_started is None:
+            return
+        self.histograms.observe("parse", trace.labels, trace.handler_started - trace.started)
+        self.histograms.observe("serialize", trace.labels, response_started - trace.handler_finished)
+        self.histograms.observe("total", trace.labels, response_started - trace.started)
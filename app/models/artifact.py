@@ -0,0 +1,342 @@
+"""
+Format d'artefact compact des modèles, ouvert en mémoire partagée (mmap) sans copie.
+
+Un fichier .forest contient :
+- 8 octets magiques, puis la taille de l'en-tête (uint32 little-endian) ;
+- un en-tête JSON : noms des features, version, type de modèle, signature des pickles
+  d'origine (taille, date, sha256) et position, type et forme de chaque tableau ;
+- les tableaux bruts, alignés sur 64 octets : nœuds des arbres (feature, fils gauche et
+  droit en int32, seuil en float32, valeur des nœuds en float64) et paramètres des scalers.
+
+Les seuils sont arrondis au float32 inférieur : sklearn compare des features float32 à des
+seuils float64, et pour un x float32, x <= seuil équivaut à x <= float32_inf(seuil). Avec
+la même mise à l'échelle et le même ordre de sommation, les prédictions sont identiques
+bit à bit à celles de scaler_x / modèle / scaler_y.
+
+Conversion des .pkl du manifeste : python -m app.models.artifact [--models-path models] [--update-manifest]
+"""
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .forest import TREE_LEAF
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DVFFORST"
+FORMAT_VERSION = 1
+ARTIFACT_SUFFIX = ".forest"
+# Alignement des tableaux dans le fichier (lignes de cache, accès vectorisés)
+ALIGNMENT = 64
+
+# Tableaux stockés et leur type
+ARRAY_DTYPES = {
+    "feature": np.dtype("<i4"),
+    "threshold": np.dtype("<f4"),
+    "left": np.dtype("<i4"),
+    "right": np.dtype("<i4"),
+    "value": np.dtype("<f8"),
+    "roots": np.dtype("<i4"),
+    "x_mean": np.dtype("<f8"),
+    "x_scale": np.dtype("<f8"),
+    "y_mean": np.dtype("<f8"),
+    "y_scale": np.dtype("<f8"),
+}
+
+# Modèle (arbre ou forêt) et scalers réunis dans un seul fichier
+# Prend les features brutes et retourne le prix au m², comme scaler_x -> modèle -> scaler_y
+class ForestArtifact:
+    def __init__(self, arrays: Dict[str, np.ndarray], header: Dict[str, Any]):
+        for name in ARRAY_DTYPES:
+            setattr(self, name, arrays[name])
+        self.header = header
+        self.feature_names: List[str] = header["feature_names"]
+        self.n_features = len(self.feature_names)
+        self.max_depth = header["max_depth"]
+        self.model_type = header["model_type"]
+        self.version = header.get("version")
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_estimator(cls, estimator, scaler_x=None, scaler_y=None,
+                       feature_names: Optional[Sequence[str]] = None, **metadata) -> "ForestArtifact":
+        # Accepte un RandomForestRegressor ou un DecisionTreeRegressor seul
+        trees = getattr(estimator, "estimators_", [estimator])
+        n_features = estimator.n_features_in_
+        if feature_names is None:
+            names = getattr(scaler_x, "feature_names_in_", None)
+            feature_names = [str(name) for name in names] if names is not None else [f"x{i}" for i in range(n_features)]
+        x_mean, x_scale = _standard_scaler_params(scaler_x, n_features)
+        y_mean, y_scale = _standard_scaler_params(scaler_y, 1)
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for tree in trees:
+            tree_ = tree.tree_
+            node_ids = np.arange(tree_.node_count)
+            is_leaf = tree_.children_left == TREE_LEAF
+            # Les feuilles bouclent sur elles-mêmes : le parcours peut continuer sans effet
+            features.append(np.where(is_leaf, 0, tree_.feature))
+            thresholds.append(np.where(is_leaf, np.inf, float32_floor(tree_.threshold)))
+            lefts.append(np.where(is_leaf, node_ids, tree_.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree_.children_right) + offset)
+            values.append(tree_.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree_.node_count
+            max_depth = max(max_depth, tree_.max_depth)
+
+        arrays = {
+            "feature": np.concatenate(features), "threshold": np.concatenate(thresholds),
+            "left": np.concatenate(lefts), "right": np.concatenate(rights),
+            "value": np.concatenate(values), "roots": np.asarray(roots),
+            "x_mean": x_mean, "x_scale": x_scale, "y_mean": y_mean, "y_scale": y_scale,
+        }
+        if offset > np.iinfo(np.int32).max:
+            raise ValueError("Trop de nœuds pour des indices int32")
+        arrays = {name: np.ascontiguousarray(array, dtype=ARRAY_DTYPES[name]) for name, array in arrays.items()}
+        header = {
+            "feature_names": list(feature_names),
+            "model_type": type(estimator).__name__,
+            "max_depth": int(max_depth),
+            "is_forest": hasattr(estimator, "estimators_"),
+            **metadata,
+        }
+        return cls(arrays, header)
+
+    def save(self, path: Path) -> None:
+        """Écrit l'artefact (fichier temporaire puis renommage atomique)"""
+        path = Path(path)
+        layout, offset = {}, 0
+        for name, dtype in ARRAY_DTYPES.items():
+            array = getattr(self, name)
+            layout[name] = {"dtype": dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _align(offset + array.nbytes)
+        header = {**self.header, "format": FORMAT_VERSION, "arrays": layout}
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        # Les positions des tableaux sont relatives au début de la zone de données
+        data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(4, "little"))
+            f.write(header_bytes)
+            for name in ARRAY_DTYPES:
+                f.seek(data_start + layout[name]["offset"])
+                f.write(getattr(self, name).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "ForestArtifact":
+        """Ouvre l'artefact ; avec mmap, les tableaux sont des vues en lecture seule du fichier"""
+        path = Path(path)
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} n'est pas un artefact de modèle")
+            header_size = int.from_bytes(f.read(4), "little")
+            header = json.loads(f.read(header_size).decode("utf-8"))
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Format d'artefact non supporté : {header.get('format')} ({path})")
+        data_start = _align(len(MAGIC) + 4 + header_size)
+        buffer = np.memmap(path, dtype=np.uint8, mode="r") if mmap else np.fromfile(path, dtype=np.uint8)
+        arrays = {}
+        for name, spec in header.pop("arrays").items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(
+                buffer, dtype=dtype, count=count, offset=data_start + spec["offset"]
+            ).reshape(spec["shape"])
+        return cls(arrays, header)
+
+    def transform(self, X) -> np.ndarray:
+        # Mise à l'échelle comme StandardScaler.transform, puis float32 comme les arbres sklearn
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X doit avoir la forme (n, {self.n_features}), reçu {X.shape}")
+        return ((X - self.x_mean) / self.x_scale).astype(np.float32)
+
+    def apply(self, X) -> np.ndarray:
+        # Retourne l'indice de la feuille atteinte, forme (n_arbres, n_lignes)
+        return self.apply_transformed(self.transform(X))
+
+    def apply_transformed(self, X_scaled: np.ndarray) -> np.ndarray:
+        # Comme apply, pour des features déjà passées par transform (float32)
+        rows = np.arange(X_scaled.shape[0])
+        node = np.repeat(self.roots[:, None], X_scaled.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = X_scaled[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_scaled(self, X) -> np.ndarray:
+        return self._average(self.value[self.apply(X)])
+
+    def _average(self, leaf_values: np.ndarray) -> np.ndarray:
+        # Moyenne des arbres dans l'espace mis à l'échelle, sommée arbre par arbre
+        # (même ordre que RandomForestRegressor.predict, donc même résultat)
+        total = np.zeros(leaf_values.shape[1])
+        for tree_values in leaf_values:
+            total += tree_values
+        if self.header["is_forest"]:
+            total /= self.n_trees
+        return total
+
+    def predict(self, X) -> np.ndarray:
+        # Prix au m² prédit pour chaque ligne de features brutes
+        return self.predict_transformed(self.transform(X))
+
+    def predict_transformed(self, X_scaled: np.ndarray) -> np.ndarray:
+        # Prix au m² prédit depuis des features déjà passées par transform (float32)
+        return self._average(self.value[self.apply_transformed(X_scaled)]) * self.y_scale[0] + self.y_mean[0]
+
+    def predict_trees(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        # Un seul parcours : prix au m² prédit et prédiction de chaque arbre (n_arbres, n_lignes),
+        # toutes deux remises à l'échelle réelle par scaler_y
+        leaf_values = self.value[self.apply(X)]
+        predictions = self._average(leaf_values) * self.y_scale[0] + self.y_mean[0]
+        return predictions, leaf_values * self.y_scale[0] + self.y_mean[0]
+
+def float32_floor(values) -> np.ndarray:
+    # Plus grand float32 inférieur ou égal à chaque valeur float64
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+def _standard_scaler_params(scaler, n: int):
+    # Paramètres effectivement appliqués par StandardScaler.transform (identité si absent)
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    if mean is None or not getattr(scaler, "with_mean", True):
+        mean = np.zeros(n)
+    if scale is None or not getattr(scaler, "with_std", True):
+        scale = np.ones(n)
+    return np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def artifact_path_for(model_file: str) -> str:
+    # model_maisons.pkl -> model_maisons.forest (même dossier que le pickle)
+    return str(Path(model_file).with_suffix(ARTIFACT_SUFFIX))
+
+# Pickles dont l'artefact est dérivé
+SOURCE_FILES = ("model", "scaler_x", "scaler_y")
+
+def source_signature(models_path: Path, files: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Signature des pickles d'origine enregistrée dans l'en-tête de l'artefact"""
+    from ..dataset import file_sha256
+    signature = {}
+    for name in SOURCE_FILES:
+        path = Path(models_path) / files[name]
+        stat = path.stat()
+        signature[name] = {"path": files[name], "size": stat.st_size,
+                           "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+    return signature
+
+def matches_sources(artifact: ForestArtifact, models_path: Path, files: Dict[str, str]) -> bool:
+    """Vrai si l'artefact a été construit depuis ces pickles (ou s'il ne porte pas leur signature)"""
+    from ..dataset import file_sha256
+    source = artifact.header.get("source")
+    if not isinstance(source, dict) or not all(isinstance(source.get(name), dict) for name in SOURCE_FILES):
+        # Artefact antérieur à la signature : rien à comparer
+        return True
+    for name in SOURCE_FILES:
+        expected, path = source[name], Path(models_path) / files[name]
+        stat = path.stat()
+        if stat.st_size != expected["size"]:
+            return False
+        # Date changée mais même taille (copie, déploiement) : on compare le contenu
+        if stat.st_mtime_ns != expected["mtime_ns"] and file_sha256(path) != expected["sha256"]:
+            return False
+    return True
+
+def save_model_files(models_path: Path, version: str, ville: str, type_local: str,
+                     model, scaler_x, scaler_y) -> Dict[str, str]:
+    """Écrit une version d'un modèle dans models/<version>/ et retourne ses fichiers (chemins du manifeste)"""
+    import joblib
+    suffix = f"{ville}_{type_local.lower()}"
+    files = {
+        "model": f"{version}/model_{suffix}.pkl",
+        "scaler_x": f"{version}/scaler_x_{suffix}.pkl",
+        "scaler_y": f"{version}/scaler_y_{suffix}.pkl",
+        "artifact": f"{version}/model_{suffix}.forest",
+    }
+    models_path = Path(models_path)
+    joblib.dump(model, models_path / files["model"])
+    joblib.dump(scaler_x, models_path / files["scaler_x"])
+    joblib.dump(scaler_y, models_path / files["scaler_y"])
+    # Artefact compact servi par l'API (mmap), les pickles restent la source de vérité
+    artifact = ForestArtifact.from_estimator(
+        model, scaler_x, scaler_y, version=version, ville=ville, type_local=type_local,
+        source=source_signature(models_path, files),
+    )
+    artifact.save(models_path / files["artifact"])
+    return files
+
+def convert_models(models_path: Path, update_manifest: bool = False) -> List[Dict[str, str]]:
+    """Convertit les pickles de chaque entrée du manifeste en artefact .forest"""
+    import joblib
+    from .model_loader import MANIFEST_NAME, ModelLoader, write_manifest
+
+    loader = ModelLoader(models_path=models_path, use_artifacts=False)
+    converted, done = [], {}
+    for entry in loader.entries.values():
+        if not {"model", "scaler_x", "scaler_y"} <= set(entry.files):
+            continue
+        sources = (entry.files["model"], entry.files["scaler_x"], entry.files["scaler_y"])
+        target = artifact_path_for(entry.files["model"])
+        if done.get(target, sources) != sources:
+            raise ValueError(f"{target} correspondrait à deux combinaisons de fichiers différentes")
+        if target not in done:
+            model, scaler_x, scaler_y = (joblib.load(models_path / f) for f in sources)
+            artifact = ForestArtifact.from_estimator(
+                model, scaler_x, scaler_y, version=entry.version, type_local=entry.type_local,
+                source=source_signature(models_path, entry.files),
+            )
+            artifact.save(models_path / target)
+            done[target] = sources
+            logger.info("Artefact %s écrit (%d arbres, %d nœuds)", target, artifact.n_trees, artifact.node_count)
+        converted.append({"ville": entry.ville, "type_local": entry.type_local,
+                          "version": entry.version, "artifact": target})
+
+    if update_manifest:
+        manifest_path = models_path / MANIFEST_NAME
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        targets = {(c["ville"], c["type_local"], c["version"]): c["artifact"] for c in converted}
+        for item in manifest["models"]:
+            key = (item["ville"].lower(), item["type_local"], str(item["version"]))
+            if key in targets:
+                item["artifact"] = targets[key]
+        write_manifest(models_path, manifest["models"])
+    return converted
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Conversion des modèles .pkl en artefacts compacts .forest")
+    parser.add_argument("--models-path", type=Path, default=Path(__file__).parent.parent.parent / "models",
+                        help="Dossier des modèles (contenant manifest.json)")
+    parser.add_argument("--update-manifest", action="store_true",
+                        help="Ajoute le champ artifact aux entrées converties du manifeste")
+    args = parser.parse_args()
+    from ..logging_setup import setup_logging
+    setup_logging()
+    for item in convert_models(args.models_path, args.update_manifest):
+        print(f"{item['ville']}/{item['type_local']} ({item['version']}) -> {item['artifact']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Valeur sklearn marquant l'absence de fils (feuille)
+TREE_LEAF = -1
+
+# Tableaux d'une forêt compilée (un fichier .npy chacun quand elle est sauvegardée)
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+
+# Forêt "aplatie" : tous les arbres dans des tableaux NumPy contigus
+# Les scalers sont intégrés aux seuils (scaler_x) et aux feuilles (scaler_y) :
+# on donne directement les features brutes et on obtient le prix au m²
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_estimator(cls, estimator, scaler_x=None, scaler_y=None) -> "CompiledForest":
+        # Accepte un RandomForestRegressor ou un DecisionTreeRegressor seul
+        trees = getattr(estimator, "estimators_", [estimator])
+        n_features = estimator.n_features_in_
+        x_mean, x_scale = _scaler_params(scaler_x, n_features)
+        y_mean, y_scale = _scaler_params(scaler_y, 1)
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for tree in trees:
+            tree_ = tree.tree_
+            n_nodes = tree_.node_count
+            children_left = tree_.children_left
+            children_right = tree_.children_right
+            is_leaf = children_left == TREE_LEAF
+            node_ids = np.arange(n_nodes)
+            feature = np.where(is_leaf, 0, tree_.feature)
+
+            # Seuil sur la feature mise à l'échelle -> seuil sur la feature brute
+            # Les feuilles bouclent sur elles-mêmes : le parcours peut continuer sans effet
+            threshold = np.full(n_nodes, np.inf)
+            threshold[~is_leaf] = fold_thresholds(
+                tree_.threshold[~is_leaf], x_mean[feature[~is_leaf]], x_scale[feature[~is_leaf]]
+            )
+            left = np.where(is_leaf, node_ids, children_left) + offset
+            right = np.where(is_leaf, node_ids, children_right) + offset
+            # Valeur de la feuille remise à l'échelle réelle
+            value = tree_.value[:, 0, 0] * y_scale[0] + y_mean[0]
+
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(left)
+            rights.append(right)
+            values.append(value)
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree_.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            n_features=n_features,
+        )
+
+    def save(self, directory: Path) -> None:
+        # Sauvegarde les tableaux en .npy (chargeables en mémoire partagée avec load)
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        meta = {"max_depth": int(self.max_depth), "n_features": int(self.n_features)}
+        (directory / "forest.json").write_text(json.dumps(meta))
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: str = "r") -> "CompiledForest":
+        # Avec mmap_mode="r", les pages sont partagées entre tous les processus qui lisent les fichiers
+        directory = Path(directory)
+        meta = json.loads((directory / "forest.json").read_text())
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(**arrays, **meta)
+
+    def apply(self, X) -> np.ndarray:
+        # Retourne l'indice de la feuille atteinte, forme (n_arbres, n_lignes)
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X doit avoir la forme (n, {self.n_features}), reçu {X.shape}")
+        rows = np.arange(X.shape[0])
+        node = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        # Parcours vectorisé sur tous les arbres et toutes les lignes à la fois
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict(self, X) -> np.ndarray:
+        # Prix au m² prédit pour chaque ligne de features brutes
+        return self.value[self.apply(X)].mean(axis=0)
+
+    def predict_trees(self, X):
+        # Un seul parcours : prix au m² prédit et prédiction de chaque arbre (n_arbres, n_lignes)
+        tree_values = self.value[self.apply(X)]
+        return tree_values.mean(axis=0), tree_values
+
+def tree_quantiles(tree_values: np.ndarray, quantiles) -> np.ndarray:
+    """
+    Quantiles des prédictions des arbres pour chaque ligne, forme (len(quantiles), n_lignes).
+
+    Interpolation linéaire comme np.quantile (méthode par défaut), mais avec un seul tri
+    et des indices calculés une fois : plusieurs fois plus rapide sur ces petits tableaux.
+    """
+    ordered = np.sort(tree_values, axis=0)
+    position = np.asarray(quantiles, dtype=np.float64) * (len(ordered) - 1)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, len(ordered) - 1)
+    weight = (position - lower)[:, None]
+    return ordered[lower] * (1 - weight) + ordered[upper] * weight
+
+def fold_thresholds(threshold, mean, scale) -> np.ndarray:
+    """
+    Convertit des seuils sklearn (sur features mises à l'échelle) en seuils bruts.
+
+    sklearn compare float32((x - mean) / scale) <= seuil. Cette fonction étant croissante
+    en x, on cherche par dichotomie le plus grand x (float64) qui va encore à gauche,
+    ce qui donne exactement les mêmes branches que sklearn, y compris aux frontières.
+    """
+    threshold = np.asarray(threshold, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32) <= threshold
+
+    center = threshold * scale + mean
+    width = (np.abs(threshold) + 1.0) * scale * 1e-6 + np.abs(center) * 1e-12
+    lo, hi = center - width, center + width
+    # Élargit l'intervalle jusqu'à encadrer la frontière
+    for _ in range(64):
+        bad_lo, bad_hi = ~goes_left(lo), goes_left(hi)
+        if not (bad_lo.any() or bad_hi.any()):
+            break
+        width = width * 2
+        lo = np.where(bad_lo, center - width, lo)
+        hi = np.where(bad_hi, center + width, hi)
+    # Dichotomie jusqu'à deux flottants consécutifs
+    for _ in range(128):
+        mid = lo + (hi - lo) / 2
+        active = (mid != lo) & (mid != hi)
+        if not active.any():
+            break
+        left = goes_left(mid)
+        lo = np.where(active & left, mid, lo)
+        hi = np.where(active & ~left, mid, hi)
+    return lo
+
+def _scaler_params(scaler, n: int):
+    # Moyenne et écart-type d'un StandardScaler (identité si absent)
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros(n) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n) if scale is None else np.asarray(scale, dtype=np.float64)
+    return mean, scale
@@ -0,0 +1,100 @@
+"""
+Table de prédiction exacte d'une forêt : une recherche dichotomique par feature et une lecture.
+
+Une forêt est constante par morceaux : sur chaque feature mise à l'échelle (float32, voir
+ForestArtifact.transform), les seuils de tous les arbres découpent l'axe en intervalles
+]seuil_i-1, seuil_i]. Deux entrées dans la même case de la grille (produit des intervalles)
+suivent les mêmes branches dans chaque arbre, donc ont exactement la même prédiction. La
+table stocke la prédiction d'un représentant de chaque case, calculée par ForestArtifact :
+les résultats sont identiques bit à bit à ceux de scaler_x -> modèle -> scaler_y.
+
+La taille de la grille est le produit du nombre d'intervalles par feature ; au-delà du
+budget mémoire, la table n'est pas construite et la prédiction parcourt les arbres.
+"""
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from .artifact import ForestArtifact
+
+logger = logging.getLogger(__name__)
+
+# Lignes de la grille évaluées à la fois pendant la construction (mémoire des parcours)
+BUILD_CHUNK_ROWS = 8192
+
+# Table de prédiction : bornes des intervalles de chaque feature et prédiction de chaque case
+class LookupTable:
+    def __init__(self, edges: List[np.ndarray], table: np.ndarray, x_mean: np.ndarray, x_scale: np.ndarray):
+        self.edges = edges
+        self.table = table
+        self.x_mean = x_mean
+        self.x_scale = x_scale
+        self.n_features = len(edges)
+        # Pas de chaque feature dans la table aplatie
+        self._strides = np.array([stride // table.itemsize for stride in table.strides], dtype=np.intp)
+        self._flat = table.reshape(-1)
+
+    @property
+    def shape(self):
+        return self.table.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes + sum(edges.nbytes for edges in self.edges)
+
+    @staticmethod
+    def split_edges(artifact: ForestArtifact) -> List[np.ndarray]:
+        # Seuils distincts de chaque feature (float32 triés), feuilles exclues
+        internal = np.isfinite(artifact.threshold)
+        return [
+            np.unique(artifact.threshold[internal & (artifact.feature == i)])
+            for i in range(artifact.n_features)
+        ]
+
+    @classmethod
+    def table_bytes(cls, artifact: ForestArtifact) -> int:
+        # Taille de la table (float64) que donnerait cet artefact
+        return int(np.prod([len(edges) + 1 for edges in cls.split_edges(artifact)], dtype=np.float64)) * 8
+
+    @classmethod
+    def from_artifact(cls, artifact: ForestArtifact, max_bytes: int) -> Optional["LookupTable"]:
+        """Construit la table, ou retourne None si elle dépasse max_bytes"""
+        edges = cls.split_edges(artifact)
+        shape = tuple(len(feature_edges) + 1 for feature_edges in edges)
+        n_cells = int(np.prod(shape, dtype=np.float64))
+        if n_cells * 8 > max_bytes:
+            logger.info("Table de prédiction non construite : %d cases (%.1f Mo) au-delà du budget de %.1f Mo",
+                        n_cells, n_cells * 8 / 1e6, max_bytes / 1e6)
+            return None
+        # Représentant de chaque intervalle : sa borne supérieure (x <= seuil_i), et pour le
+        # dernier intervalle le float32 suivant le plus grand seuil (x > tous les seuils)
+        representatives = [
+            np.append(feature_edges, np.nextafter(feature_edges[-1], np.float32(np.inf)))
+            if len(feature_edges) else np.zeros(1, dtype=np.float32)
+            for feature_edges in edges
+        ]
+        table = np.empty(n_cells, dtype=np.float64)
+        for start in range(0, n_cells, BUILD_CHUNK_ROWS):
+            cells = np.arange(start, min(start + BUILD_CHUNK_ROWS, n_cells))
+            indices = np.unravel_index(cells, shape)
+            X_scaled = np.column_stack([values[index] for values, index in zip(representatives, indices)])
+            table[cells] = artifact.predict_transformed(X_scaled.astype(np.float32))
+        return cls(edges, table.reshape(shape), artifact.x_mean, artifact.x_scale)
+
+    def cells(self, X) -> np.ndarray:
+        # Indice de la case de chaque ligne dans la table aplatie
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X doit avoir la forme (n, {self.n_features}), reçu {X.shape}")
+        # Même mise à l'échelle que ForestArtifact.transform
+        X_scaled = ((X - self.x_mean) / self.x_scale).astype(np.float32)
+        # Nombre de seuils strictement inférieurs à x (NaN : après tous les seuils, comme les arbres)
+        cells = np.zeros(len(X), dtype=np.intp)
+        for i, feature_edges in enumerate(self.edges):
+            cells += np.searchsorted(feature_edges, X_scaled[:, i], side="left") * self._strides[i]
+        return cells
+
+    def predict(self, X) -> np.ndarray:
+        # Prix au m² prédit pour chaque ligne de features brutes
+        return self._flat[self.cells(X)]
@@ -1,49 +1,426 @@
-import joblib
+import hashlib
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-# Classe pour charger les modèles et scalers
+from .artifact import ForestArtifact, matches_sources
+from .forest import CompiledForest
+from .lookup import LookupTable
+
+logger = logging.getLogger(__name__)
+
+# Moteurs d'inférence disponibles
+# "artifact" : artefact compact .forest (mmap) du manifeste, pickles sklearn à défaut
+# "sklearn" : estimateurs d'origine, les artefacts ne sont jamais ouverts
+# "native" : forêt compilée (l'artefact s'il existe, sinon compilée depuis les pickles)
+# "lookup" : table de prédiction exacte (voir lookup.py), parcours des arbres si trop grande
+ENGINES = ("artifact", "sklearn", "native", "lookup")
+
+# Budget mémoire par défaut d'une table de prédiction (moteur "lookup")
+DEFAULT_LOOKUP_MAX_BYTES = 64 * 1024 * 1024
+
+# Nom du manifeste décrivant les modèles disponibles dans le dossier models
+MANIFEST_NAME = "manifest.json"
+
+# Artefacts historiques (avant le manifeste) : mêmes modèles pour toutes les villes
+LEGACY_VILLES = ("lille", "bordeaux")
+LEGACY_FILES = {
+    "Appartement": ("model_appartements.pkl", "scaler_x_appartements.pkl", "scaler_y_appartements.pkl"),
+    "Maison": ("model_maisons.pkl", "scaler_x_maisons.pkl", "scaler_y_maisons.pkl"),
+}
+
+# Entrée du manifeste : un modèle pour une ville, un type de bien et une version
+# Fichiers : pickles (model, scaler_x, scaler_y) et/ou artefact compact (artifact, voir artifact.py)
+class ModelEntry:
+    def __init__(self, ville: str, type_local: str, version: str, model: Optional[str] = None,
+                 scaler_x: Optional[str] = None, scaler_y: Optional[str] = None, active: bool = True,
+                 artifact: Optional[str] = None):
+        pickles = (model, scaler_x, scaler_y)
+        if artifact is None and None in pickles:
+            raise TypeError(f"{ville}/{type_local} : model, scaler_x et scaler_y requis sans artifact")
+        if artifact is not None and any(pickles) and None in pickles:
+            raise TypeError(f"{ville}/{type_local} : model, scaler_x et scaler_y vont ensemble")
+        self.ville = ville.lower()
+        self.type_local = type_local
+        self.version = str(version)
+        self.files = {"model": model, "scaler_x": scaler_x, "scaler_y": scaler_y}
+        if artifact is not None:
+            self.files = {name: f for name, f in self.files.items() if f is not None}
+            self.files["artifact"] = artifact
+        self.active = active
+
+    @property
+    def has_pickles(self) -> bool:
+        return "model" in self.files
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return (self.ville, self.type_local, self.version)
+
+# Modèle chargé en mémoire avec ses scalers
+# Avec un artefact compact, les pickles ne sont chargés qu'à la première lecture de
+# model / scaler_x / scaler_y (ex : mise à jour incrémentale), jamais pour servir
+class ModelBundle:
+    def __init__(self, entry: ModelEntry, model, scaler_x, scaler_y, signature,
+                 artifact: Optional[ForestArtifact] = None, pickle_loader=None):
+        self.entry = entry
+        self._pickles = (model, scaler_x, scaler_y) if model is not None else None
+        self._pickle_loader = pickle_loader
+        self.artifact = artifact
+        self.signature = signature
+        self.model_name = type(model).__name__ if model is not None else artifact.model_type
+        self._compiled = None
+        # Table de prédiction : None tant qu'elle n'est pas construite, False si trop grande
+        self._lookup = None
+        self._compile_lock = threading.Lock()
+        self._pickles_lock = threading.Lock()
+
+    def _load_pickles(self):
+        if self._pickles is None:
+            with self._pickles_lock:
+                if self._pickles is None:
+                    if self._pickle_loader is None:
+                        raise RuntimeError(
+                            f"Pas de pickle pour {self.entry.ville}/{self.entry.type_local} "
+                            f"(version {self.version}) : seul l'artefact compact est disponible"
+                        )
+                    self._pickles = self._pickle_loader()
+        return self._pickles
+
+    @property
+    def model(self):
+        return self._load_pickles()[0]
+
+    @property
+    def scaler_x(self):
+        return self._load_pickles()[1]
+
+    @property
+    def scaler_y(self):
+        return self._load_pickles()[2]
+
+    @property
+    def version(self) -> str:
+        return self.entry.version
+
+    def _share_with(self, entry: ModelEntry) -> "ModelBundle":
+        # Même artefacts pour une autre entrée du manifeste (ex : mêmes fichiers pour deux villes)
+        model, scaler_x, scaler_y = self._pickles or (None, None, None)
+        bundle = ModelBundle(entry, model, scaler_x, scaler_y, self.signature, self.artifact, self._pickle_loader)
+        bundle._compiled = self._compiled
+        bundle._lookup = self._lookup
+        return bundle
+
+    @property
+    def compiled(self) -> CompiledForest:
+        # Forêt compilée à la demande, une seule fois par bundle
+        if self._compiled is None:
+            with self._compile_lock:
+                if self._compiled is None:
+                    self._compiled = CompiledForest.from_estimator(self.model, self.scaler_x, self.scaler_y)
+        return self._compiled
+
+    def lookup_table(self, max_bytes: int = DEFAULT_LOOKUP_MAX_BYTES) -> Optional[LookupTable]:
+        # Table construite une seule fois par bundle ; None si elle dépasse le budget
+        if self._lookup is None:
+            with self._compile_lock:
+                if self._lookup is None:
+                    artifact = self.artifact
+                    if artifact is None:
+                        artifact = ForestArtifact.from_estimator(self.model, self.scaler_x, self.scaler_y)
+                    self._lookup = LookupTable.from_artifact(artifact, max_bytes) or False
+        return self._lookup or None
+
+# Registre des modèles par (ville, type_local, version), construit depuis models/manifest.json
+# Les modèles sont chargés à la première utilisation, le nombre de modèles résidents est
+# borné (éviction LRU) et un fichier modifié est rechargé puis remplacé atomiquement
 class ModelLoader:
-    def __init__(self):
+    def __init__(self, engine: str = "artifact", models_path: Optional[Path] = None,
+                 max_resident: int = 8, watch_interval: Optional[float] = None,
+                 use_artifacts: bool = True, lookup_max_bytes: int = DEFAULT_LOOKUP_MAX_BYTES):
+        if engine not in ENGINES:
+            raise ValueError(f"Moteur d'inférence inconnu : {engine} (valeurs acceptées : {', '.join(ENGINES)})")
+        if max_resident < 1:
+            raise ValueError("max_resident doit être supérieur ou égal à 1")
+        self.engine = engine
+        # Sert les modèles depuis les artefacts compacts (mmap) quand le manifeste en indique,
+        # sauf avec le moteur sklearn
+        self.use_artifacts = use_artifacts and engine != "sklearn"
+        # Moteur "lookup" : taille maximale d'une table de prédiction
+        self.lookup_max_bytes = lookup_max_bytes
+        self.max_resident = max_resident
         # Chemin vers le dossier models à la racine du projet
         self.root_path = Path(__file__).parent.parent.parent
-        self.models_path = self.root_path / "models"
+        self.models_path = Path(models_path) if models_path is not None else self.root_path / "models"
+        # Fonctions appelées après chaque chargement (ex : invalidation du cache)
+        self.reload_listeners = []
+        self.version = None
+        self.entries: Dict[Tuple[str, str, str], ModelEntry] = {}
+        self._resident: "OrderedDict[Tuple[str, str, str], ModelBundle]" = OrderedDict()
+        # Artefacts partagés entre entrées pointant vers les mêmes fichiers
+        self._shared: "weakref.WeakValueDictionary" = weakref.WeakValueDictionary()
+        # Le verrou ne protège que les dictionnaires : les chargements se font hors verrou,
+        # un seul par modèle (les autres appelants attendent son Future)
+        self._lock = threading.RLock()
+        self._loading: Dict[Tuple[str, str, str], Future] = {}
+        self._manifest_signature = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
         self.load_models()
+        if watch_interval:
+            self.start_watcher(watch_interval)
+
+    def add_reload_listener(self, callback) -> None:
+        # Enregistre une fonction appelée à chaque chargement de nouveaux artefacts
+        self.reload_listeners.append(callback)
 
     def load_models(self):
-        # Charge tous les modèles et scalers nécessaires
-        required_files = [
-            "model_appartements.pkl", "model_maisons.pkl",
-            "scaler_x_appartements.pkl", "scaler_x_maisons.pkl",
-            "scaler_y_appartements.pkl", "scaler_y_maisons.pkl"
-        ]
+        # Relit le manifeste et vide les modèles résidents (rechargés à la demande)
         if not self.models_path.exists():
             raise RuntimeError(f"Le dossier models n'existe pas : {self.models_path}")
+        entries = self._read_manifest()
+        required_files = sorted({f for entry in entries for f in entry.files.values()})
         missing_files = [f for f in required_files if not (self.models_path / f).exists()]
         if missing_files:
             raise RuntimeError(f"Fichiers manquants : {', '.join(missing_files)}")
-        # Chargement des modèles et scalers
-        self.model_appartements = joblib.load(self.models_path / "model_appartements.pkl")
-        self.model_maisons = joblib.load(self.models_path / "model_maisons.pkl")
-        self.scaler_x_appartements = joblib.load(self.models_path / "scaler_x_appartements.pkl")
-        self.scaler_y_appartements = joblib.load(self.models_path / "scaler_y_appartements.pkl")
-        self.scaler_x_maisons = joblib.load(self.models_path / "scaler_x_maisons.pkl")
-        self.scaler_y_maisons = joblib.load(self.models_path / "scaler_y_maisons.pkl")
-
-    def get_model_and_scalers(self, type_local: str):
-        # Retourne le modèle et les scalers selon le type de bien
-        if type_local == "Appartement":
-            return (
-                self.model_appartements,
-                self.scaler_x_appartements,
-                self.scaler_y_appartements,
-                "RandomForestRegressor"
-            )
-        elif type_local == "Maison":
-            return (
-                self.model_maisons,
-                self.scaler_x_maisons,
-                self.scaler_y_maisons,
-                "RandomForestRegressor"
-            )
+        with self._lock:
+            self.entries = {entry.key: entry for entry in entries}
+            self._resident.clear()
+            self._manifest_signature = self._file_signature(self.models_path / MANIFEST_NAME)
+            self._update_version()
+        self._notify()
+
+    def _read_manifest(self) -> List[ModelEntry]:
+        manifest_path = self.models_path / MANIFEST_NAME
+        if not manifest_path.exists():
+            # Pas de manifeste : les six fichiers historiques pour toutes les villes
+            return [
+                ModelEntry(ville, type_local, "legacy", *files)
+                for ville in LEGACY_VILLES for type_local, files in LEGACY_FILES.items()
+            ]
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        try:
+            return [ModelEntry(**item) for item in manifest["models"]]
+        except (KeyError, TypeError) as e:
+            raise RuntimeError(f"Manifeste invalide ({manifest_path}) : {str(e)}")
+
+    def _file_signature(self, path: Path):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _entry_signature(self, entry: ModelEntry):
+        return tuple(self._file_signature(self.models_path / f) for f in entry.files.values())
+
+    def _update_version(self) -> None:
+        # Version du registre : empreinte des entrées et de la signature de leurs fichiers
+        digest = hashlib.sha256()
+        for key in sorted(self.entries):
+            entry = self.entries[key]
+            digest.update(repr((key, sorted(entry.files.items()), self._entry_signature(entry))).encode())
+        self.version = digest.hexdigest()[:12]
+
+    def _notify(self) -> None:
+        for callback in self.reload_listeners:
+            callback()
+
+    def available_models(self) -> List[Dict[str, object]]:
+        # Liste des modèles du manifeste et indication de leur présence en mémoire
+        with self._lock:
+            return [
+                {
+                    "ville": entry.ville, "type_local": entry.type_local, "version": entry.version,
+                    "active": entry.active, "loaded": key in self._resident
+                }
+                for key, entry in self.entries.items()
+            ]
+
+    def resolve(self, type_local: str, ville: Optional[str] = None, version: Optional[str] = None) -> ModelEntry:
+        # Trouve l'entrée du manifeste : version demandée, sinon la dernière version active du manifeste
+        # (les versions sont des noms libres : c'est l'ordre du manifeste qui fait foi, training et
+        # compaction y ajoutent les nouvelles versions à la fin)
+        if type_local not in ("Appartement", "Maison"):
+            raise ValueError(f"Type de bien non reconnu: {type_local}")
+        with self._lock:
+            candidates = [
+                entry for entry in self.entries.values()
+                if entry.type_local == type_local and (ville is None or entry.ville == ville.lower())
+            ]
+        if version is not None:
+            candidates = [entry for entry in candidates if entry.version == str(version)]
+        elif any(entry.active for entry in candidates):
+            candidates = [entry for entry in candidates if entry.active]
+        if not candidates:
+            raise ValueError(f"Aucun modèle disponible pour {ville}/{type_local}" + (f" (version {version})" if version else ""))
+        return candidates[-1]
+
+    def get_bundle(self, type_local: str, ville: Optional[str] = None, version: Optional[str] = None) -> ModelBundle:
+        # Retourne le modèle résident ou le charge à la première utilisation
+        entry = self.resolve(type_local, ville, version)
+        with self._lock:
+            bundle = self._resident.get(entry.key)
+            if bundle is not None:
+                self._resident.move_to_end(entry.key)
+                return bundle
+            loading = self._loading.get(entry.key)
+            if loading is not None:
+                owner = False
+            else:
+                loading = self._loading[entry.key] = Future()
+                owner = True
+        if not owner:
+            # Chargement déjà en cours dans un autre thread
+            return loading.result()
+        try:
+            bundle = self._prepare(self._load_bundle(entry))
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(entry.key, None)
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            self._loading.pop(entry.key, None)
+            # Registre rechargé pendant le chargement : l'entrée a pu changer, on ne garde pas le modèle
+            if self.entries.get(entry.key) is entry:
+                self._store(entry.key, bundle)
+        loading.set_result(bundle)
+        return bundle
+
+    def _load_bundle(self, entry: ModelEntry) -> ModelBundle:
+        signature = self._entry_signature(entry)
+        share_key = (tuple(entry.files.values()), signature)
+        with self._lock:
+            shared = self._shared.get(share_key)
+        if shared is not None:
+            return shared._share_with(entry)
+        logger.info("Chargement du modèle %s/%s (version %s)", entry.ville, entry.type_local, entry.version)
+        pickle_loader = (lambda: self._load_pickles(entry)) if entry.has_pickles else None
+        if self.use_artifacts and "artifact" in entry.files:
+            # Artefact ouvert en mmap : pas de copie, pages partagées entre processus
+            artifact = ForestArtifact.load(self.models_path / entry.files["artifact"])
+            if entry.has_pickles and not matches_sources(artifact, self.models_path, entry.files):
+                # Pickles remplacés après la conversion : l'artefact décrit un autre modèle,
+                # on le reconstruit en mémoire depuis les pickles, qui font foi
+                logger.warning(
+                    "Artefact %s obsolète (pickles modifiés depuis sa conversion) : reconstruit depuis les pickles, "
+                    "relancez python -m app.models.artifact", entry.files["artifact"]
+                )
+                pickles = self._load_pickles(entry)
+                artifact = ForestArtifact.from_estimator(*pickles, version=entry.version, type_local=entry.type_local)
+                bundle = ModelBundle(entry, *pickles, signature, artifact=artifact)
+            else:
+                bundle = ModelBundle(entry, None, None, None, signature, artifact=artifact, pickle_loader=pickle_loader)
+        elif entry.has_pickles:
+            bundle = ModelBundle(entry, *self._load_pickles(entry), signature)
         else:
-            raise ValueError(f"Type de bien non reconnu: {type_local}")
\ No newline at end of file
+            raise RuntimeError(f"Artefacts compacts désactivés et pas de pickle pour {entry.key}")
+        with self._lock:
+            self._shared[share_key] = bundle
+        return bundle
+
+    def _prepare(self, bundle: ModelBundle) -> ModelBundle:
+        # Forêt compilée ou table de prédiction construites au chargement (et à chaque rechargement),
+        # jamais pendant une requête
+        if self.engine == "native" and bundle.artifact is None:
+            bundle.compiled
+        elif self.engine == "lookup":
+            # None si la table dépasse le budget : parcours des arbres
+            bundle.lookup_table(self.lookup_max_bytes)
+        return bundle
+
+    def _load_pickles(self, entry: ModelEntry):
+        # Import différé : joblib (et sklearn au dépickling) seulement au premier chargement
+        import joblib
+        return tuple(joblib.load(self.models_path / entry.files[name]) for name in ("model", "scaler_x", "scaler_y"))
+
+    def _store(self, key, bundle: ModelBundle) -> None:
+        self._resident[key] = bundle
+        self._resident.move_to_end(key)
+        while len(self._resident) > self.max_resident:
+            evicted, _ = self._resident.popitem(last=False)
+            logger.info("Éviction du modèle %s", evicted)
+
+    def check_for_updates(self) -> bool:
+        # Recharge le manifeste ou les modèles résidents dont un fichier a changé
+        # Le nouveau modèle est chargé hors verrou puis remplacé en une seule affectation
+        manifest_signature = self._file_signature(self.models_path / MANIFEST_NAME)
+        if manifest_signature != self._manifest_signature:
+            logger.info("Manifeste modifié, rechargement du registre")
+            self.load_models()
+            return True
+        with self._lock:
+            stale = [
+                (key, bundle.entry) for key, bundle in self._resident.items()
+                if self._entry_signature(bundle.entry) != bundle.signature
+            ]
+        if not stale:
+            return False
+        for key, entry in stale:
+            try:
+                # Nouveau bundle : forêt compilée et table de prédiction reconstruites depuis les nouveaux fichiers
+                bundle = self._prepare(self._load_bundle(entry))
+            except Exception as e:
+                # Fichier en cours d'écriture : on garde l'ancien modèle et on réessaiera
+                logger.error("Échec du rechargement de %s : %s", key, e)
+                continue
+            with self._lock:
+                if key in self._resident:
+                    self._resident[key] = bundle
+                    logger.info("Modèle %s rechargé", key)
+        with self._lock:
+            self._update_version()
+        self._notify()
+        return True
+
+    def start_watcher(self, interval: float) -> None:
+        # Surveille les artefacts en arrière-plan (thread démon)
+        if self._watcher is not None:
+            return
+        self._stop_watching.clear()
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.check_for_updates()
+                except Exception as e:
+                    logger.error("Erreur lors de la surveillance des modèles : %s", e)
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def get_model_and_scalers(self, type_local: str, ville: str = None, version: str = None):
+        # Retourne le modèle et les scalers selon la ville et le type de bien
+        bundle = self.get_bundle(type_local, ville, version)
+        return bundle.model, bundle.scaler_x, bundle.scaler_y, bundle.model_name
+
+    def get_compiled_model(self, type_local: str, ville: str = None, version: str = None) -> CompiledForest:
+        # Retourne la forêt compilée (features brutes -> prix au m²)
+        return self.get_bundle(type_local, ville, version).compiled
+
+    def get_lookup_table(self, type_local: str, ville: str = None, version: str = None) -> Optional[LookupTable]:
+        # Retourne la table de prédiction exacte, ou None si elle dépasse le budget
+        return self.get_bundle(type_local, ville, version).lookup_table(self.lookup_max_bytes)
+
+def write_manifest(models_path: Path, entries: List[Dict[str, Any]]) -> None:
+    """Écrit le manifeste de façon atomique : le registre de l'API ne lit jamais un manifeste partiel"""
+    manifest_path = Path(models_path) / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    # Même mise en forme que le manifeste versionné : une entrée par ligne
+    lines = ",\n".join(f"    {json.dumps(entry, ensure_ascii=False)}" for entry in entries)
+    tmp_path.write_text(f'{{\n  "models": [\n{lines}\n  ]\n}}\n')
+    os.replace(tmp_path, manifest_path)
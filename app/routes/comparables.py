@@ -0,0 +1,69 @@
+from collections import defaultdict
+from typing import Any, Dict, List
+import logging
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException
+from .. import config
+from ..comparables import ComparablesService
+from ..schemas.schemas import ComparablesRequest, ComparablesResponse
+from ..training import parse_villes
+
+# Logger du module
+logger = logging.getLogger(__name__)
+
+# Service partagé, créé au démarrage (init_service) et non à l'import du module
+service: ComparablesService = None
+
+def init_service() -> None:
+    """Crée le service des comparables pour les villes de COMPARABLES_VILLES"""
+    global service
+    if service is None:
+        villes = [ville for ville in config.COMPARABLES_VILLES.split(",") if ville.strip()]
+        service = ComparablesService(parse_villes([ville.strip() for ville in villes]))
+
+def startup() -> None:
+    """Charge (ou construit) les index au démarrage ; en cas d'échec, construits à la demande"""
+    try:
+        init_service()
+        service.load_all()
+    except Exception as e:
+        logger.error("Index des comparables non chargés : %s", e)
+
+# Dépendance des routes : garantit que le service est initialisé
+def ensure_service() -> None:
+    if service is None:
+        init_service()
+
+# Création du routeur FastAPI pour la route des comparables
+router = APIRouter(dependencies=[Depends(ensure_service)])
+
+# Recherches groupées par index et filtre : un seul parcours de l'arbre par groupe
+def find_comparables(queries) -> List[Dict[str, Any]]:
+    groups = defaultdict(list)
+    for i, query in enumerate(queries):
+        groups[(query.ville, query.type_local, query.code_postal, query.section)].append(i)
+    results: List[Dict[str, Any]] = [None] * len(queries)
+    for (ville, type_local, code_postal, section), positions in groups.items():
+        index = service.get_index(ville, type_local)
+        X = np.array([
+            [queries[i].surface_bati, queries[i].surface_terrain, queries[i].nombre_lots] for i in positions
+        ])
+        k = max(queries[i].k for i in positions)
+        distances, rows = index.query(X, k, code_postal=code_postal, section=section)
+        for j, i in enumerate(positions):
+            n = queries[i].k
+            results[i] = {"index": i, "comparables": index.describe(rows[j, :n], distances[j, :n])}
+    return results
+
+# Route : ventes DVF réelles les plus proches d'un ou plusieurs biens
+@router.post("/comparables", response_model=ComparablesResponse)
+def comparables(request: ComparablesRequest):
+    try:
+        return {"results": find_comparables(request.queries)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Route : taille des index chargés
+@router.get("/comparables/stats")
+def comparables_stats():
+    return {"indexes": service.stats()}
@@ -1,30 +1,240 @@
+import math
+import threading
+import time
 import numpy as np
-from fastapi import APIRouter, HTTPException
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from .. import config, streaming
+from ..batching import MicroBatcher
+from ..cache import PredictionCache
+from ..inference import InferenceExecutor, InferenceRejected
+from ..metrics import MIXED_LABELS, handler_finished, handler_started, latency_metrics
+from ..models.forest import tree_quantiles
 from ..models.model_loader import ModelLoader
-from ..schemas.schemas import PredictionRequest, DynamicPredictionRequest, PredictionResponse
+from ..schemas.schemas import (
+    PredictionRequest, DynamicPredictionRequest, PredictionResponse,
+    BatchPredictionRequest, BatchPredictionResponse, SweepRequest, SweepResponse
+)
 from ..utils import FeatureProcessor
 import logging
 
-# On configure le logger pour afficher les messages de debug
-logging.basicConfig(level=logging.DEBUG)
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Logger du module (niveau et sortie configurés par setup_logging, LOG_LEVEL=DEBUG pour la trace)
 logger = logging.getLogger(__name__)
 
+# Instances partagées, créées au démarrage (init_service) et non à l'import du module
+model_loader: ModelLoader = None
+feature_processor: FeatureProcessor = None
+prediction_cache: PredictionCache = None
+micro_batcher: MicroBatcher = None
+inference: InferenceExecutor = None
+
+# État du service exposé par /health/ready
+service_state = {
+    "ready": False,
+    "error": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+}
+_init_lock = threading.Lock()
+
+def init_service(executor: str = None) -> None:
+    """Crée ModelLoader, FeatureProcessor, le cache, l'exécuteur et le micro-batcher (une seule fois)"""
+    global model_loader, feature_processor, prediction_cache, micro_batcher, inference
+    if model_loader is not None:
+        return
+    with _init_lock:
+        if model_loader is not None:
+            return
+        started = time.perf_counter()
+        feature_processor = FeatureProcessor()
+        loader = ModelLoader(
+            engine=config.PREDICT_ENGINE,
+            max_resident=config.MODEL_MAX_RESIDENT,
+            watch_interval=config.MODEL_WATCH_INTERVAL,
+            use_artifacts=config.MODEL_USE_ARTIFACTS,
+            lookup_max_bytes=int(config.LOOKUP_TABLE_MAX_MB * 1024 * 1024)
+        )
+
+        # Cache des prédictions, vidé automatiquement à chaque rechargement des modèles
+        prediction_cache = PredictionCache(
+            max_size=config.PREDICTION_CACHE_SIZE,
+            ttl_seconds=config.PREDICTION_CACHE_TTL or None
+        ) if config.PREDICTION_CACHE_SIZE > 0 else None
+        if prediction_cache is not None:
+            loader.add_reload_listener(prediction_cache.clear)
+
+        # Prédictions hors de la boucle asyncio, limitées par modèle et bornées dans le temps
+        inference = InferenceExecutor(
+            kind=executor or config.INFERENCE_EXECUTOR,
+            workers=config.INFERENCE_WORKERS,
+            max_in_flight=config.INFERENCE_MAX_IN_FLIGHT,
+            timeout_seconds=config.REQUEST_TIMEOUT_MS / 1000 or None,
+            retry_after=config.RETRY_AFTER_SECONDS,
+            initializer=_init_process_worker
+        )
+
+        # Micro-batching optionnel des prédictions unitaires (MICROBATCH_ENABLED)
+        micro_batcher = MicroBatcher(
+            _predict_rows,
+            max_wait_ms=config.MICROBATCH_MAX_WAIT_MS,
+            max_batch_size=config.MICROBATCH_MAX_SIZE,
+            executor=inference if inference.kind != "inline" else None
+        ) if config.MICROBATCH_ENABLED else None
+
+        # Affecté en dernier : les autres threads ne voient qu'un service complet
+        model_loader = loader
+        service_state["load_seconds"] = time.perf_counter() - started
+
+# Initialisation d'un processus du pool (INFERENCE_EXECUTOR=process) :
+# chaque processus charge ses propres modèles et calcule en ligne
+def _init_process_worker() -> None:
+    init_service(executor="inline")
+    warmup()
+
+def warmup() -> None:
+    """Charge chaque modèle actif et fait une prédiction synthétique (initialisation de sklearn)"""
+    started = time.perf_counter()
+    rows = np.array([[80.0, 0.0, 1.0]])
+    active = [entry for entry in model_loader.entries.values() if entry.active]
+    # Pas plus de modèles que le registre ne peut en garder en mémoire
+    for entry in active[:model_loader.max_resident]:
+        _predict_rows(rows, entry.ville, entry.type_local)
+        if config.SWEEP_USE_LOOKUP:
+            # Tables de prédiction des sweeps construites au démarrage plutôt qu'au premier appel
+            model_loader.get_lookup_table(entry.type_local, entry.ville, entry.version)
+    service_state["warmup_seconds"] = time.perf_counter() - started
+
+def startup() -> None:
+    """Initialisation complète appelée par le lifespan de l'application"""
+    try:
+        init_service()
+        warmup()
+        # Prêt seulement après les autres services du démarrage (voir app.main)
+        logger.info(
+            "Modèles prêts (chargement %.3fs, warmup %.3fs)",
+            service_state["load_seconds"], service_state["warmup_seconds"]
+        )
+    except Exception as e:
+        service_state["error"] = str(e)
+        logger.error("Error during startup: %s", e)
+        raise
+
+async def shutdown() -> None:
+    """Arrête la surveillance des modèles, le micro-batcher et le pool d'inférence"""
+    if model_loader is not None:
+        model_loader.stop_watcher()
+    if micro_batcher is not None:
+        await micro_batcher.close()
+    if inference is not None:
+        inference.shutdown(wait=False)
+
+# Lancement multi-workers (app.server) : fork ne copie que le thread appelant
+def before_fork() -> None:
+    """Arrête les threads du service chargé dans le parent avant de créer les workers"""
+    if model_loader is not None:
+        model_loader.stop_watcher()
+    if inference is not None:
+        inference.shutdown(wait=True)
+
+def after_fork() -> None:
+    """Dans un worker : relance la surveillance des modèles (le pool d'inférence est recréé au premier usage)"""
+    if model_loader is not None and config.MODEL_WATCH_INTERVAL:
+        model_loader.start_watcher(config.MODEL_WATCH_INTERVAL)
+
+# Dépendance des routes : garantit que le service est initialisé
+# (utile si le lifespan n'a pas été exécuté, ex : TestClient sans contexte)
+def ensure_service() -> None:
+    if model_loader is None:
+        init_service()
+
 # Création du routeur FastAPI pour regrouper les routes de prédiction
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(ensure_service)])
+
+# Prédiction de plusieurs lignes de features brutes (micro-batching, warmup)
+def _predict_rows(rows: np.ndarray, ville: str, type_local: str) -> np.ndarray:
+    return predict_prices(rows, ville, type_local)
+
+# Buffer (1, 3) préalloué par thread pour encoder une requête unitaire
+_buffers = threading.local()
+
+def encode_single(features: Dict[str, Any]) -> np.ndarray:
+    buffer = getattr(_buffers, "row", None)
+    if buffer is None:
+        buffer = _buffers.row = np.empty((1, len(feature_processor.feature_keys)))
+    return feature_processor.encode(features, out=buffer)
+
+# Labels des métriques de latence : ville, type de bien et version du modèle servi
+def metric_labels(ville: str, type_local: str):
+    return (ville.lower(), type_local, model_loader.resolve(type_local, ville).version)
+
+# Validation de la ville et encodage d'une requête unitaire, avec mesure des deux étapes
+def validate_and_encode(features_dict: Dict[str, Any], ville: str) -> np.ndarray:
+    started = time.perf_counter()
+    feature_processor.validate_ville(ville)
+    validated = time.perf_counter()
+    X = encode_single(features_dict)
+    encoded = time.perf_counter()
+    labels = metric_labels(ville, features_dict["type_local"])
+    latency_metrics.observe("validation", labels, validated - started)
+    latency_metrics.observe("encode", labels, encoded - validated)
+    return X
+
+# Nombre maximum de quantiles demandés par requête
+MAX_QUANTILES = 20
+
+# Libellé d'un quantile dans les réponses : 0.1 -> "p10", 0.025 -> "p2.5"
+def quantile_label(q: float) -> str:
+    return f"p{q * 100:g}"
 
-# On crée une seule instance de ModelLoader et FeatureProcessor pour tout le module
-model_loader = ModelLoader()
-feature_processor = FeatureProcessor()
+def quantile_dict(quantiles: Tuple[float, ...], values) -> Dict[str, float]:
+    return {quantile_label(q): round(float(v), 2) for q, v in zip(quantiles, values)}
+
+def parse_quantiles(text: str) -> Tuple[float, ...]:
+    # "0.1,0.5,0.9" -> (0.1, 0.5, 0.9)
+    try:
+        values = tuple(float(value) for value in text.split(",") if value.strip())
+    except ValueError:
+        values = ()
+    if not values or len(values) > MAX_QUANTILES or any(not 0 <= q <= 1 for q in values):
+        raise ValueError(f"Entre 1 et {MAX_QUANTILES} quantiles compris entre 0 et 1 attendus, reçu : {text!r}")
+    return values
+
+# Dépendance des endpoints : quantiles demandés (None = prédiction ponctuelle seule)
+def interval_quantiles(
+    interval: bool = Query(False, description="Ajoute l'intervalle de prédiction (quantiles PREDICTION_QUANTILES)"),
+    quantiles: Optional[str] = Query(None, description="Quantiles à renvoyer, ex : 0.1,0.5,0.9 (implique interval)"),
+) -> Optional[Tuple[float, ...]]:
+    if quantiles is None and not interval:
+        return None
+    try:
+        return parse_quantiles(quantiles if quantiles is not None else config.PREDICTION_QUANTILES)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# Mise à l'échelle des features brutes par scaler_x
+# Le DataFrame n'est construit que si le scaler vérifie les noms de colonnes
+def transform_features(scaler_x, X) -> np.ndarray:
+    if isinstance(X, np.ndarray) and getattr(scaler_x, "feature_names_in_", None) is not None:
+        import pandas as pd
+        X = pd.DataFrame(X, columns=feature_processor.model_features, copy=False)
+    return scaler_x.transform(X)
 
 # Endpoint pour prédire le prix à Lille
 @router.post(
     "/predict/lille",
     response_model=PredictionResponse,
+    response_model_exclude_none=True,
     summary="Prédiction du prix au m² à Lille",
     description="Prédit le prix au m² pour un bien immobilier à Lille à partir des caractéristiques fournies.",
 )
 async def predict_lille(
-    request: PredictionRequest
+    request: PredictionRequest,
+    quantiles: Optional[Tuple[float, ...]] = Depends(interval_quantiles)
 ):
     """
     Prédit le prix au m² pour un bien à Lille.
@@ -35,41 +245,41 @@ async def predict_lille(
         - surface_terrain: float — Surface du terrain en m²
         - nombre_lots: int — Nombre de lots
         - type_local: str — Type de bien (Maison, Appartement, etc.)
+    - **interval** / **quantiles** (query) : ajoute les quantiles des prédictions des arbres
     """
     try:
-        # On vérifie que le type de bien est correct
-        feature_processor.validate_type_local(request.type_local)
-        
-        # On vérifie que les données sont valides
-        features_dict = request.model_dump()
-        feature_processor.validate_features(features_dict)
-        
-        # On fait la prédiction
-        prediction = predict_price(request, "lille")
+        # On fait la prédiction (les features sont validées une seule fois à l'encodage)
+        prediction, bands = await predict_single(request, "lille", quantiles)
         
         # On retourne la réponse formatée
         return {
             "prix_m2_estime": round(prediction, 2),
             "ville_modele": "Lille",
-            "model": "RandomForestRegressor"
+            "model": "RandomForestRegressor",
+            "quantiles": bands
         }
+    except InferenceRejected:
+        # Surcharge ou délai dépassé : 429/503 avec Retry-After (gestionnaire de main.py)
+        raise
     except ValueError as ve:
         # Erreur de validation utilisateur
         raise HTTPException(status_code=422, detail=str(ve))
     except Exception as e:
         # Erreur inattendue
-        logger.error(f"Error in Lille prediction: {str(e)}")
+        logger.error("Error in Lille prediction: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 # Endpoint pour prédire le prix à Bordeaux
 @router.post(
     "/predict/bordeaux",
     response_model=PredictionResponse,
+    response_model_exclude_none=True,
     summary="Prédiction du prix au m² à Bordeaux",
     description="Prédit le prix au m² pour un bien immobilier à Bordeaux à partir des caractéristiques fournies.",
 )
 async def predict_bordeaux(
-    request: PredictionRequest
+    request: PredictionRequest,
+    quantiles: Optional[Tuple[float, ...]] = Depends(interval_quantiles)
 ):
     """
     Prédit le prix au m² pour un bien à Bordeaux.
@@ -80,37 +290,36 @@ async def predict_bordeaux(
         - surface_terrain: float — Surface du terrain en m²
         - nombre_lots: int — Nombre de lots
         - type_local: str — Type de bien (Maison, Appartement, etc.)
+    - **interval** / **quantiles** (query) : ajoute les quantiles des prédictions des arbres
     """
     try:
-        # On vérifie que le type de bien est correct
-        feature_processor.validate_type_local(request.type_local)
-        
-        # On vérifie que les données sont valides
-        features_dict = request.model_dump()
-        feature_processor.validate_features(features_dict)
-        
-        # On fait la prédiction
-        prediction = predict_price(request, "bordeaux")
+        # On fait la prédiction (les features sont validées une seule fois à l'encodage)
+        prediction, bands = await predict_single(request, "bordeaux", quantiles)
         return {
             "prix_m2_estime": round(prediction, 2),
             "ville_modele": "Bordeaux",
-            "model": "RandomForestRegressor"
+            "model": "RandomForestRegressor",
+            "quantiles": bands
         }
+    except InferenceRejected:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=422, detail=str(ve))
     except Exception as e:
-        logger.error(f"Error in Bordeaux prediction: {str(e)}")
+        logger.error("Error in Bordeaux prediction: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 # Endpoint dynamique pour choisir la ville
 @router.post(
     "/predict",
     response_model=PredictionResponse,
+    response_model_exclude_none=True,
     summary="Prédiction dynamique du prix au m²",
     description="Prédit le prix au m² pour un bien immobilier en fonction de la ville et des caractéristiques fournies.",
 )
 async def predict_dynamic(
-    request: DynamicPredictionRequest
+    request: DynamicPredictionRequest,
+    quantiles: Optional[Tuple[float, ...]] = Depends(interval_quantiles)
 ):
     """
     Prédit le prix au m² pour un bien, ville au choix (Lille ou Bordeaux).
@@ -123,6 +332,7 @@ async def predict_dynamic(
             - surface_terrain: float — Surface du terrain en m²
             - nombre_lots: int — Nombre de lots
             - type_local: str — Type de bien (Maison, Appartement, etc.)
+    - **interval** / **quantiles** (query) : ajoute les quantiles des prédictions des arbres
     """
     try:
         # On vérifie que la ville est bien supportée
@@ -133,59 +343,499 @@ async def predict_dynamic(
             )
 
         # On fait la prédiction
-        prediction = predict_price(request.features, request.ville)
+        prediction, bands = await predict_single(request.features, request.ville, quantiles)
         
         return {
             "prix_m2_estime": round(prediction, 2),
             "ville_modele": request.ville.capitalize(),
-            "model": "RandomForestRegressor"
+            "model": "RandomForestRegressor",
+            "quantiles": bands
         }
         
+    except InferenceRejected:
+        raise
+    except Exception as e:
+        logger.error("Error processing request: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint batch : plusieurs biens (villes et types mélangés) en une seule requête
+@router.post(
+    "/predict/batch",
+    response_model=BatchPredictionResponse,
+    summary="Prédiction batch du prix au m²",
+    description="Prédit le prix au m² pour une liste de biens, toutes villes et types de bien confondus.",
+)
+async def predict_batch(
+    request: BatchPredictionRequest,
+    quantiles: Optional[Tuple[float, ...]] = Depends(interval_quantiles)
+):
+    """
+    Prédit le prix au m² pour une liste de biens.
+
+    Les biens sont regroupés par (ville, type_local) et chaque groupe est prédit
+    en une seule passe vectorisée. Les résultats sont renvoyés dans l'ordre des
+    éléments reçus ; un élément invalide renvoie une erreur sans faire échouer le batch.
+
+    **Paramètres**:
+    - **request**: BatchPredictionRequest
+        - items: list — Éléments au format DynamicPredictionRequest (ville + features)
+    - **interval** / **quantiles** (query) : ajoute les quantiles des prédictions des arbres
+    """
+    handler_started()
+    # Batch mélangé : limité sous une clé commune plutôt que par modèle
+    results = await inference.run(("batch", "*"), predict_prices_batch, request.items, quantiles)
+    handler_finished(MIXED_LABELS)
+    n_errors = sum(1 for r in results if r["error"] is not None)
+    return {
+        "results": results,
+        "n_success": len(results) - n_errors,
+        "n_errors": n_errors
+    }
+
+# Endpoint sweep : prix au m² d'un bien quand une ou deux features varient (courbes de prix)
+@router.post(
+    "/predict/sweep",
+    response_model=SweepResponse,
+    response_model_exclude_none=True,
+    summary="Courbes de prix au m² (sweep)",
+    description="Prédit le prix au m² d'un bien sur une grille de valeurs d'une ou deux features, en une passe.",
+)
+async def predict_sweep(
+    request: SweepRequest,
+    quantiles: Optional[Tuple[float, ...]] = Depends(interval_quantiles)
+):
+    """
+    Prédit le prix au m² d'un bien pour chaque point d'une grille.
+
+    La grille est le produit des valeurs des axes (au plus SWEEP_MAX_POINTS points), les autres
+    features restent celles du bien. Toute la grille est prédite en une seule passe.
+
+    **Paramètres**:
+    - **request**: SweepRequest
+        - ville: str — 'lille' ou 'bordeaux'
+        - features: PredictionRequest — Bien de référence
+        - axes: list — Une ou deux features (surface_bati, surface_terrain, nombre_lots) avec
+          leurs valeurs (values) ou un intervalle (start, stop, step)
+    - **interval** / **quantiles** (query) : ajoute les quantiles des prédictions des arbres
+    """
+    n_points = math.prod(axis.size for axis in request.axes)
+    if n_points > config.SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Grille de {n_points} points : au plus {config.SWEEP_MAX_POINTS} points par sweep"
+        )
+    handler_started()
+    ville, type_local = request.ville.lower(), request.features.type_local
+    try:
+        result = await inference.run((ville, type_local), predict_sweep_grid, request, quantiles)
+    except InferenceRejected:
+        raise
     except Exception as e:
-        logger.error(f"Error processing request: {str(e)}")
+        logger.error("Error in sweep prediction: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
+    handler_finished(metric_labels(ville, type_local))
+    return result
+
+# Endpoint flux : prédictions en volume en NDJSON ou Arrow IPC, renvoyées au fil de la lecture
+@router.post(
+    "/predict/stream",
+    summary="Prédiction en flux (NDJSON, Arrow IPC)",
+    description="Prédit le prix au m² de biens envoyés en NDJSON ou Arrow IPC ; les résultats sont renvoyés "
+                "par morceaux pendant la lecture, au format demandé par Accept (NDJSON, Arrow IPC ou JSON).",
+    responses={200: {"content": {media_type: {} for media_type in streaming.MEDIA_TYPES.values()}},
+               406: {"description": "Format de réponse non servi"},
+               415: {"description": "Format de requête non pris en charge"}},
+    openapi_extra={"requestBody": {"required": True, "content": {
+        streaming.MEDIA_TYPES["ndjson"]: {"schema": {"type": "string"}},
+        streaming.MEDIA_TYPES["arrow"]: {"schema": {"type": "string", "format": "binary"}},
+    }}},
+)
+async def predict_stream(
+    request: Request,
+    quantiles: Optional[Tuple[float, ...]] = Depends(interval_quantiles)
+):
+    """
+    Prédit le prix au m² d'un flux de biens, sans garder la requête ni la réponse en mémoire.
+
+    Les lignes sont lues par morceaux de STREAM_CHUNK_ROWS, validées et prédites par
+    (ville, type_local) comme un batch, puis encodées et envoyées aussitôt. Chaque résultat porte
+    l'index de sa ligne dans la requête ; une ligne invalide renvoie une erreur sans arrêter le flux.
+
+    **Requête** (Content-Type) :
+    - **application/x-ndjson** : un objet par ligne, au format de /predict/batch ({ville, features})
+      ou à plat ({ville, type_local, surface_bati, surface_terrain, nombre_lots})
+    - **application/vnd.apache.arrow.stream** : colonnes ville, type_local, surface_bati,
+      surface_terrain (optionnelle), nombre_lots (nécessite pyarrow)
+
+    **Réponse** (Accept, par défaut le format de la requête) : NDJSON, Arrow IPC (colonnes index,
+    prix_m2_estime, quantiles, error) ou JSON (même forme que /predict/batch, sans les champs vides)
+    - **interval** / **quantiles** (query) : ajoute les quantiles des prédictions des arbres
+    """
+    input_format = streaming.media_format(request.headers.get("content-type"))
+    if input_format not in streaming.INPUT_FORMATS:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type attendu : {streaming.MEDIA_TYPES['ndjson']} ou {streaming.MEDIA_TYPES['arrow']}"
+        )
+    output_format = streaming.negotiate(request.headers.get("accept"), default=input_format)
+    if output_format is None:
+        raise HTTPException(
+            status_code=406,
+            detail=f"Formats de réponse servis : {', '.join(streaming.MEDIA_TYPES.values())}"
+        )
+    if "arrow" in (input_format, output_format) and not streaming.has_pyarrow():
+        raise HTTPException(
+            status_code=415 if input_format == "arrow" else 406,
+            detail="Le format Arrow IPC nécessite pyarrow (pip install pyarrow)"
+        )
+    # Une place sous une clé commune pour toute la durée du flux, libérée à la fin de son thread
+    submit = inference.reserve(("stream", "*"))
+    labels = [quantile_label(q) for q in quantiles] if quantiles is not None else []
+    return streaming.PredictionStream(
+        input_format, output_format, lambda chunk: predict_chunk(chunk, quantiles), labels,
+        chunk_rows=config.STREAM_CHUNK_ROWS, submit=submit
+    )
+
+# Statistiques du micro-batching pour régler la fenêtre d'attente
+@router.get(
+    "/predict/batching/stats",
+    summary="Statistiques du micro-batching",
+    description="Taille des batchs et temps d'attente en file du micro-batching des prédictions unitaires.",
+)
+async def batching_stats():
+    if micro_batcher is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "max_wait_ms": micro_batcher.max_wait * 1000,
+        "max_batch_size": micro_batcher.max_batch_size,
+        **micro_batcher.stats.to_dict()
+    }
+
+# Statistiques de l'exécuteur d'inférence et du contrôle d'admission
+@router.get(
+    "/predict/inference/stats",
+    summary="Statistiques de l'exécuteur d'inférence",
+    description="Prédictions en cours par modèle, rejets pour surcharge (429) et délais dépassés (503).",
+)
+async def inference_stats():
+    return inference.stats()
+
+# Statistiques du cache des prédictions
+@router.get(
+    "/predict/cache/stats",
+    summary="Statistiques du cache des prédictions",
+    description="Taille, hits, misses et évictions du cache des prédictions unitaires.",
+)
+async def cache_stats():
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, "model_version": model_loader.version, **prediction_cache.stats()}
+
+# Formate une erreur de validation d'un élément du batch en message lisible
+def format_item_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+            for err in error.errors()
+        )
+    return str(error)
+
+# Fonction utilitaire pour la prédiction batch
+# Valide chaque élément, regroupe par (ville, type_local) puis prédit chaque groupe d'un coup
+
+def predict_prices_batch(items: List[Dict[str, Any]],
+                         quantiles: Optional[Tuple[float, ...]] = None) -> List[Dict[str, Any]]:
+    """Prédit une liste d'éléments {ville, features} en conservant l'ordre d'entrée"""
+    results: List[Dict[str, Any]] = [None] * len(items)
+    groups = defaultdict(list)
+
+    # Validation du schéma élément par élément
+    started = time.perf_counter()
+    for index, item in enumerate(items):
+        try:
+            parsed = DynamicPredictionRequest.model_validate(item)
+            feature_processor.validate_ville(parsed.ville)
+        except (ValueError, TypeError) as e:
+            results[index] = {"index": index, "error": format_item_error(e)}
+            continue
+        groups[(parsed.ville.lower(), parsed.features.type_local)].append((index, parsed.features.model_dump()))
+
+    latency_metrics.observe("validation", MIXED_LABELS, time.perf_counter() - started)
+
+    # Une passe encodage/modèle par groupe, contrôles des valeurs vectorisés
+    for (ville, type_local), members in groups.items():
+        started = time.perf_counter()
+        X, row_errors = feature_processor.encode_batch([features for _, features in members])
+        latency_metrics.observe("encode", MIXED_LABELS, time.perf_counter() - started)
+        if row_errors:
+            for row, message in row_errors.items():
+                results[members[row][0]] = {"index": members[row][0], "error": message}
+            valid = np.ones(len(members), dtype=bool)
+            valid[list(row_errors)] = False
+            members = [member for member, ok in zip(members, valid) if ok]
+            X = X[valid]
+            if not members:
+                continue
+        try:
+            if quantiles is None:
+                predictions, bands = predict_prices(X, ville, type_local), None
+            else:
+                predictions, bands = predict_prices_quantiles(X, ville, type_local, quantiles)
+        except Exception as e:
+            logger.error("Error in batch prediction for %s/%s: %s", ville, type_local, e)
+            for index, _ in members:
+                results[index] = {"index": index, "error": str(e)}
+            continue
+        for row, ((index, _), prediction) in enumerate(zip(members, predictions)):
+            results[index] = {
+                "index": index,
+                "prix_m2_estime": round(float(prediction), 2),
+                "ville_modele": ville.capitalize(),
+                "model": "RandomForestRegressor",
+                "quantiles": quantile_dict(quantiles, bands[:, row]) if bands is not None else None,
+                "error": None
+            }
+
+    for result in results:
+        result.setdefault("error", None)
+    return results
+
+# Prédiction d'un morceau de flux : contrôles vectorisés sur tout le morceau,
+# puis une passe par (ville, type_local) comme un batch
+def predict_chunk(chunk: "streaming.FeatureChunk", quantiles: Optional[Tuple[float, ...]] = None
+                  ) -> Tuple[np.ndarray, Optional[np.ndarray], Dict[int, str]]:
+    """Retourne les prédictions (NaN en erreur), les quantiles (q, n) et {ligne: erreur}"""
+    n = len(chunk)
+    started = time.perf_counter()
+    errors = dict(chunk.errors)
+    for row, message in feature_processor.check_rows(chunk.X).items():
+        errors.setdefault(row, message)
+    lots = chunk.X[:, 2]
+    for row in np.flatnonzero(np.isfinite(lots) & (lots != np.round(lots))).tolist():
+        errors.setdefault(row, "nombre_lots doit être un entier")
+    villes = set(feature_processor.villes)
+    types_local = set(feature_processor.types_local)
+    for row, (ville, type_local) in enumerate(zip(chunk.villes.tolist(), chunk.types_local.tolist())):
+        if ville not in villes or type_local not in types_local:
+            try:
+                feature_processor.validate_ville(ville or "")
+                feature_processor.validate_type_local(type_local)
+            except ValueError as e:
+                errors.setdefault(row, str(e))
+    latency_metrics.observe("validation", MIXED_LABELS, time.perf_counter() - started)
+
+    predictions = np.full(n, np.nan)
+    bands = np.full((len(quantiles), n), np.nan) if quantiles is not None else None
+    valid = np.ones(n, dtype=bool)
+    valid[list(errors)] = False
+    keys = np.char.add(chunk.villes.astype(str), "/" + chunk.types_local.astype(str))
+    for key in np.unique(keys[valid]).tolist():
+        ville, type_local = key.split("/")
+        rows = np.flatnonzero(valid & (keys == key))
+        try:
+            if quantiles is None:
+                predictions[rows] = predict_prices(chunk.X[rows], ville, type_local)
+            else:
+                predictions[rows], bands[:, rows] = predict_prices_quantiles(chunk.X[rows], ville, type_local, quantiles)
+        except Exception as e:
+            logger.error("Error in stream prediction for %s/%s: %s", ville, type_local, e)
+            for row in rows.tolist():
+                errors[row] = str(e)
+    return predictions, bands, errors
+
+# Grille d'un sweep : valeurs de chaque axe et matrice (n_points, 3) des features brutes
+# (premier axe le plus lent), contrôlées comme un batch
+def build_sweep_grid(features_dict: Dict[str, Any], axes, ville: str) -> Tuple[List[np.ndarray], np.ndarray]:
+    started = time.perf_counter()
+    feature_processor.validate_ville(ville)
+    values = []
+    for axis in axes:
+        axis_values = (np.asarray(axis.values, dtype=np.float64) if axis.values is not None
+                       else axis.start + axis.step * np.arange(axis.size))
+        if axis.feature == "nombre_lots" and not np.array_equal(axis_values, np.round(axis_values)):
+            raise ValueError("Les valeurs de nombre_lots doivent être entières")
+        values.append(np.round(axis_values, 6))
+    X = np.repeat(encode_single(features_dict), math.prod(len(v) for v in values), axis=0)
+    for axis, grid in zip(axes, np.meshgrid(*values, indexing="ij")):
+        X[:, feature_processor.feature_keys.index(axis.feature)] = grid.ravel()
+    errors = feature_processor.check_rows(X)
+    if errors:
+        row, message = next(iter(errors.items()))
+        raise ValueError(f"Point {row} de la grille : {message}")
+    labels = metric_labels(ville, features_dict["type_local"])
+    latency_metrics.observe("encode", labels, time.perf_counter() - started)
+    return values, X
+
+def predict_sweep_grid(request: SweepRequest, quantiles: Optional[Tuple[float, ...]] = None) -> Dict[str, Any]:
+    ville, type_local = request.ville.lower(), request.features.type_local
+    values, X = build_sweep_grid(request.features.model_dump(), request.axes, ville)
+    if quantiles is None:
+        predictions, bands = predict_grid(X, ville, type_local), None
+    else:
+        predictions, bands = predict_prices_quantiles(X, ville, type_local, quantiles)
+    return {
+        "ville_modele": request.ville.capitalize(),
+        "model": "RandomForestRegressor",
+        "axes": {axis.feature: axis_values.tolist() for axis, axis_values in zip(request.axes, values)},
+        "shape": [len(axis_values) for axis_values in values],
+        "prix_m2_estime": np.round(predictions, 2).tolist(),
+        "quantiles": {
+            quantile_label(q): np.round(band, 2).tolist() for q, band in zip(quantiles, bands)
+        } if bands is not None else None,
+    }
+
+# Prédiction d'une grille de sweep : par la table de prédiction exacte du modèle si elle tient
+# dans le budget (SWEEP_USE_LOOKUP, mêmes résultats), sinon comme predict_prices
+def predict_grid(X: np.ndarray, ville: str, type_local: str) -> np.ndarray:
+    if config.SWEEP_USE_LOOKUP:
+        bundle = model_loader.get_bundle(ville=ville, type_local=type_local)
+        table = bundle.lookup_table(model_loader.lookup_max_bytes)
+        if table is not None:
+            started = time.perf_counter()
+            predictions = table.predict(X)
+            latency_metrics.observe("predict", (ville, type_local, bundle.version), time.perf_counter() - started)
+            return predictions
+    return predict_prices(X, ville, type_local)
+
+# Prédiction vectorisée pour plusieurs biens d'une même ville et d'un même type
+# Retourne les prix au m² à l'échelle réelle
+
+def predict_prices(X: np.ndarray, ville: str, type_local: str) -> np.ndarray:
+    """Prédit le prix au m² de chaque ligne de X (features brutes, forme (n, 3))"""
+    bundle = model_loader.get_bundle(ville=ville, type_local=type_local)
+    labels = (ville.lower(), type_local, bundle.version)
+    started = time.perf_counter()
+    if model_loader.engine == "lookup":
+        # Table de prédiction exacte ; si elle dépasse le budget, parcours des arbres ci-dessous
+        table = bundle.lookup_table(model_loader.lookup_max_bytes)
+        if table is not None:
+            predictions = table.predict(X)
+            latency_metrics.observe("predict", labels, time.perf_counter() - started)
+            return predictions
+    if bundle.artifact is not None:
+        # Artefact compact (mmap, jamais ouvert par le moteur sklearn) : scalers intégrés,
+        # mêmes résultats que sklearn
+        predictions = bundle.artifact.predict(X)
+        latency_metrics.observe("predict", labels, time.perf_counter() - started)
+        return predictions
+    if model_loader.engine == "native":
+        # Forêt compilée : scalers intégrés, pas de validation sklearn
+        predictions = bundle.compiled.predict(X)
+        latency_metrics.observe("predict", labels, time.perf_counter() - started)
+        return predictions
+    x_scaled = transform_features(bundle.scaler_x, X)
+    scaled = time.perf_counter()
+    y_scaled = bundle.model.predict(x_scaled).reshape(-1, 1)
+    predicted = time.perf_counter()
+    predictions = bundle.scaler_y.inverse_transform(y_scaled)[:, 0]
+    latency_metrics.observe("scale", labels, scaled - started)
+    latency_metrics.observe("predict", labels, predicted - scaled)
+    latency_metrics.observe("inverse_transform", labels, time.perf_counter() - predicted)
+    return predictions
+
+# Prédiction vectorisée avec intervalle : un seul parcours de la forêt donne la prédiction
+# de chaque arbre, dont on tire les quantiles demandés (à l'échelle réelle, après scaler_y)
+
+def predict_prices_quantiles(X: np.ndarray, ville: str, type_local: str,
+                             quantiles: Tuple[float, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """Prix au m² prédits (n,) et quantiles des prédictions des arbres (len(quantiles), n)"""
+    bundle = model_loader.get_bundle(ville=ville, type_local=type_local)
+    labels = (ville.lower(), type_local, bundle.version)
+    started = time.perf_counter()
+    if bundle.artifact is not None or model_loader.engine == "native":
+        forest = bundle.artifact if bundle.artifact is not None else bundle.compiled
+        predictions, tree_values = forest.predict_trees(X)
+        traversed = time.perf_counter()
+        latency_metrics.observe("predict", labels, traversed - started)
+    else:
+        # Prédiction sklearn inchangée ; prédictions des arbres par la forêt compilée
+        # (parcours compté dans l'étape quantiles : c'est le surcoût de l'intervalle)
+        predictions = predict_prices(X, ville, type_local)
+        traversed = time.perf_counter()
+        _, tree_values = bundle.compiled.predict_trees(X)
+    bands = tree_quantiles(tree_values, quantiles)
+    latency_metrics.observe("quantiles", labels, time.perf_counter() - traversed)
+    return predictions, bands
+
+# Prédiction unitaire utilisée par les endpoints
+# Regarde d'abord dans le cache, puis calcule dans le pool d'inférence ou le micro-batcher
+
+async def predict_price_async(features: PredictionRequest, ville: str) -> float:
+    handler_started()
+    features_dict = features.model_dump()
+    cache_key = None
+    if prediction_cache is not None:
+        cache_key = PredictionCache.make_key(
+            ville, features.type_local, model_loader.version, features_dict
+        )
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            handler_finished(metric_labels(ville, features.type_local))
+            return cached
+
+    # Calcul dans le pool d'inférence (ou le micro-batcher), sous la limite et le délai du modèle
+    model_key = (ville.lower(), features.type_local)
+    if micro_batcher is None:
+        prediction = await inference.run(model_key, predict_price, features, ville, features_dict)
+    else:
+        X = validate_and_encode(features_dict, ville)
+        prediction = await inference.run_awaitable(
+            model_key, micro_batcher.submit(ville.lower(), features.type_local, X[0].tolist())
+        )
+
+    if cache_key is not None:
+        prediction_cache.put(cache_key, prediction)
+    handler_finished(metric_labels(ville, features.type_local))
+    return prediction
+
+# Prédiction unitaire avec intervalle, sans cache ni micro-batching
+# (la réponse dépend des quantiles demandés)
+
+async def predict_interval_async(features: PredictionRequest, ville: str,
+                                 quantiles: Tuple[float, ...]) -> Tuple[float, Dict[str, float]]:
+    handler_started()
+    result = await inference.run(
+        (ville.lower(), features.type_local), predict_price_interval, features, ville, features.model_dump(), quantiles
+    )
+    handler_finished(metric_labels(ville, features.type_local))
+    return result
+
+def predict_price_interval(features: PredictionRequest, ville: str, features_dict: Dict[str, Any],
+                           quantiles: Tuple[float, ...]) -> Tuple[float, Dict[str, float]]:
+    X = validate_and_encode(features_dict, ville)
+    predictions, bands = predict_prices_quantiles(X, ville, features.type_local, quantiles)
+    return float(predictions[0]), quantile_dict(quantiles, bands[:, 0])
+
+# Prédiction ponctuelle, ou avec intervalle si des quantiles sont demandés
+async def predict_single(features: PredictionRequest, ville: str,
+                         quantiles: Optional[Tuple[float, ...]] = None) -> Tuple[float, Optional[Dict[str, float]]]:
+    if quantiles is None:
+        return await predict_price_async(features, ville), None
+    return await predict_interval_async(features, ville, quantiles)
 
 # Fonction utilitaire pour faire la prédiction
 # Elle est utilisée par tous les endpoints ci-dessus
 # Elle prend les données de l'utilisateur et la ville, et retourne le prix prédit
 
-def predict_price(features: PredictionRequest, ville: str) -> float:
+def predict_price(features: PredictionRequest, ville: str, features_dict: Dict[str, Any] = None) -> float:
     """Fonction utilitaire pour la prédiction"""
     try:
-        # Vérifie que la ville est correcte
-        feature_processor.validate_ville(ville)
-        
-        logger.debug(f"Starting prediction for {ville} with features: {features}")
+        # Trace de debug : un seul test de niveau, rien n'est formaté si elle est désactivée
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Starting prediction for %s with features: %r", ville, features)
 
-        # Récupère le bon modèle/scaler selon la ville et le type de bien
-        logger.debug("Getting model and scalers...")
-        model, scaler_x, scaler_y, _ = model_loader.get_model_and_scalers(
-            ville=ville,
-            type_local=features.type_local
-        )
-        
-        # Prépare les données utilisateur pour le modèle
-        logger.debug("Preparing features...")
-        X = feature_processor.prepare_features_for_prediction(features.model_dump())
-        logger.debug(f"Prepared features shape: {X.shape}")
-
-        # Met à l'échelle les données comme lors de l'entraînement
-        logger.debug("Scaling features...")
-        x_scaled = scaler_x.transform(X)
-        logger.debug(f"Scaled features shape: {x_scaled.shape}")
-
-        # Fait la prédiction (prix au m², mais encore à l'échelle du modèle)
-        logger.debug("Making prediction...")
-        y_scaled = model.predict(x_scaled).reshape(-1, 1)
-        logger.debug(f"Raw prediction: {y_scaled}")
-
-        # Remet la prédiction à l'échelle réelle
-        logger.debug("Inverse transforming prediction...")
-        final_prediction = float(scaler_y.inverse_transform(y_scaled)[0][0])
-        logger.debug(f"Final prediction: {final_prediction}")
+        # Vérifie la ville et prépare les données utilisateur pour le modèle
+        X = validate_and_encode(features_dict if features_dict is not None else features.model_dump(), ville)
+
+        # Mise à l'échelle, prédiction et retour à l'échelle réelle (mesurés par étape)
+        final_prediction = float(predict_prices(X, ville, features.type_local)[0])
+        if debug:
+            logger.debug("Final prediction for %s: %s (features %s)", ville, final_prediction, X[0].tolist())
 
         return final_prediction
 
     except Exception as e:
-        logger.error(f"Error in predict_price: {str(e)}")
+        logger.error("Error in predict_price: %s", e)
         raise
\ No newline at end of file
@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import Optional
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .. import config
+from ..market_stats import MarketStatsService
+from ..schemas.schemas import MarketStatsResponse
+from ..training import DATA_PATH
+from .predict import parse_quantiles
+
+# Logger du module
+logger = logging.getLogger(__name__)
+
+# Service partagé, créé au démarrage (init_service) et non à l'import du module
+service: MarketStatsService = None
+
+def init_service() -> None:
+    """Crée le service des statistiques pour les villes de MARKET_STATS_VILLES"""
+    global service
+    if service is None:
+        villes = [ville.strip() for ville in config.MARKET_STATS_VILLES.split(",") if ville.strip()]
+        service = MarketStatsService(villes, Path(config.MARKET_STATS_DIR) if config.MARKET_STATS_DIR else DATA_PATH)
+
+def startup() -> None:
+    """Calcule les statistiques au démarrage ; en cas d'échec, calculées à la première requête"""
+    try:
+        init_service()
+        service.refresh()
+    except Exception as e:
+        logger.error("Statistiques de marché non calculées : %s", e)
+
+# Dépendance des routes : garantit que le service est initialisé
+def ensure_service() -> None:
+    if service is None:
+        init_service()
+
+# Création du routeur FastAPI pour les routes des statistiques
+router = APIRouter(dependencies=[Depends(ensure_service)])
+
+# Route : prix au m² (moyenne, quantiles) et tendance mensuelle, lus dans les tableaux précalculés
+@router.get("/stats", response_model=MarketStatsResponse)
+def market_stats(
+    ville: str = Query(..., description="Ville (lille, bordeaux)"),
+    code_postal: Optional[int] = Query(None, description="Code postal (défaut : tous)"),
+    type_local: Optional[str] = Query(None, description="Type de bien, ex : Appartement (défaut : tous)"),
+    nombre_pieces: Optional[int] = Query(None, ge=0, description="Nombre de pièces principales (défaut : tous)"),
+    quantiles: Optional[str] = Query(None, description="Quantiles à renvoyer, ex : 0.05,0.5,0.95"),
+):
+    try:
+        requested = parse_quantiles(quantiles) if quantiles is not None else None
+        result = service.get(ville).lookup(code_postal, type_local, nombre_pieces, requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Aucune vente pour ces critères")
+    return result
+
+# Route : intègre les nouveaux exports DVF (<ville>_*.csv) sans recalculer les groupes inchangés
+@router.post("/stats/refresh")
+def market_stats_refresh():
+    return {"loaded": service.refresh(), "villes": service.info()}
+
+# Route : ventes, groupes et taille des statistiques de chaque ville
+@router.get("/stats/info")
+def market_stats_info():
+    return {"villes": service.info()}
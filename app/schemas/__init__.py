@@ -1,3 +1,9 @@
-from .schemas import PredictionRequest, PredictionResponse, DynamicPredictionRequest, PredictionFeatures
+from .schemas import (
+    PredictionRequest, PredictionResponse, DynamicPredictionRequest, PredictionFeatures,
+    BatchPredictionRequest, BatchPredictionResult, BatchPredictionResponse
+)
 
-__all__ = ['PredictionRequest', 'PredictionResponse', 'DynamicPredictionRequest', 'PredictionFeatures']
\ No newline at end of file
+__all__ = [
+    'PredictionRequest', 'PredictionResponse', 'DynamicPredictionRequest', 'PredictionFeatures',
+    'BatchPredictionRequest', 'BatchPredictionResult', 'BatchPredictionResponse'
+]
\ No newline at end of file
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import Literal
+import math
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import Any, Dict, List, Literal, Optional
 
 # Schéma pour les requêtes de prédiction directe
 class PredictionRequest(BaseModel):
@@ -25,7 +26,140 @@ class DynamicPredictionRequest(BaseModel):
     features: PredictionFeatures
 
 # Schéma pour la réponse de prédiction
+# quantiles : seulement avec ?interval=true ou ?quantiles=..., ex {"p10": ..., "p50": ..., "p90": ...}
 class PredictionResponse(BaseModel):
     prix_m2_estime: float
     ville_modele: str
-    model: str
\ No newline at end of file
+    model: str
+    quantiles: Optional[Dict[str, float]] = None
+
+# Schéma pour une requête batch : liste d'éléments au format DynamicPredictionRequest
+# Les éléments sont validés un par un pour qu'une erreur ne fasse pas échouer tout le batch
+class BatchPredictionRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(
+        ..., min_length=1, max_length=10000,
+        description="Liste de biens au format {ville, features} (10000 éléments maximum)"
+    )
+
+# Résultat d'un élément du batch : soit une prédiction, soit une erreur
+class BatchPredictionResult(BaseModel):
+    index: int
+    prix_m2_estime: Optional[float] = None
+    ville_modele: Optional[str] = None
+    model: Optional[str] = None
+    quantiles: Optional[Dict[str, float]] = None
+    error: Optional[str] = None
+
+# Schéma pour la réponse batch (résultats dans l'ordre des éléments reçus)
+class BatchPredictionResponse(BaseModel):
+    results: List[BatchPredictionResult]
+    n_success: int
+    n_errors: int
+
+# Axe d'un sweep : feature à faire varier et ses valeurs, en liste ou de start à stop (inclus) par pas de step
+class SweepAxis(BaseModel):
+    # Infinity / NaN refusés (le JSON de Python les accepte) : la taille de la grille doit être calculable
+    model_config = ConfigDict(allow_inf_nan=False)
+
+    feature: Literal["surface_bati", "surface_terrain", "nombre_lots"]
+    values: Optional[List[float]] = Field(None, min_length=1, description="Valeurs explicites de la feature")
+    start: Optional[float] = Field(None, description="Première valeur")
+    stop: Optional[float] = Field(None, description="Dernière valeur (incluse si atteinte par le pas)")
+    step: Optional[float] = Field(None, gt=0, description="Pas entre deux valeurs")
+
+    @model_validator(mode="after")
+    def validate_range(self):
+        if self.values is None:
+            if self.start is None or self.stop is None or self.step is None:
+                raise ValueError("Donner values, ou start, stop et step")
+            if self.stop < self.start:
+                raise ValueError("stop doit être supérieur ou égal à start")
+            if not math.isfinite((self.stop - self.start) / self.step):
+                raise ValueError("Trop de valeurs entre start et stop pour ce pas")
+        elif self.start is not None or self.stop is not None or self.step is not None:
+            raise ValueError("values et start/stop/step sont exclusifs")
+        return self
+
+    @property
+    def size(self) -> int:
+        # Nombre de valeurs, calculé sans construire la liste (contrôle de la taille de la grille)
+        if self.values is not None:
+            return len(self.values)
+        return math.floor((self.stop - self.start) / self.step + 1e-9) + 1
+
+# Schéma pour un sweep : prédictions d'un bien en faisant varier une ou deux features
+class SweepRequest(BaseModel):
+    ville: Literal["lille", "bordeaux"]
+    features: PredictionFeatures
+    axes: List[SweepAxis] = Field(..., min_length=1, max_length=2, description="Une ou deux features à faire varier")
+
+    @field_validator("axes")
+    def validate_axes(cls, v):
+        if len({axis.feature for axis in v}) != len(v):
+            raise ValueError("Chaque feature ne peut varier que sur un axe")
+        return v
+
+# Réponse d'un sweep : valeurs de chaque axe et prix au m² de la grille, à plat (premier axe
+# le plus lent, prix[i * len(axe 2) + j] pour deux axes), avec les quantiles si demandés
+class SweepResponse(BaseModel):
+    ville_modele: str
+    model: str
+    axes: Dict[str, List[float]]
+    shape: List[int]
+    prix_m2_estime: List[float]
+    quantiles: Optional[Dict[str, List[float]]] = None
+
+# Schéma d'une recherche de ventes comparables (features du modèle, filtres optionnels)
+class ComparablesQuery(BaseModel):
+    ville: Literal["lille", "bordeaux"]
+    type_local: Literal["Appartement", "Maison"]
+    surface_bati: float = Field(..., gt=0, le=10000, description="Surface bâtie (entre 0 et 10000 m²)")
+    surface_terrain: float = Field(0, ge=0, le=10000, description="Surface terrain (entre 0 et 10000 m²)")
+    nombre_lots: int = Field(0, ge=0, le=100, description="Nombre de lots (entre 0 et 100)")
+    k: int = Field(5, ge=1, le=50, description="Nombre de ventes renvoyées (entre 1 et 50)")
+    code_postal: Optional[int] = Field(None, description="Restreint aux ventes de ce code postal")
+    section: Optional[str] = Field(None, max_length=5, description="Restreint aux ventes de cette section cadastrale")
+
+# Schéma pour une requête de comparables (une ou plusieurs recherches)
+class ComparablesRequest(BaseModel):
+    queries: List[ComparablesQuery] = Field(
+        ..., min_length=1, max_length=1000, description="Recherches (1000 maximum)"
+    )
+
+# Vente DVF comparable ; distance : écart des features mises à l'échelle
+class ComparableSale(BaseModel):
+    date_mutation: Optional[str] = None
+    valeur_fonciere: float
+    prix_m2: float
+    surface_bati: float
+    surface_terrain: float
+    nombre_lots: int
+    nombre_pieces: Optional[int] = None
+    code_postal: Optional[int] = None
+    section: Optional[str] = None
+    distance: float
+
+# Résultat d'une recherche : ventes de la plus proche à la plus lointaine
+class ComparablesResult(BaseModel):
+    index: int
+    comparables: List[ComparableSale]
+
+# Schéma pour la réponse (résultats dans l'ordre des recherches reçues)
+class ComparablesResponse(BaseModel):
+    results: List[ComparablesResult]
+
+# Prix médian et nombre de ventes d'un mois ("AAAA-MM")
+class MonthlyMarketStat(BaseModel):
+    month: str
+    count: int
+    median: float
+
+# Statistiques de marché d'un groupe (None : toutes les valeurs de la dimension)
+class MarketStatsResponse(BaseModel):
+    ville: str
+    code_postal: Optional[int] = None
+    type_local: Optional[str] = None
+    nombre_pieces: Optional[int] = None
+    count: int
+    prix_m2: Dict[str, float] = Field(..., description="Moyenne (mean) et quantiles (p10, p50...) du prix au m²")
+    monthly: List[MonthlyMarketStat]
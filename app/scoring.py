@@ -0,0 +1,279 @@
+"""
+Scoring en masse d'un export DVF (même format que data/lille_2022.csv).
+
+Usage : python -m app.scoring data/lille_2022.csv -o predictions.csv [--chunksize 200000]
+
+Le CSV est lu par morceaux, uniquement sur les colonnes utiles et avec des types compacts.
+Chaque morceau est filtré, encodé, prédit puis écrit immédiatement (CSV ou Parquet) :
+la mémoire reste constante quelle que soit la taille du fichier d'entrée.
+
+Avec --workers N, les morceaux sont scorés par un pool de N processus. Les forêts compilées
+sont exportées une fois en .npy et ouvertes en mémoire partagée (mmap) par chaque processus,
+au lieu de dépickler une copie des modèles par processus.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from . import config
+from .models.forest import CompiledForest
+from .logging_setup import setup_logging
+from .models.model_loader import ENGINES, ModelLoader
+from .utils import FeatureProcessor
+
+logger = logging.getLogger(__name__)
+
+# Colonnes DVF lues et leurs types (catégories pour les textes répétés)
+DVF_DTYPES = {
+    "Commune": "category",
+    "Code postal": "float32",
+    "Type local": "category",
+    "Nombre pieces principales": "float32",
+    "Surface reelle bati": "float64",
+    "Surface terrain": "float64",
+    "Nombre de lots": "float64",
+}
+TYPES_LOCAL = ("Appartement", "Maison")
+
+# Écriture des prédictions morceau par morceau (CSV, ou Parquet si pyarrow est installé)
+class PredictionWriter:
+    def __init__(self, path: Path, fmt: Optional[str] = None):
+        self.path = Path(path)
+        self.fmt = fmt or ("parquet" if self.path.suffix == ".parquet" else "csv")
+        if self.fmt not in ("csv", "parquet"):
+            raise ValueError(f"Format de sortie inconnu : {self.fmt}")
+        self._parquet_writer = None
+        self._header_written = False
+        if self.fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise RuntimeError("La sortie Parquet nécessite pyarrow (pip install pyarrow)")
+
+    def write(self, df) -> None:
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self._header_written else "w",
+                      header=not self._header_written, index=False)
+            self._header_written = True
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        self._parquet_writer.write_table(table)
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self.fmt == "csv" and not self._header_written:
+            self.path.write_text("")
+
+def read_dvf_chunks(path: Path, chunksize: int) -> Iterator:
+    # Lecture par morceaux des seules colonnes utiles
+    import pandas as pd
+    return pd.read_csv(path, usecols=list(DVF_DTYPES), dtype=DVF_DTYPES, chunksize=chunksize)
+
+def peak_rss_mb() -> float:
+    # Pic de mémoire résidente du processus (ru_maxrss est en Ko sous Linux, en octets sous macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def score_chunk(chunk, model_loader: ModelLoader, feature_processor: FeatureProcessor,
+                villes, ville: Optional[str] = None, pieces: Optional[int] = None):
+    """Filtre, encode et prédit un morceau du CSV ; retourne le DataFrame des prédictions"""
+    import pandas as pd
+    chunk = chunk[chunk["Type local"].isin(TYPES_LOCAL)]
+    if pieces is not None:
+        chunk = chunk[chunk["Nombre pieces principales"] == pieces]
+    villes_chunk = (
+        pd.Series(ville.lower(), index=chunk.index) if ville
+        else chunk["Commune"].astype(str).str.lower()
+    )
+    chunk = chunk[villes_chunk.isin(villes)]
+    villes_chunk = villes_chunk[chunk.index]
+
+    X = np.column_stack([
+        chunk["Surface reelle bati"].to_numpy(dtype=np.float64),
+        chunk["Surface terrain"].fillna(0).to_numpy(dtype=np.float64),
+        chunk["Nombre de lots"].to_numpy(dtype=np.float64),
+    ])
+    valid = np.ones(len(chunk), dtype=bool)
+    valid[list(feature_processor.check_rows(X))] = False
+
+    predictions = np.full(len(chunk), np.nan)
+    type_local = chunk["Type local"].astype(str).to_numpy()
+    villes_array = villes_chunk.to_numpy()
+    # Une prédiction vectorisée par (ville, type_local) présent dans le morceau
+    for (v, t) in set(zip(villes_array[valid], type_local[valid])):
+        mask = valid & (villes_array == v) & (type_local == t)
+        predictions[mask] = _predict(model_loader, feature_processor, X[mask], v, t)
+
+    out = pd.DataFrame({
+        "ligne": chunk.index.to_numpy(),
+        "ville": villes_array,
+        "code_postal": chunk["Code postal"].astype("Int32").to_numpy(),
+        "type_local": type_local,
+        "surface_bati": X[:, 0],
+        "surface_terrain": X[:, 1],
+        "nombre_lots": X[:, 2],
+        "prix_m2_estime": np.round(predictions, 2),
+    })
+    return out[valid]
+
+def _predict(model_loader: ModelLoader, feature_processor: FeatureProcessor, X: np.ndarray,
+             ville: str, type_local: str) -> np.ndarray:
+    if model_loader.engine == "native":
+        return model_loader.get_compiled_model(type_local, ville).predict(X)
+    if model_loader.engine == "lookup":
+        table = model_loader.get_lookup_table(type_local, ville)
+        if table is not None:
+            return table.predict(X)
+    # Artefact compact, sauf avec le moteur sklearn (bundle sans artefact)
+    artifact = model_loader.get_bundle(type_local, ville).artifact
+    if artifact is not None:
+        return artifact.predict(X)
+    import pandas as pd
+    model, scaler_x, scaler_y, _ = model_loader.get_model_and_scalers(type_local, ville)
+    x_scaled = scaler_x.transform(pd.DataFrame(X, columns=feature_processor.model_features))
+    return scaler_y.inverse_transform(model.predict(x_scaled).reshape(-1, 1))[:, 0]
+
+# Forêts compilées ouvertes en lecture seule depuis des .npy (mmap), une fois par processus
+class SharedModels:
+    engine = "native"
+
+    def __init__(self, paths: Dict[Tuple[str, str], str]):
+        self.paths = paths
+        self._forests = {}
+
+    @property
+    def villes(self):
+        return {ville for ville, _ in self.paths}
+
+    def get_compiled_model(self, type_local: str, ville: str = None) -> CompiledForest:
+        key = (ville, type_local)
+        if key not in self._forests:
+            self._forests[key] = CompiledForest.load(self.paths[key], mmap_mode="r")
+        return self._forests[key]
+
+def export_shared_models(model_loader: ModelLoader, directory: Path) -> Dict[Tuple[str, str], str]:
+    # Exporte la forêt compilée de chaque modèle actif (une seule fois si partagée entre villes)
+    paths, saved = {}, {}
+    for entry in model_loader.entries.values():
+        if not entry.active:
+            continue
+        forest = model_loader.get_compiled_model(entry.type_local, entry.ville)
+        if id(forest) not in saved:
+            path = Path(directory) / f"{entry.ville}_{entry.type_local}_{entry.version}"
+            forest.save(path)
+            saved[id(forest)] = str(path)
+        paths[(entry.ville, entry.type_local)] = saved[id(forest)]
+    return paths
+
+# Modèles du processus de scoring (initialisés par _init_worker)
+_worker_models: Optional[SharedModels] = None
+
+def _init_worker(paths: Dict[Tuple[str, str], str]) -> None:
+    global _worker_models
+    _worker_models = SharedModels(paths)
+
+def _score_shard(chunk, ville: Optional[str], pieces: Optional[int]):
+    return score_chunk(chunk, _worker_models, FeatureProcessor(), _worker_models.villes, ville, pieces)
+
+def score_csv(input_path: Path, output_path: Path, chunksize: int = 200_000, ville: Optional[str] = None,
+              pieces: Optional[int] = None, engine: Optional[str] = None, fmt: Optional[str] = None,
+              model_loader: Optional[ModelLoader] = None, workers: int = 1) -> Dict[str, float]:
+    """Score un CSV DVF en flux et retourne le rapport (lignes, débit, pic de mémoire)"""
+    started = time.perf_counter()
+    if workers > 1:
+        # Le mode parallèle partage les forêts compilées : moteur natif obligatoire
+        engine = "native"
+    elif engine is None:
+        # Même moteur que l'API par défaut : mêmes prédictions, au bit près
+        engine = config.PREDICT_ENGINE
+    model_loader = model_loader or ModelLoader(engine=engine)
+    writer = PredictionWriter(output_path, fmt)
+    try:
+        if workers > 1:
+            rows_read, rows_scored = _score_parallel(input_path, chunksize, ville, pieces, model_loader, writer, workers)
+        else:
+            rows_read, rows_scored = _score_sequential(input_path, chunksize, ville, pieces, model_loader, writer)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "rows_read": rows_read,
+        "rows_scored": rows_scored,
+        "rows_skipped": rows_read - rows_scored,
+        "workers": workers,
+        "seconds": elapsed,
+        "rows_per_second": rows_read / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def _score_sequential(input_path, chunksize, ville, pieces, model_loader, writer):
+    feature_processor = FeatureProcessor()
+    villes = {entry.ville for entry in model_loader.entries.values()}
+    rows_read = rows_scored = 0
+    for chunk in read_dvf_chunks(input_path, chunksize):
+        rows_read += len(chunk)
+        scored = score_chunk(chunk, model_loader, feature_processor, villes, ville, pieces)
+        rows_scored += len(scored)
+        writer.write(scored)
+    return rows_read, rows_scored
+
+def _score_parallel(input_path, chunksize, ville, pieces, model_loader, writer, workers):
+    # Au plus 2 morceaux en vol par processus : la mémoire reste bornée
+    # et les résultats sont écrits dans l'ordre de lecture
+    rows_read = rows_scored = 0
+    with tempfile.TemporaryDirectory(prefix="dvf-models-") as shared_dir:
+        paths = export_shared_models(model_loader, Path(shared_dir))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(paths,)) as pool:
+            pending = deque()
+            for chunk in read_dvf_chunks(input_path, chunksize):
+                rows_read += len(chunk)
+                pending.append(pool.submit(_score_shard, chunk, ville, pieces))
+                if len(pending) >= 2 * workers:
+                    scored = pending.popleft().result()
+                    rows_scored += len(scored)
+                    writer.write(scored)
+            while pending:
+                scored = pending.popleft().result()
+                rows_scored += len(scored)
+                writer.write(scored)
+    return rows_read, rows_scored
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Scoring en masse d'un export DVF")
+    parser.add_argument("input", type=Path, help="Fichier CSV DVF")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="Fichier de sortie (.csv ou .parquet)")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Format de sortie (déduit de l'extension)")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="Nombre de lignes lues par morceau")
+    parser.add_argument("--ville", help="Force le modèle d'une ville (sinon déduite de la colonne Commune)")
+    parser.add_argument("--pieces", type=int, help="Ne garde que les biens avec ce nombre de pièces")
+    parser.add_argument("--engine", choices=ENGINES,
+                        help="Moteur d'inférence (défaut : PREDICT_ENGINE, comme l'API ; native avec --workers)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus de scoring (0 = nombre de cœurs)")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    workers = args.workers or os.cpu_count() or 1
+    report = score_csv(args.input, args.output, args.chunksize, args.ville, args.pieces, args.engine, args.format,
+                       workers=workers)
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
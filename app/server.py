@@ -0,0 +1,322 @@
+"""
+Lancement multi-workers avec modèles préchargés et partagés entre les workers.
+
+Usage : python -m app.server --host 0.0.0.0 --port 8000 --workers 4 [--max-requests 10000]
+
+Avec `uvicorn --workers N`, chaque worker importe l'application et charge ses propres modèles :
+la mémoire et le temps de démarrage croissent avec le nombre de workers. Ici, le processus parent
+importe l'application et charge tout ce que charge le lifespan (modèles, tables de prédiction,
+FeatureProcessor, index des comparables, statistiques de marché), puis crée les workers par fork :
+ils démarrent sans rien recharger et partagent ces pages en copy-on-write.
+
+Pour que les pages restent partagées :
+- gc.freeze() après le chargement place les objets existants dans une génération permanente : le
+  ramasse-miettes des workers ne les parcourt plus et n'écrit plus dans leurs en-têtes ;
+- les données des tableaux numpy (nœuds des arbres, tables, index) sont hors de l'objet Python :
+  les compteurs de références modifiés à l'usage ne salissent que la page de l'en-tête ;
+- les artefacts .forest sont ouverts en mmap : pages du cache disque, partagées dans tous les cas.
+
+Le parent ne sert pas de requêtes : il remplace les workers arrêtés par un nouveau fork (sans
+rechargement), recycle un worker (arrêt gracieux, requêtes en cours terminées) après
+--max-requests requêtes ou quand sa mémoire privée dépasse --max-worker-uss-mb, et logge la
+mémoire de chaque worker. SIGHUP recycle tous les workers, SIGTERM / SIGINT arrêtent le serveur.
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+
+from . import config
+from .memory import SERVER_PID_ENV, WORKER_ID_ENV, process_memory
+
+logger = logging.getLogger(__name__)
+
+# Intervalle de surveillance des workers par le parent (secondes)
+POLL_INTERVAL = 0.2
+# Intervalle de vérification de la mémoire privée des workers (--max-worker-uss-mb)
+MEMORY_CHECK_INTERVAL = 5.0
+# Un worker arrêté avant cette durée n'est relancé qu'après ce délai (évite une boucle de crash)
+MIN_WORKER_LIFETIME = 1.0
+# Délai laissé aux connexions tout juste acceptées pour envoyer leur requête à l'arrêt d'un worker
+ACCEPT_DRAIN_SECONDS = 0.2
+
+def preload() -> None:
+    """Charge dans le processus courant ce que charge le lifespan, puis gèle le ramasse-miettes"""
+    from .routes import comparables, predict, stats
+    started = time.perf_counter()
+    predict.startup()
+    comparables.startup()
+    stats.startup()
+    predict.before_fork()
+    # Objets chargés exclus du ramasse-miettes : pas d'écriture dans leurs pages après fork
+    gc.collect()
+    gc.freeze()
+    logger.info("Préchargement terminé en %.3fs (%d objets gelés)", time.perf_counter() - started,
+                gc.get_freeze_count())
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    # Socket d'écoute ouvert par le parent et partagé par tous les workers
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+# Serveur uvicorn d'un worker : à l'arrêt, uvicorn ferme les connexions sans requête en cours,
+# y compris celles acceptées juste avant (le client reçoit alors un reset pendant un recyclage)
+class WorkerServer(uvicorn.Server):
+    async def shutdown(self, sockets=None) -> None:
+        # Plus de nouvelles connexions, puis délai pour recevoir la requête des connexions acceptées
+        for server in self.servers:
+            server.close()
+        await asyncio.sleep(ACCEPT_DRAIN_SECONDS)
+        await super().shutdown(sockets)
+
+@dataclass
+class Worker:
+    pid: int
+    worker_id: int
+    started: float
+    # Date limite de l'arrêt gracieux (None : worker actif)
+    deadline: Optional[float] = None
+
+# Processus parent : crée, surveille et recycle les workers
+class PreforkServer:
+    def __init__(self, app: Any, sock: socket.socket, workers: int, max_requests: int = 0,
+                 max_requests_jitter: int = 0, max_worker_uss_mb: float = 0, graceful_timeout: float = 30,
+                 memory_report_interval: float = 60):
+        self.app = app
+        self.sock = sock
+        self.n_workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_worker_uss = int(max_worker_uss_mb * 1024 * 1024)
+        self.graceful_timeout = graceful_timeout
+        self.memory_report_interval = memory_report_interval
+        self.pid = os.getpid()
+        self.workers: Dict[int, Worker] = {}
+        self._restart_after: Dict[int, float] = {}
+        self._stopping = False
+        self._reloading = False
+
+    def spawn(self, worker_id: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self._run_worker(worker_id)
+                code = 0
+            except BaseException:
+                logger.exception("Worker %d arrêté sur erreur", worker_id)
+            finally:
+                os._exit(code)
+        self.workers[pid] = Worker(pid, worker_id, time.monotonic())
+        logger.info("Worker %d démarré (pid %d)", worker_id, pid)
+        return pid
+
+    def _run_worker(self, worker_id: int) -> None:
+        from . import main
+        from .routes import predict
+        # Signaux du parent remis par défaut (uvicorn installe ses gestionnaires de SIGTERM / SIGINT)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        os.environ[SERVER_PID_ENV] = str(self.pid)
+        os.environ[WORKER_ID_ENV] = str(worker_id)
+        # Logs du parent retirés : le lifespan installe l'écriture en arrière-plan du worker
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        random.seed()
+        # Démarrage du worker mesuré depuis le fork (rien n'est importé ni chargé)
+        main._import_started = time.perf_counter()
+        predict.after_fork()
+        server = WorkerServer(uvicorn.Config(
+            self.app,
+            lifespan="on",
+            # Requêtes déjà loggées par AccessLogMiddleware
+            access_log=False,
+            limit_max_requests=self.max_requests or None,
+            limit_max_requests_jitter=self.max_requests_jitter,
+            timeout_graceful_shutdown=int(self.graceful_timeout) or None,
+        ))
+        server.run(sockets=[self.sock])
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame) -> None:
+        self._reloading = True
+
+    def run(self) -> int:
+        """Boucle du parent, jusqu'à SIGTERM / SIGINT"""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        for worker_id in range(self.n_workers):
+            self.spawn(worker_id)
+        next_memory_check = time.monotonic() + MEMORY_CHECK_INTERVAL
+        next_report = time.monotonic() + self.memory_report_interval
+        while not self._stopping:
+            self._reap()
+            if self._reloading:
+                self._reloading = False
+                logger.info("SIGHUP : recyclage de tous les workers")
+                for worker in self.active_workers():
+                    self.recycle(worker)
+            self._replace_missing()
+            self._kill_overdue()
+            now = time.monotonic()
+            if self.max_worker_uss and now >= next_memory_check:
+                next_memory_check = now + MEMORY_CHECK_INTERVAL
+                self._check_memory()
+            if self.memory_report_interval and now >= next_report:
+                next_report = now + self.memory_report_interval
+                self.log_memory()
+            time.sleep(POLL_INTERVAL)
+        self.shutdown()
+        return 0
+
+    def active_workers(self) -> List[Worker]:
+        return [worker for worker in self.workers.values() if worker.deadline is None]
+
+    def recycle(self, worker: Worker) -> None:
+        # Remplaçant lancé d'abord : il accepte les connexions pendant que l'ancien termine les siennes
+        worker.deadline = time.monotonic() + self.graceful_timeout
+        self.spawn(worker.worker_id)
+        self._signal(worker.pid, signal.SIGTERM)
+
+    def _reap(self) -> None:
+        # Workers terminés (requêtes max atteintes, recyclage, erreur)
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if worker.deadline is None:
+                logger.info("Worker %d (pid %d) arrêté (code %d), remplacé", worker.worker_id, pid, code)
+                if time.monotonic() - worker.started < MIN_WORKER_LIFETIME:
+                    self._restart_after[worker.worker_id] = time.monotonic() + MIN_WORKER_LIFETIME
+
+    def _replace_missing(self) -> None:
+        running = {worker.worker_id for worker in self.active_workers()}
+        for worker_id in range(self.n_workers):
+            if worker_id not in running and time.monotonic() >= self._restart_after.get(worker_id, 0):
+                self._restart_after.pop(worker_id, None)
+                self.spawn(worker_id)
+
+    def _kill_overdue(self) -> None:
+        # Arrêt gracieux trop long : SIGKILL
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.deadline is not None and now > worker.deadline:
+                logger.warning("Worker %d (pid %d) toujours actif après %.0fs, arrêt forcé",
+                               worker.worker_id, worker.pid, self.graceful_timeout)
+                self._signal(worker.pid, signal.SIGKILL)
+                worker.deadline = float("inf")
+
+    def _check_memory(self) -> None:
+        for worker in self.active_workers():
+            memory = process_memory(worker.pid)
+            if memory is not None and memory["uss_bytes"] > self.max_worker_uss:
+                logger.warning("Worker %d (pid %d) : %.1f Mo privés (limite %.1f Mo), recyclage",
+                               worker.worker_id, worker.pid, memory["uss_bytes"] / 2**20, self.max_worker_uss / 2**20)
+                self.recycle(worker)
+
+    def memory_report(self) -> List[Dict[str, Any]]:
+        """Mémoire du parent (worker_id None) et de chaque worker"""
+        report = [{"worker_id": None, "pid": self.pid, **(process_memory(self.pid) or {})}]
+        for worker in sorted(self.workers.values(), key=lambda worker: worker.worker_id):
+            memory = process_memory(worker.pid)
+            if memory is not None:
+                report.append({"worker_id": worker.worker_id, "pid": worker.pid, **memory})
+        return report
+
+    def log_memory(self) -> None:
+        report = self.memory_report()
+        for item in report:
+            logger.info(
+                "%s (pid %d) : USS %.1f Mo, PSS %.1f Mo, partagé %.1f Mo, RSS %.1f Mo",
+                "Parent" if item["worker_id"] is None else f"Worker {item['worker_id']}", item["pid"],
+                item.get("uss_bytes", 0) / 2**20, item.get("pss_bytes", 0) / 2**20,
+                item.get("shared_bytes", 0) / 2**20, item.get("rss_bytes", 0) / 2**20,
+            )
+        logger.info("Mémoire totale (somme des PSS) : %.1f Mo",
+                    sum(item.get("pss_bytes", 0) for item in report) / 2**20)
+
+    def _signal(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def shutdown(self) -> None:
+        """Arrêt gracieux de tous les workers, SIGKILL après graceful_timeout"""
+        logger.info("Arrêt des workers")
+        deadline = time.monotonic() + self.graceful_timeout
+        for worker in self.workers.values():
+            worker.deadline = deadline
+            self._signal(worker.pid, signal.SIGTERM)
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(POLL_INTERVAL / 4)
+        for worker in list(self.workers.values()):
+            self._signal(worker.pid, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+            del self.workers[worker.pid]
+        self.sock.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serveur multi-workers, modèles préchargés avant fork")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute")
+    parser.add_argument("--port", type=int, default=8000, help="Port d'écoute")
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS,
+                        help="Nombre de workers (0 = un par CPU)")
+    parser.add_argument("--max-requests", type=int, default=config.SERVER_MAX_REQUESTS,
+                        help="Recycle un worker après ce nombre de requêtes (0 = jamais)")
+    parser.add_argument("--max-requests-jitter", type=int, default=config.SERVER_MAX_REQUESTS_JITTER,
+                        help="Aléa ajouté à --max-requests (les workers ne sont pas recyclés ensemble)")
+    parser.add_argument("--max-worker-uss-mb", type=float, default=config.SERVER_MAX_WORKER_USS_MB,
+                        help="Recycle un worker au-delà de cette mémoire privée en Mo (0 = jamais)")
+    parser.add_argument("--graceful-timeout", type=float, default=config.SERVER_GRACEFUL_TIMEOUT,
+                        help="Délai d'arrêt gracieux d'un worker en secondes")
+    parser.add_argument("--memory-report-interval", type=float, default=config.SERVER_MEMORY_REPORT_INTERVAL,
+                        help="Intervalle du rapport mémoire dans les logs en secondes (0 = aucun)")
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        parser.error("fork indisponible sur ce système : utiliser uvicorn --workers")
+
+    # Logs synchrones dans le parent : aucun thread ne doit tourner au moment des fork
+    logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    from .main import app
+    preload()
+    # Port ouvert après le chargement : les sondes échouent tant que les modèles ne sont pas prêts
+    sock = bind_socket(args.host, args.port)
+    logger.info("Écoute sur %s:%d avec %d workers", args.host, args.port, args.workers or os.cpu_count() or 1)
+    server = PreforkServer(
+        app, sock, workers=args.workers or os.cpu_count() or 1,
+        max_requests=args.max_requests, max_requests_jitter=args.max_requests_jitter,
+        max_worker_uss_mb=args.max_worker_uss_mb, graceful_timeout=args.graceful_timeout,
+        memory_report_interval=args.memory_report_interval,
+    )
+    return server.run()
+
+if __name__ == "__main__":
+    sys.exit(main())
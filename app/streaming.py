@@ -0,0 +1,421 @@
+"""
+Formats d'échange des prédictions en volume : NDJSON, Arrow IPC (format flux) et JSON.
+
+La requête est lue à la demande, morceau par morceau (STREAM_CHUNK_ROWS lignes), directement
+dans des tableaux : villes, types de bien et matrice (n, 3) des features, sans modèle pydantic
+par ligne. Chaque morceau est prédit puis encodé et envoyé aussitôt : les premiers résultats
+partent avant la fin de la lecture, et ni la requête ni la réponse ne sont gardées entières en
+mémoire. Le client doit lire la réponse pendant l'envoi de la requête (curl, clients HTTP
+asynchrones) : sinon, une fois les tampons réseau pleins, l'envoi de la requête se bloque.
+
+La lecture, la prédiction et l'encodage tournent dans un thread du pool borné des flux
+(InferenceExecutor.reserve) ; la boucle asyncio ne fait que transmettre les messages ASGI
+(corps de la requête, morceaux de réponse).
+Arrow IPC nécessite pyarrow (optionnel, pip install pyarrow).
+"""
+import asyncio
+import io
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from starlette.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Formats reconnus par type MIME (Content-Type de la requête, Accept de la réponse)
+MEDIA_FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json": "json",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Formats lisibles en entrée (le JSON se lit en entier : voir /predict/batch)
+INPUT_FORMATS = ("ndjson", "arrow")
+
+# Colonnes Arrow (et champs NDJSON) des biens ; surface_terrain est optionnelle (0 par défaut)
+TEXT_COLUMNS = ("ville", "type_local")
+NUMBER_COLUMNS = ("surface_bati", "surface_terrain", "nombre_lots")
+
+# Taille maximale d'une ligne NDJSON
+MAX_LINE_BYTES = 64 * 1024
+# Tampon de lecture du corps de la requête
+READ_BUFFER_BYTES = 256 * 1024
+# Morceaux de réponse encodés en attente d'envoi (au-delà, la prédiction attend le client)
+OUTPUT_QUEUE_CHUNKS = 4
+# Attente maximale de la fin du thread d'un flux interrompu (morceau en cours de prédiction)
+STOP_TIMEOUT_SECONDS = 30.0
+
+def media_format(content_type: Optional[str]) -> Optional[str]:
+    # "application/x-ndjson; charset=utf-8" -> "ndjson"
+    if not content_type:
+        return None
+    return MEDIA_FORMATS.get(content_type.split(";")[0].strip().lower())
+
+def negotiate(accept: Optional[str], default: str) -> Optional[str]:
+    """Format de réponse selon l'en-tête Accept (par ordre de préférence q), None si aucun n'est servi"""
+    if not accept:
+        return default
+    choices = []
+    for part in accept.split(","):
+        media, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        choices.append((q, media.lower()))
+    for q, media in sorted(choices, key=lambda choice: -choice[0]):
+        if q <= 0:
+            continue
+        if media in ("*/*", "application/*"):
+            return default
+        if media in MEDIA_FORMATS:
+            return MEDIA_FORMATS[media]
+    return None
+
+def has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# Morceau de requête décodé : lignes start à start + n - 1 du flux
+@dataclass
+class FeatureChunk:
+    start: int
+    villes: np.ndarray        # objets : ville en minuscules, ou None
+    types_local: np.ndarray   # objets : type de bien, ou None
+    X: np.ndarray             # (n, 3) : surface_bati, surface_terrain, nombre_lots (NaN si illisible)
+    errors: Dict[int, str]    # erreurs de décodage par ligne du morceau
+
+    def __len__(self) -> int:
+        return len(self.X)
+
+# ---
+# Lecture des requêtes
+# ---
+def read_ndjson(reader, chunk_rows: int) -> Iterator[FeatureChunk]:
+    """Un objet par ligne : {ville, type_local, surface_bati, ...} ou {ville, features: {...}}"""
+    start = 0
+    while True:
+        X = np.empty((chunk_rows, len(NUMBER_COLUMNS)), dtype=np.float64)
+        villes, types_local, errors = [], [], {}
+        n = 0
+        while n < chunk_rows:
+            line = reader.readline(MAX_LINE_BYTES + 1)
+            if not line:
+                break
+            if len(line) > MAX_LINE_BYTES:
+                # Fin de la ligne trop longue ignorée
+                while line and not line.endswith(b"\n"):
+                    line = reader.readline(MAX_LINE_BYTES)
+                line = b"!"
+            if not line.strip():
+                continue
+            ville = type_local = None
+            try:
+                if line == b"!":
+                    raise ValueError(f"ligne de plus de {MAX_LINE_BYTES} octets")
+                item = json.loads(line)
+                features = item.get("features", item)
+                ville, type_local = item.get("ville"), features.get("type_local")
+                X[n] = (features["surface_bati"], features.get("surface_terrain", 0), features["nombre_lots"])
+            except KeyError as e:
+                X[n] = np.nan
+                errors[n] = f"Features requises manquantes : {e.args[0]}"
+            except (AttributeError, TypeError, ValueError) as e:
+                X[n] = np.nan
+                errors[n] = f"Ligne NDJSON invalide : {e}"
+            villes.append(ville.lower() if isinstance(ville, str) else None)
+            types_local.append(type_local if isinstance(type_local, str) else None)
+            n += 1
+        if n == 0:
+            return
+        yield FeatureChunk(start, _objects(villes), _objects(types_local), X[:n], errors)
+        start += n
+        if n < chunk_rows:
+            return
+
+def read_arrow(source, chunk_rows: int) -> Iterator[FeatureChunk]:
+    """Flux Arrow IPC : colonnes ville, type_local (texte), surface_bati, surface_terrain, nombre_lots"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    reader = pa.ipc.open_stream(source)
+    schema = reader.schema
+    for name in TEXT_COLUMNS + NUMBER_COLUMNS:
+        if name not in schema.names:
+            if name == "surface_terrain":
+                continue
+            raise ValueError(f"Colonne Arrow manquante : {name}")
+        column_type = schema.field(name).type
+        if pa.types.is_dictionary(column_type):
+            column_type = column_type.value_type
+        expected = (pa.types.is_string(column_type) or pa.types.is_large_string(column_type)
+                    if name in TEXT_COLUMNS else pa.types.is_integer(column_type) or pa.types.is_floating(column_type))
+        if not expected:
+            raise ValueError(f"Colonne Arrow {name} : type {column_type} non pris en charge")
+
+    def text(part, name):
+        column = part.column(name)
+        if pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        return (pc.utf8_lower(column) if name == "ville" else column).to_numpy(zero_copy_only=False)
+
+    def number(part, name):
+        if name not in part.schema.names:
+            return np.zeros(part.num_rows)
+        column = pc.cast(part.column(name), pa.float64())
+        # Valeur absente : surface terrain à 0 comme en JSON, sinon NaN (ligne invalide)
+        column = pc.fill_null(column, 0.0 if name == "surface_terrain" else float("nan"))
+        return column.to_numpy(zero_copy_only=False)
+
+    start = 0
+    for batch in reader:
+        for offset in range(0, batch.num_rows, chunk_rows):
+            part = batch.slice(offset, chunk_rows)
+            X = np.column_stack([number(part, name) for name in NUMBER_COLUMNS])
+            yield FeatureChunk(start, text(part, "ville"), text(part, "type_local"), X, {})
+            start += part.num_rows
+
+def _objects(values: List[Any]) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+# ---
+# Encodage des réponses
+# ---
+# Lignes JSON d'un morceau de résultats (index dans le flux, prix arrondi comme /predict/batch)
+def json_rows(start: int, predictions: np.ndarray, bands: Optional[np.ndarray], errors: Dict[int, str],
+              labels: List[str]) -> List[str]:
+    rows = []
+    band_rows = bands.T.tolist() if bands is not None else None
+    for i, value in enumerate(predictions.tolist()):
+        error = errors.get(i)
+        if error is not None:
+            rows.append(json.dumps({"index": start + i, "error": error}, ensure_ascii=False))
+        elif band_rows is None:
+            rows.append(f'{{"index":{start + i},"prix_m2_estime":{round(value, 2)!r}}}')
+        else:
+            quantiles = ",".join(f'"{label}":{round(band, 2)!r}' for label, band in zip(labels, band_rows[i]))
+            rows.append(f'{{"index":{start + i},"prix_m2_estime":{round(value, 2)!r},"quantiles":{{{quantiles}}}}}')
+    return rows
+
+class NdjsonEncoder:
+    def __init__(self, labels: List[str]):
+        self.labels = labels
+
+    def begin(self) -> bytes:
+        return b""
+
+    def encode(self, start, predictions, bands, errors) -> bytes:
+        rows = json_rows(start, predictions, bands, errors, self.labels)
+        return ("\n".join(rows) + "\n").encode() if rows else b""
+
+    def end(self) -> bytes:
+        return b""
+
+# Même forme que la réponse de /predict/batch : {"results": [...], "n_success": ..., "n_errors": ...}
+class JsonEncoder:
+    def __init__(self, labels: List[str]):
+        self.labels = labels
+        self.n_success = 0
+        self.n_errors = 0
+
+    def begin(self) -> bytes:
+        return b'{"results":['
+
+    def encode(self, start, predictions, bands, errors) -> bytes:
+        rows = json_rows(start, predictions, bands, errors, self.labels)
+        if not rows:
+            return b""
+        separator = "," if self.n_success + self.n_errors else ""
+        self.n_errors += len(errors)
+        self.n_success += len(rows) - len(errors)
+        return (separator + ",".join(rows)).encode()
+
+    def end(self) -> bytes:
+        return f'],"n_success":{self.n_success},"n_errors":{self.n_errors}}}'.encode()
+
+# Colonnes : index, prix_m2_estime, un quantile par colonne (p10, ...), error ; valeurs nulles en cas d'erreur
+class ArrowEncoder:
+    def __init__(self, labels: List[str]):
+        import pyarrow as pa
+        self.pa = pa
+        self.labels = labels
+        self.schema = pa.schema(
+            [("index", pa.int64()), ("prix_m2_estime", pa.float64())]
+            + [(label, pa.float64()) for label in labels]
+            + [("error", pa.string())]
+        )
+        self._sink = io.BytesIO()
+        self._writer = None
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def begin(self) -> bytes:
+        self._writer = self.pa.ipc.new_stream(self._sink, self.schema)
+        return self._drain()
+
+    def encode(self, start, predictions, bands, errors) -> bytes:
+        pa = self.pa
+        failed = np.zeros(len(predictions), dtype=bool)
+        failed[list(errors)] = True
+        rounded = [round(value, 2) for value in predictions.tolist()]
+        arrays = [pa.array(np.arange(start, start + len(predictions), dtype=np.int64)),
+                  pa.array(rounded, type=pa.float64(), mask=failed)]
+        for band in (bands.tolist() if bands is not None else []):
+            arrays.append(pa.array([round(value, 2) for value in band], type=pa.float64(), mask=failed))
+        arrays.append(pa.array([errors.get(i) for i in range(len(predictions))], type=pa.string()))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._drain()
+
+    def end(self) -> bytes:
+        self._writer.close()
+        return self._drain()
+
+ENCODERS = {"ndjson": NdjsonEncoder, "json": JsonEncoder, "arrow": ArrowEncoder}
+READERS = {"ndjson": read_ndjson, "arrow": read_arrow}
+
+# ---
+# Réponse ASGI : lit le corps de la requête et envoie les résultats au fil de l'eau
+# ---
+# Le client s'est déconnecté, ou l'envoi de la réponse a échoué
+class StreamAborted(Exception):
+    pass
+
+# Corps de la requête lu depuis le thread du flux : chaque lecture attend le message ASGI suivant
+class RequestBody(io.RawIOBase):
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop, stopped: threading.Event):
+        self._receive = receive
+        self._loop = loop
+        self._stopped = stopped
+        self._buffer = memoryview(b"")
+        self._more_body = True
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and self._more_body:
+            if self._stopped.is_set():
+                raise StreamAborted("Flux interrompu")
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                raise StreamAborted("Client déconnecté")
+            self._buffer = memoryview(message.get("body", b""))
+            self._more_body = message.get("more_body", False)
+        n = min(len(buffer), len(self._buffer))
+        buffer[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+# Fin du flux produit par le thread
+_DONE = object()
+
+class PredictionStream(StreamingResponse):
+    """
+    predict_chunk(chunk) -> (prédictions (n,), quantiles (q, n) ou None, {ligne: erreur}).
+    submit(fn, *args) -> Future exécute la production du flux (InferenceExecutor.reserve).
+    Une erreur de format avant le premier résultat répond 400 ; après, la connexion est interrompue
+    (la réponse est incomplète, le client le détecte).
+    """
+    def __init__(self, input_format: str, output_format: str,
+                 predict_chunk: Callable[[FeatureChunk], Tuple[np.ndarray, Optional[np.ndarray], Dict[int, str]]],
+                 labels: List[str], chunk_rows: int, submit: Callable[..., Future]):
+        self.input_format = input_format
+        self.output_format = output_format
+        self.predict_chunk = predict_chunk
+        self.labels = labels
+        self.chunk_rows = chunk_rows
+        self.submit = submit
+        self.status_code = 200
+        self.media_type = MEDIA_TYPES[output_format]
+        self.background = None
+        self.init_headers()
+
+    def produce(self, receive, loop, queue: asyncio.Queue, stopped: threading.Event) -> None:
+        # Thread du flux : lecture, prédiction et encodage morceau par morceau
+        def put(item) -> None:
+            if stopped.is_set():
+                raise StreamAborted("Flux interrompu")
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        try:
+            source = io.BufferedReader(RequestBody(receive, loop, stopped), READ_BUFFER_BYTES)
+            encoder = ENCODERS[self.output_format](self.labels)
+            header = None
+            for chunk in READERS[self.input_format](source, self.chunk_rows):
+                predictions, bands, errors = self.predict_chunk(chunk)
+                if header is None:
+                    header = encoder.begin()
+                    put(header)
+                put(encoder.encode(chunk.start, predictions, bands, errors))
+            put((encoder.begin() if header is None else b"") + encoder.end())
+            put(_DONE)
+        except BaseException as e:
+            # Flux déjà interrompu : plus personne ne lit la file
+            if not stopped.is_set():
+                put(e)
+
+    async def __call__(self, scope, receive, send) -> None:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=OUTPUT_QUEUE_CHUNKS)
+        stopped = threading.Event()
+        future = asyncio.wrap_future(self.submit(self.produce, receive, loop, queue, stopped))
+        started = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, StreamAborted):
+                    # Client parti : rien à lui envoyer
+                    return
+                if isinstance(item, BaseException):
+                    if not started and isinstance(item, ValueError):
+                        # Format invalide détecté avant le premier résultat
+                        await _send_error(send, 400, str(item))
+                        return
+                    raise RuntimeError("Flux de prédiction interrompu") from item
+                if not started:
+                    await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+                    started = True
+                if item:
+                    await send({"type": "http.response.body", "body": item, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except OSError:
+            # Connexion fermée par le client pendant l'envoi
+            return
+        finally:
+            stopped.set()
+            # Débloque le thread s'il attend une place dans la file : il s'arrête à son prochain envoi
+            while not queue.empty():
+                queue.get_nowait()
+            done, _ = await asyncio.wait({future}, timeout=STOP_TIMEOUT_SECONDS)
+            if not done:
+                logger.warning("Flux de prédiction non terminé %.0f s après son interruption", STOP_TIMEOUT_SECONDS)
+
+async def _send_error(send, status_code: int, detail: str) -> None:
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({"type": "http.response.start", "status": status_code,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,270 @@
+"""
+Entraînement reproductible des modèles (reprise des notebooks phase_1_lille / phase_2_bordeaux).
+
+Usage : python -m app.training --version 2023-01 [--villes lille bordeaux] [--activate]
+
+Pour chaque (ville, type_local) : filtre 4 pièces, séparation par type, remplissage de
+"Surface terrain", coupure IQR des prix au m², StandardScaler sur X et y, puis GridSearchCV
+sur DecisionTree et RandomForest (le meilleur score de validation croisée est retenu).
+Les combinaisons sont entraînées en parallèle (un processus chacune) et la validation
+croisée utilise les cœurs restants. Chaque exécution écrit models/<version>/ avec les
+artefacts et un metrics.json, et peut activer la version dans models/manifest.json.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .dataset import DatasetCache, load_dataset
+from .logging_setup import setup_logging
+from .models.artifact import save_model_files
+from .models.model_loader import MANIFEST_NAME, write_manifest
+
+logger = logging.getLogger(__name__)
+
+ROOT_PATH = Path(__file__).parent.parent
+DATA_PATH = ROOT_PATH / "data"
+MODELS_PATH = ROOT_PATH / "models"
+
+# Colonnes lues dans les exports DVF et features du modèle
+TRAINING_COLUMNS = [
+    "Type local", "Nombre pieces principales", "Surface reelle bati",
+    "Surface terrain", "Nombre de lots", "Valeur fonciere",
+]
+MODEL_FEATURES = ["Surface reelle bati", "Surface terrain", "Nombre de lots"]
+TYPES_LOCAL = ("Appartement", "Maison")
+
+# Grilles des notebooks (et une grille réduite pour les essais rapides)
+PARAM_GRIDS = {
+    "full": {
+        "DecisionTreeRegressor": {
+            "max_depth": [3, 5, 7, 10],
+            "min_samples_split": [2, 5, 10],
+            "min_samples_leaf": [1, 2, 4],
+        },
+        "RandomForestRegressor": {
+            "n_estimators": [50, 100, 200],
+            "max_depth": [3, 5, 7],
+            "min_samples_split": [2, 5],
+            "min_samples_leaf": [1, 2],
+        },
+    },
+    "quick": {
+        "DecisionTreeRegressor": {"max_depth": [3, 5], "min_samples_leaf": [2, 4]},
+        "RandomForestRegressor": {"n_estimators": [20], "max_depth": [3, 5], "min_samples_leaf": [2]},
+    },
+}
+
+def load_training_data(csv_path: Path):
+    # Lecture des seules colonnes utiles à l'entraînement, depuis le cache binaire
+    return load_dataset(csv_path, TRAINING_COLUMNS)
+
+def prepare_dataset(df, type_local: str, pieces: Optional[int] = 4):
+    """
+    Prétraitement vectorisé d'un export DVF pour un type de bien.
+
+    Retourne X (surface bâtie, surface terrain, nombre de lots) et y (prix au m²).
+    """
+    mask = (df["Type local"] == type_local).to_numpy()
+    if pieces is not None:
+        mask = mask & (df["Nombre pieces principales"] == pieces).to_numpy()
+    data = df.loc[mask, MODEL_FEATURES + ["Valeur fonciere"]]
+    data = data[(data["Surface reelle bati"] > 0) & data["Valeur fonciere"].notna()]
+
+    X = data[MODEL_FEATURES].copy()
+    # Terrain manquant : 0 pour un appartement, médiane pour une maison (comme les notebooks)
+    median = X["Surface terrain"].median()
+    fill_value = 0 if type_local == "Appartement" or np.isnan(median) else median
+    X["Surface terrain"] = X["Surface terrain"].fillna(fill_value)
+    X["Nombre de lots"] = X["Nombre de lots"].fillna(0)
+    y = data["Valeur fonciere"] / data["Surface reelle bati"]
+
+    # Coupure des valeurs aberrantes du prix au m² (IQR)
+    q1, q3 = np.percentile(y, [25, 75])
+    iqr = q3 - q1
+    keep = ((y >= q1 - 1.5 * iqr) & (y <= q3 + 1.5 * iqr)).to_numpy()
+    return X[keep], y[keep].rename("prix_m2")
+
+def regression_metrics(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    mse = mean_squared_error(y_true, y_pred)
+    return {
+        "mse": float(mse),
+        "rmse": float(np.sqrt(mse)),
+        "mae": float(mean_absolute_error(y_true, y_pred)),
+        "r2": float(r2_score(y_true, y_pred)),
+    }
+
+def fit_scalers_and_split(X, y, seed: int):
+    # Séparation train/test puis StandardScaler sur X et y (ajustés sur le train uniquement)
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    scaler_x = StandardScaler().fit(X_train)
+    scaler_y = StandardScaler().fit(y_train.to_numpy().reshape(-1, 1))
+    return X_train, X_test, y_train, y_test, scaler_x, scaler_y
+
+def train_combination(ville: str, type_local: str, csv_path: str, output_dir: str, version: str,
+                      grid: str = "full", cv: int = 5, cv_jobs: int = -1, seed: int = 42,
+                      pieces: Optional[int] = 4) -> Dict[str, Any]:
+    """Entraîne le meilleur modèle d'une ville et d'un type de bien et écrit ses artefacts"""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import GridSearchCV
+    from sklearn.tree import DecisionTreeRegressor
+
+    started = time.perf_counter()
+    X, y = prepare_dataset(load_training_data(Path(csv_path)), type_local, pieces)
+    if len(X) < 2 * cv:
+        raise ValueError(f"Pas assez de données pour {ville}/{type_local} : {len(X)} lignes")
+    X_train, X_test, y_train, y_test, scaler_x, scaler_y = fit_scalers_and_split(X, y, seed)
+    X_train_scaled = scaler_x.transform(X_train)
+    y_train_scaled = scaler_y.transform(y_train.to_numpy().reshape(-1, 1)).ravel()
+
+    estimators = {
+        "DecisionTreeRegressor": DecisionTreeRegressor(random_state=seed),
+        "RandomForestRegressor": RandomForestRegressor(random_state=seed),
+    }
+    candidates = []
+    for name, estimator in estimators.items():
+        search = GridSearchCV(estimator, PARAM_GRIDS[grid][name], cv=cv,
+                              scoring="neg_mean_squared_error", n_jobs=cv_jobs)
+        search.fit(X_train_scaled, y_train_scaled)
+        candidates.append((search.best_score_, name, search))
+    best_score, best_name, best_search = max(candidates, key=lambda c: c[0])
+    model = best_search.best_estimator_
+
+    # Évaluation sur le jeu de test, à l'échelle réelle du prix au m²
+    y_pred = scaler_y.inverse_transform(
+        model.predict(scaler_x.transform(X_test)).reshape(-1, 1)
+    )[:, 0]
+
+    files = save_model_files(output_dir, version, ville, type_local, model, scaler_x, scaler_y)
+
+    return {
+        "ville": ville,
+        "type_local": type_local,
+        "version": version,
+        "files": files,
+        "model": best_name,
+        "params": best_search.best_params_,
+        "cv_mse_scaled": float(-best_score),
+        "candidates": {name: float(-score) for score, name, _ in candidates},
+        "n_train": int(len(X_train)),
+        "n_test": int(len(X_test)),
+        "test": regression_metrics(y_test.to_numpy(), y_pred),
+        "data": {"path": str(csv_path), "sha256": DatasetCache().sha256(Path(csv_path))},
+        "seconds": time.perf_counter() - started,
+    }
+
+def update_manifest(models_path: Path, results: List[Dict[str, Any]], activate: bool) -> None:
+    # Ajoute les nouveaux modèles au manifeste ; --activate désactive les anciennes versions
+    manifest_path = models_path / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {"models": []}
+    trained = {(r["ville"], r["type_local"]) for r in results}
+    versions = {r["version"] for r in results}
+    entries = [
+        e for e in manifest["models"]
+        if not ((e["ville"], e["type_local"]) in trained and str(e["version"]) in versions)
+    ]
+    if activate:
+        for entry in entries:
+            if (entry["ville"], entry["type_local"]) in trained:
+                entry["active"] = False
+    for r in results:
+        entries.append({
+            "ville": r["ville"], "type_local": r["type_local"], "version": r["version"],
+            **r["files"], "active": activate,
+        })
+    write_manifest(models_path, entries)
+
+def train_all(villes: Dict[str, Path], version: str, models_path: Path = MODELS_PATH,
+              types_local: Tuple[str, ...] = TYPES_LOCAL, grid: str = "full", cv: int = 5,
+              jobs: Optional[int] = None, seed: int = 42, pieces: Optional[int] = 4,
+              activate: bool = False) -> Dict[str, Any]:
+    """Entraîne toutes les combinaisons (ville, type_local) en parallèle et écrit le metrics.json"""
+    import sklearn
+
+    started = time.perf_counter()
+    version_dir = Path(models_path) / version
+    if version_dir.exists() and any(version_dir.iterdir()):
+        raise ValueError(f"La version {version} existe déjà : {version_dir}")
+    version_dir.mkdir(parents=True, exist_ok=True)
+
+    # Conversion des CSV dans le cache avant de lancer les processus d'entraînement
+    cache = DatasetCache()
+    for path in villes.values():
+        cache.ensure(path)
+
+    combinations = [(ville, type_local) for ville in sorted(villes) for type_local in types_local]
+    cpu_count = os.cpu_count() or 1
+    jobs = min(jobs or cpu_count, len(combinations))
+    # Les cœurs non utilisés par les combinaisons servent à la validation croisée
+    cv_jobs = max(1, cpu_count // jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(train_combination, ville, type_local, str(villes[ville]), str(models_path),
+                        version, grid, cv, cv_jobs, seed, pieces)
+            for ville, type_local in combinations
+        ]
+        results = [future.result() for future in futures]
+
+    metrics = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "seed": seed,
+        "grid": grid,
+        "cv": cv,
+        "pieces": pieces,
+        "versions": {"sklearn": sklearn.__version__, "numpy": np.__version__, "python": sys.version.split()[0]},
+        "seconds": time.perf_counter() - started,
+        "models": results,
+    }
+    (version_dir / "metrics.json").write_text(json.dumps(metrics, indent=2, ensure_ascii=False))
+    update_manifest(Path(models_path), results, activate)
+    return metrics
+
+def parse_villes(values: List[str]) -> Dict[str, Path]:
+    # "lille" -> data/lille_2022.csv, ou "lille=chemin/vers/export.csv"
+    villes = {}
+    for value in values:
+        ville, _, path = value.partition("=")
+        villes[ville.lower()] = Path(path) if path else DATA_PATH / f"{ville.lower()}_2022.csv"
+        if not villes[ville.lower()].exists():
+            raise FileNotFoundError(f"Données introuvables pour {ville} : {villes[ville.lower()]}")
+    return villes
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Entraînement des modèles de prix au m²")
+    parser.add_argument("--version", default=datetime.now().strftime("%Y%m%d-%H%M%S"),
+                        help="Nom de la version (dossier models/<version>)")
+    parser.add_argument("--villes", nargs="+", default=["lille", "bordeaux"],
+                        help="Villes à entraîner (ville ou ville=chemin.csv)")
+    parser.add_argument("--grid", choices=sorted(PARAM_GRIDS), default="full", help="Grille d'hyperparamètres")
+    parser.add_argument("--cv", type=int, default=5, help="Nombre de plis de validation croisée")
+    parser.add_argument("--jobs", type=int, help="Combinaisons entraînées en parallèle (défaut : nombre de cœurs)")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    parser.add_argument("--pieces", type=int, default=4, help="Nombre de pièces retenu (0 = tous)")
+    parser.add_argument("--models-path", type=Path, default=MODELS_PATH, help="Dossier des modèles")
+    parser.add_argument("--activate", action="store_true", help="Active la nouvelle version dans le manifeste")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    metrics = train_all(parse_villes(args.villes), args.version, args.models_path, grid=args.grid, cv=args.cv,
+                        jobs=args.jobs, seed=args.seed, pieces=args.pieces or None, activate=args.activate)
+    summary = [
+        {k: m[k] for k in ("ville", "type_local", "model", "params")} | {"test": m["test"]}
+        for m in metrics["models"]
+    ]
+    print(json.dumps({"version": metrics["version"], "seconds": metrics["seconds"], "models": summary}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,27 @@
 import logging
-import pandas as pd
+import numpy as np
 from pathlib import Path
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
+
+from .dataset import load_dataset
+
+# pandas est importé à la première utilisation pour accélérer le démarrage de l'API
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Logger pour afficher les informations et erreurs
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Fonction utilitaire pour charger et valider un dataset CSV
-def load_and_validate_dataset(file_path: Path) -> pd.DataFrame:
+def load_and_validate_dataset(file_path: Path) -> "pd.DataFrame":
+    import pandas as pd
     required_columns = [
         'surface_bati', 'nombre_pieces', 'type_local',
         'surface_terrain', 'nombre_lots', 'prix_m2'
     ]
     try:
-        df = pd.read_csv(file_path)
+        # Lecture via le cache binaire (le CSV n'est parsé qu'au premier chargement)
+        df = load_dataset(file_path)
         # Vérifie la présence des colonnes nécessaires
         missing_cols = [col for col in required_columns if col not in df.columns]
         if missing_cols:
@@ -24,7 +31,7 @@ def load_and_validate_dataset(file_path: Path) -> pd.DataFrame:
             df[col] = pd.to_numeric(df[col], errors='coerce')
         return df
     except Exception as e:
-        logger.error(f"Erreur lors du chargement du dataset: {str(e)}")
+        logger.error("Erreur lors du chargement du dataset: %s", e)
         raise
 
 # Classe pour prétraiter les features avant la prédiction
@@ -32,10 +39,17 @@ class FeatureProcessor:
     def __init__(self):
         self.required_features = ["surface_bati", "type_local", "nombre_lots"]
         self.optional_features = ["nombre_pieces", "surface_terrain"]
+        self.villes = ["lille", "bordeaux"]
+        self.types_local = ["Appartement", "Maison"]
         self.max_values = {
             "surface_bati": 10000, "nombre_pieces": 50,
             "surface_terrain": 10000, "nombre_lots": 100
         }
+        # Colonnes attendues par les scalers et les modèles (ordre d'entraînement)
+        self.model_features = ['Surface reelle bati', 'Surface terrain', 'Nombre de lots']
+        # Champs de la requête correspondant à chaque colonne du modèle
+        self.feature_keys = ["surface_bati", "surface_terrain", "nombre_lots"]
+        self._max_row = np.array([self.max_values[key] for key in self.feature_keys], dtype=np.float64)
 
     def validate_features(self, features: Dict[str, Any]) -> None:
         # Vérifie la présence des features requises
@@ -57,21 +71,69 @@ class FeatureProcessor:
             if field in features and features[field] > max_value:
                 raise ValueError(f"La valeur de {field} ne peut pas dépasser {max_value}")
 
-    def prepare_features_for_prediction(self, features: Dict[str, Any]) -> pd.DataFrame:
-        self.validate_features(features)
+    def prepare_features_for_prediction(self, features: Dict[str, Any]) -> "pd.DataFrame":
+        # Version DataFrame de encode (noms de colonnes attendus par les scalers)
+        import pandas as pd
         features.setdefault("surface_terrain", 0)
         features.setdefault("nombre_pieces", 0)
-        # Retourne un DataFrame prêt pour le modèle
-        return pd.DataFrame([[
-            float(features["surface_bati"]),
-            float(features["surface_terrain"]),
-            float(features["nombre_lots"])
-        ]], columns=['Surface reelle bati', 'Surface terrain', 'Nombre de lots'])
+        return pd.DataFrame(self.encode(features), columns=self.model_features)
+
+    def check_rows(self, X: np.ndarray) -> Dict[int, str]:
+        # Contrôles vectorisés sur une matrice (n, 3) de features brutes
+        # Retourne {indice de ligne: message} pour les lignes invalides uniquement
+        X = np.asarray(X, dtype=np.float64)
+        finite = np.isfinite(X).all(axis=1)
+        invalid = ~finite | (X < 0).any(axis=1) | (X[:, 0] == 0) | (X > self._max_row).any(axis=1)
+        if not invalid.any():
+            return {}
+        errors = {}
+        for i in np.flatnonzero(invalid):
+            row = X[i]
+            if not finite[i]:
+                errors[int(i)] = "Les valeurs doivent être des nombres finis"
+            elif (row < 0).any():
+                errors[int(i)] = "Les valeurs ne peuvent pas être négatives"
+            elif row[0] == 0:
+                errors[int(i)] = "La surface bâtie ne peut pas être nulle"
+            else:
+                field = self.feature_keys[int(np.argmax(row > self._max_row))]
+                errors[int(i)] = f"La valeur de {field} ne peut pas dépasser {self.max_values[field]}"
+        return errors
+
+    def encode(self, features: Dict[str, Any], out: Optional[np.ndarray] = None) -> np.ndarray:
+        # Valide une seule fois et écrit les features dans un buffer (1, 3) réutilisable
+        row = out if out is not None else np.empty((1, len(self.feature_keys)), dtype=np.float64)
+        for j, key in enumerate(self.feature_keys):
+            value = features.get(key, 0) if key == "surface_terrain" else features.get(key)
+            if value is None:
+                raise ValueError(f"Features requises manquantes : {key}")
+            if not isinstance(value, (int, float)):
+                raise TypeError(f"Le champ {key} doit être un nombre")
+            row[0, j] = value
+        if features.get("nombre_pieces", 0) > self.max_values["nombre_pieces"]:
+            raise ValueError(f"La valeur de nombre_pieces ne peut pas dépasser {self.max_values['nombre_pieces']}")
+        errors = self.check_rows(row)
+        if errors:
+            raise ValueError(errors[0])
+        return row
+
+    def encode_batch(self, features_list: List[Dict[str, Any]],
+                     out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, Dict[int, str]]:
+        # Encode plusieurs biens dans une matrice (n, 3) puis contrôle toutes les lignes d'un coup
+        # Les lignes non numériques sont mises à NaN et signalées comme invalides
+        n = len(features_list)
+        X = out[:n] if out is not None else np.empty((n, len(self.feature_keys)), dtype=np.float64)
+        for i, features in enumerate(features_list):
+            try:
+                X[i] = (features["surface_bati"], features.get("surface_terrain", 0), features["nombre_lots"])
+            except (KeyError, TypeError, ValueError):
+                X[i] = np.nan
+        return X, self.check_rows(X)
 
     def validate_type_local(self, type_local: str) -> None:
-        if type_local not in ["Appartement", "Maison"]:
+        if type_local not in self.types_local:
             raise ValueError("Type de local invalide. Valeurs acceptées : Appartement, Maison")
 
     def validate_ville(self, ville: str) -> None:
-        if ville.lower() not in ["lille", "bordeaux"]:
+        if ville.lower() not in self.villes:
             raise ValueError("Ville invalide. Valeurs acceptées : lille, bordeaux")
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Benchmark du cache binaire des datasets (app/dataset.py).
+
+Usage : python benchmarks/bench_dataset_cache.py [--rows 500000] [--repeat 5]
+
+Un CSV synthétique est construit en répétant les exports DVF de data/. On mesure :
+- la lecture du CSV texte (pd.read_csv, comme avant le cache) ;
+- la conversion initiale dans le cache (premier chargement) ;
+- le chargement à chaud de toutes les colonnes puis des seules colonnes du modèle (mmap).
+Les médianes en secondes et l'accélération sont affichées en JSON.
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+from app.dataset import DatasetCache  # noqa: E402
+from app.training import TRAINING_COLUMNS  # noqa: E402
+
+def build_input(path: Path, rows: int) -> None:
+    # Répète les CSV DVF jusqu'à atteindre le nombre de lignes demandé
+    import pandas as pd
+    base = pd.concat([
+        pd.read_csv(csv, low_memory=False) for csv in sorted((ROOT_PATH / "data").glob("*.csv"))
+    ])
+    repeats = max(1, -(-rows // len(base)))
+    pd.concat([base] * repeats).head(rows).to_csv(path, index=False)
+
+def timed(fn, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+def main(argv=None) -> int:
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Lecture CSV à froid contre cache binaire à chaud")
+    parser.add_argument("--rows", type=int, default=500_000, help="Taille du CSV synthétique")
+    parser.add_argument("--repeat", type=int, default=5, help="Nombre de mesures (médiane)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = Path(tmp) / "dvf.csv"
+        build_input(input_path, args.rows)
+        cache = DatasetCache(Path(tmp) / "cache")
+
+        results = {"csv_cold_seconds": timed(lambda: pd.read_csv(input_path, low_memory=False), args.repeat)}
+        started = time.perf_counter()
+        cache.ensure(input_path)
+        results["cache_build_seconds"] = time.perf_counter() - started
+        results["cache_warm_seconds"] = timed(lambda: cache.load(input_path), args.repeat)
+        results["cache_warm_model_columns_seconds"] = timed(
+            lambda: cache.load(input_path, TRAINING_COLUMNS), args.repeat
+        )
+        results["speedup"] = results["csv_cold_seconds"] / results["cache_warm_seconds"]
+        results["speedup_model_columns"] = results["csv_cold_seconds"] / results["cache_warm_model_columns_seconds"]
+        results["csv_mb"] = input_path.stat().st_size / 1e6
+
+    print(json.dumps({"rows": args.rows, **results}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Test de charge en processus : rejoue benchmarks/requests.jsonl contre l'application ASGI.
+
+Usage : python benchmarks/bench_load.py [--concurrency 8] [--requests 2000] [--output load.json]
+
+Les requêtes sont envoyées par httpx directement à l'application (ASGITransport, sans réseau)
+par --concurrency clients concurrents, en bouclant sur le fichier de requêtes. Le rapport JSON
+donne le débit, les latences p50/p95/p99 (par route et globales), les erreurs et la mémoire.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.routes import predict  # noqa: E402
+
+REQUESTS_PATH = Path(__file__).parent / "requests.jsonl"
+
+def load_requests(path: Path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def rss_mb() -> float:
+    # Mémoire résidente actuelle (Linux), sinon pic du processus
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentiles(latencies: list) -> dict:
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(latencies)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {"p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+async def replay(requests: list, concurrency: int, total: int) -> dict:
+    queue = itertools.islice(itertools.cycle(requests), total)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    async def client_loop(client):
+        for request in queue:
+            started = time.perf_counter()
+            response = await client.request(request["method"], request["path"], json=request.get("body"))
+            elapsed = time.perf_counter() - started
+            latencies[request["path"]].append(elapsed)
+            if response.status_code >= 400:
+                errors[f"{request['path']} {response.status_code}"] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "requests": len(all_latencies),
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_second": len(all_latencies) / elapsed if elapsed else 0.0,
+        **percentiles(all_latencies),
+        "errors": sum(errors.values()),
+        "errors_by_route": dict(errors),
+        "routes": {path: {"requests": len(values), **percentiles(values)} for path, values in sorted(latencies.items())},
+    }
+
+def run_load(concurrency: int = 8, total: int = 2000, requests_path: Path = REQUESTS_PATH) -> dict:
+    requests = load_requests(requests_path)
+    # Démarrage comme le lifespan (chargement + warmup), hors de la mesure
+    predict.startup()
+    rss_before = rss_mb()
+    result = asyncio.run(replay(requests, concurrency, total))
+    result.update({
+        "engine": predict.model_loader.engine,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Test de charge en processus de l'API")
+    parser.add_argument("--concurrency", type=int, default=8, help="Nombre de clients concurrents")
+    parser.add_argument("--requests", type=int, default=2000, help="Nombre total de requêtes envoyées")
+    parser.add_argument("--input", type=Path, default=REQUESTS_PATH, help="Requêtes à rejouer (JSONL)")
+    parser.add_argument("--output", type=Path, help="Fichier JSON de sortie (sinon stdout)")
+    args = parser.parse_args(argv)
+    output = json.dumps(run_load(args.concurrency, args.requests, args.input), indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
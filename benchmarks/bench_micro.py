@@ -0,0 +1,117 @@
+"""
+Micro-benchmarks du chemin de prédiction.
+
+Usage : python benchmarks/bench_micro.py [--repeat 200] [--output micro.json]
+
+Mesure, dans le processus courant :
+- FeatureProcessor.prepare_features_for_prediction (validation + DataFrame d'une requête) ;
+- predict_price (encodage, scalers et modèle, sans HTTP) pour un appartement et une maison ;
+- predict_price_interval (même chemin avec les quantiles PREDICTION_QUANTILES) pour une maison ;
+- le modèle maisons seul, par parcours des arbres (artefact .forest) et par table de prédiction ;
+- predict_sweep_grid : courbe de 281 surfaces d'une maison (grille, encodage et prédiction) ;
+- MarketStats.lookup : statistiques de marché d'un groupe (appartements 3 pièces, 59000) ;
+- le chargement des modèles par ModelLoader (registre neuf, tous les modèles actifs).
+Les durées (médiane, p95) sont en microsecondes, le résultat est écrit en JSON.
+"""
+import argparse
+import json
+import numpy as np
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+from app import config  # noqa: E402
+from app.market_stats import MarketStatsService  # noqa: E402
+from app.models.model_loader import ModelLoader  # noqa: E402
+from app.routes import predict  # noqa: E402
+from app.schemas.schemas import PredictionRequest, SweepRequest  # noqa: E402
+from app.utils import FeatureProcessor  # noqa: E402
+
+FEATURES = {
+    "Appartement": {"surface_bati": 85.0, "nombre_pieces": 4, "type_local": "Appartement",
+                    "surface_terrain": 0.0, "nombre_lots": 2},
+    "Maison": {"surface_bati": 110.0, "nombre_pieces": 4, "type_local": "Maison",
+               "surface_terrain": 350.0, "nombre_lots": 0},
+}
+
+def measure(fn, repeat: int, warmup: int = 5) -> dict:
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1e6)
+    durations.sort()
+    median = statistics.median(durations)
+    return {
+        "median_us": median,
+        "p95_us": durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+        "ops_per_second": 1e6 / median if median else 0.0,
+    }
+
+def load_all_models() -> None:
+    loader = ModelLoader(engine=predict.model_loader.engine)
+    for entry in loader.entries.values():
+        if entry.active:
+            loader.get_bundle(entry.type_local, entry.ville, entry.version)
+
+def run_micro(repeat: int = 200) -> dict:
+    feature_processor = FeatureProcessor()
+    predict.init_service()
+    results = {
+        "prepare_features_for_prediction": measure(
+            lambda: feature_processor.prepare_features_for_prediction(dict(FEATURES["Maison"])), repeat
+        ),
+    }
+    for type_local, features in FEATURES.items():
+        request = PredictionRequest(**features)
+        results[f"predict_price_{type_local.lower()}"] = measure(
+            lambda: predict.predict_price(request, "lille"), repeat
+        )
+    # Surcoût de l'intervalle de prédiction (quantiles des 200 arbres du modèle maisons)
+    request = PredictionRequest(**FEATURES["Maison"])
+    quantiles = predict.parse_quantiles(config.PREDICTION_QUANTILES)
+    results["predict_price_maison_interval"] = measure(
+        lambda: predict.predict_price_interval(request, "lille", request.model_dump(), quantiles), repeat
+    )
+    sweep = SweepRequest(ville="lille", features=FEATURES["Maison"],
+                         axes=[{"feature": "surface_bati", "start": 20, "stop": 300, "step": 1}])
+    results["predict_sweep_maison_281"] = measure(lambda: predict.predict_sweep_grid(sweep), repeat)
+    # Statistiques précalculées : lecture d'une ligne des tableaux et mise en forme
+    market_stats = MarketStatsService(["lille"], ROOT_PATH / "data")
+    market_stats.refresh()
+    lille_stats = market_stats.get("lille")
+    results["market_stats_lookup"] = measure(lambda: lille_stats.lookup(59000, "Appartement", 3), repeat)
+    # Prédiction d'une ligne par le modèle maisons : parcours des 200 arbres ou table exacte
+    loader = ModelLoader(engine="lookup")
+    row = np.array([[110.0, 350.0, 0.0]])
+    artifact = loader.get_bundle("Maison", "lille").artifact
+    if artifact is not None:
+        results["artifact_predict_maison"] = measure(lambda: artifact.predict(row), repeat)
+    table = loader.get_lookup_table("Maison", "lille")
+    if table is not None:
+        results["lookup_table_predict_maison"] = measure(lambda: table.predict(row), repeat)
+    # Le chargement est lent : peu de répétitions suffisent
+    results["model_loader_load"] = measure(load_all_models, max(3, repeat // 50), warmup=1)
+    results["model_loader_load"]["engine"] = predict.model_loader.engine
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks du chemin de prédiction")
+    parser.add_argument("--repeat", type=int, default=200, help="Nombre de mesures par benchmark")
+    parser.add_argument("--output", type=Path, help="Fichier JSON de sortie (sinon stdout)")
+    args = parser.parse_args(argv)
+    output = json.dumps(run_micro(args.repeat), indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
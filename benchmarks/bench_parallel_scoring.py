@@ -0,0 +1,58 @@
+"""
+Benchmark de scaling du scoring en masse (python -m app.scoring --workers N).
+
+Usage : python benchmarks/bench_parallel_scoring.py [--rows 1000000] [--workers 1 2 4 8]
+
+Un CSV synthétique est construit en répétant les exports DVF de data/, puis scoré
+avec 1, 2, 4 et N processus (N = nombre de cœurs). Le débit et l'accélération par
+rapport à 1 processus sont affichés en JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+from app.models.model_loader import ModelLoader  # noqa: E402
+from app.scoring import DVF_DTYPES, score_csv  # noqa: E402
+
+def build_input(path: Path, rows: int) -> None:
+    # Répète les CSV DVF jusqu'à atteindre le nombre de lignes demandé
+    import pandas as pd
+    base = pd.concat([
+        pd.read_csv(csv, usecols=list(DVF_DTYPES), low_memory=False)
+        for csv in sorted((ROOT_PATH / "data").glob("*.csv"))
+    ])
+    repeats = max(1, -(-rows // len(base)))
+    pd.concat([base] * repeats).head(rows).to_csv(path, index=False)
+
+def main(argv=None) -> int:
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Scaling du scoring parallèle")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Taille du CSV synthétique")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Lignes par morceau")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, cpu_count}))
+    args = parser.parse_args(argv)
+
+    model_loader = ModelLoader(engine="native")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = Path(tmp) / "dvf.csv"
+        build_input(input_path, args.rows)
+        for workers in args.workers:
+            report = score_csv(input_path, Path(tmp) / f"out_{workers}.csv", chunksize=args.chunksize,
+                               model_loader=model_loader, workers=workers)
+            results.append(report)
+
+    baseline = results[0]["rows_per_second"]
+    for report in results:
+        report["speedup"] = report["rows_per_second"] / baseline if baseline else 0.0
+    print(json.dumps({"cpu_count": cpu_count, "rows": args.rows, "results": results}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Mesure du temps de démarrage de l'API dans un processus neuf.
+
+Usage : python benchmarks/bench_startup.py [--runs 5] [--output startup.json]
+
+Chaque mesure lance un interpréteur Python vierge qui importe app.main puis exécute
+le démarrage complet (chargement des modèles + warmup), comme le lifespan de FastAPI.
+Le résultat (médiane et détail par run) est écrit en JSON pour être suivi entre versions.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+
+# Script exécuté dans le processus enfant
+CHILD_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from app.routes import predict
+predict.startup()
+ready = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "load_seconds": predict.service_state["load_seconds"],
+    "warmup_seconds": predict.service_state["warmup_seconds"],
+    "total_seconds": ready - started,
+}))
+"""
+
+def measure_once() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD_SCRIPT],
+        cwd=ROOT_PATH, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Temps de démarrage de l'API")
+    parser.add_argument("--runs", type=int, default=5, help="Nombre de processus mesurés")
+    parser.add_argument("--output", type=Path, help="Fichier JSON de sortie (sinon stdout)")
+    args = parser.parse_args(argv)
+
+    runs = [measure_once() for _ in range(args.runs)]
+    result = {
+        "runs": runs,
+        "median": {key: statistics.median(run[key] for run in runs) for key in runs[0]},
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Construit benchmarks/requests.jsonl : requêtes réalistes rejouées par bench_load.py.
+
+Usage : python benchmarks/build_requests.py [--count 500] [--seed 42]
+
+Les biens sont tirés des exports DVF de data/ (appartements et maisons aux valeurs
+acceptées par l'API). Le mélange reprend l'usage attendu : /predict/lille, /predict/bordeaux,
+/predict (ville dans le corps) et quelques /predict/batch de 20 biens.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+
+from app.dataset import load_dataset  # noqa: E402
+
+COLUMNS = ["Type local", "Surface reelle bati", "Nombre pieces principales", "Surface terrain", "Nombre de lots"]
+# Part de chaque route dans le mélange de requêtes
+ROUTES = {"/predict/lille": 0.40, "/predict/bordeaux": 0.30, "/predict": 0.25, "/predict/batch": 0.05}
+BATCH_SIZE = 20
+
+def load_features(ville: str):
+    df = load_dataset(ROOT_PATH / "data" / f"{ville}_2022.csv", COLUMNS)
+    df = df[df["Type local"].isin(["Appartement", "Maison"])].dropna(subset=COLUMNS[:3])
+    df = df[(df["Surface reelle bati"] > 0) & (df["Surface reelle bati"] <= 10000)
+            & df["Nombre pieces principales"].between(1, 50)
+            & (df["Surface terrain"].fillna(0) <= 10000) & (df["Nombre de lots"] <= 100)]
+    return [
+        {
+            "surface_bati": float(row["Surface reelle bati"]),
+            "nombre_pieces": int(row["Nombre pieces principales"]),
+            "type_local": str(row["Type local"]),
+            "surface_terrain": float(0 if np.isnan(row["Surface terrain"]) else row["Surface terrain"]),
+            "nombre_lots": int(row["Nombre de lots"]),
+        }
+        for _, row in df.iterrows()
+    ]
+
+def build(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    features = {ville: load_features(ville) for ville in ("lille", "bordeaux")}
+
+    def pick(ville):
+        return features[ville][rng.integers(len(features[ville]))]
+
+    routes = rng.choice(list(ROUTES), size=count, p=list(ROUTES.values()))
+    for path in routes:
+        ville = str(rng.choice(["lille", "bordeaux"]))
+        if path == "/predict/lille":
+            body = pick("lille")
+        elif path == "/predict/bordeaux":
+            body = pick("bordeaux")
+        elif path == "/predict":
+            body = {"ville": ville, "features": pick(ville)}
+        else:
+            villes = rng.choice(["lille", "bordeaux"], size=BATCH_SIZE)
+            body = {"items": [{"ville": str(v), "features": pick(str(v))} for v in villes]}
+        yield {"method": "POST", "path": str(path), "body": body}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Génère les requêtes rejouées par le test de charge")
+    parser.add_argument("--count", type=int, default=500, help="Nombre de requêtes")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    parser.add_argument("--output", type=Path, default=Path(__file__).parent / "requests.jsonl")
+    args = parser.parse_args(argv)
+    with open(args.output, "w", encoding="utf-8") as f:
+        for request in build(args.count, args.seed):
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Suite de benchmarks avec comparaison à une référence.
+
+Usage :
+    python benchmarks/run_suite.py [--threshold 0.25] [--output results.json]
+    python benchmarks/run_suite.py --update-baseline   # enregistre benchmarks/baseline.json
+
+Lance les micro-benchmarks (bench_micro.py) puis le test de charge (bench_load.py) et
+compare les métriques suivies à benchmarks/baseline.json. Le code de sortie vaut 1 si une
+métrique est moins bonne que la référence de plus de --threshold (25 % par défaut) ou si le
+test de charge renvoie plus d'erreurs. La référence dépend de la machine : la régénérer avec
+--update-baseline sur la machine qui exécute la suite.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(Path(__file__).parent))
+
+from bench_load import run_load  # noqa: E402
+from bench_micro import run_micro  # noqa: E402
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+def tracked_metrics(results: dict) -> dict:
+    # Métriques comparées à la référence : nom -> (valeur, plus grand = meilleur)
+    metrics = {}
+    for name, values in results["micro"].items():
+        metrics[f"micro.{name}.median_us"] = (values["median_us"], False)
+        metrics[f"micro.{name}.p95_us"] = (values["p95_us"], False)
+    load = results["load"]
+    metrics["load.requests_per_second"] = (load["requests_per_second"], True)
+    for name in ("p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"):
+        metrics[f"load.{name}"] = (load[name], False)
+    return metrics
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Liste des régressions par rapport à la référence"""
+    regressions = []
+    current, reference = tracked_metrics(results), tracked_metrics(baseline)
+    for name, (value, higher_is_better) in sorted(current.items()):
+        if name not in reference or value is None or reference[name][0] in (None, 0):
+            continue
+        base = reference[name][0]
+        change = (value - base) / base
+        worse = change < -threshold if higher_is_better else change > threshold
+        if worse:
+            regressions.append({"metric": name, "baseline": base, "value": value, "change": change})
+    if results["load"]["errors"] > baseline["load"]["errors"]:
+        regressions.append({
+            "metric": "load.errors", "baseline": baseline["load"]["errors"], "value": results["load"]["errors"],
+            "change": None,
+        })
+    return regressions
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpu_count": os.cpu_count()}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks et détection de régressions")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Fichier de référence")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Dégradation tolérée (0.25 = 25 %%)")
+    parser.add_argument("--repeat", type=int, default=200, help="Mesures par micro-benchmark")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients concurrents du test de charge")
+    parser.add_argument("--requests", type=int, default=2000, help="Requêtes du test de charge")
+    parser.add_argument("--output", type=Path, help="Fichier JSON des résultats (sinon stdout)")
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistre les résultats comme référence")
+    args = parser.parse_args(argv)
+
+    results = {
+        "environment": environment(),
+        "micro": run_micro(args.repeat),
+        "load": run_load(args.concurrency, args.requests),
+    }
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        report = {"results": results, "baseline_updated": str(args.baseline)}
+        regressions = []
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.threshold)
+        report = {"results": results, "threshold": args.threshold, "regressions": regressions}
+        if baseline.get("environment") != results["environment"]:
+            report["warning"] = "Référence mesurée sur une autre machine : comparaison indicative"
+    else:
+        regressions = []
+        report = {"results": results, "warning": f"Pas de référence ({args.baseline}), lancer --update-baseline"}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+    if regressions:
+        print(f"{len(regressions)} régression(s) au-delà de {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import json
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -104,4 +106,174 @@ def test_invalid_ville():
             }
         }
     )
-    assert response.status_code == 422  # Erreur de validation attendue
\ No newline at end of file
+    assert response.status_code == 422  # Erreur de validation attendue
+
+# Test de la prédiction batch (POST /predict/batch) avec villes et types mélangés
+def test_predict_batch():
+    items = [
+        {"ville": "lille", "features": {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+        {"ville": "bordeaux", "features": {"surface_bati": 120, "nombre_pieces": 4, "type_local": "Maison", "surface_terrain": 500, "nombre_lots": 0}},
+        {"ville": "lille", "features": {"surface_bati": 80, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 2}},
+    ]
+    response = client.post("/predict/batch", json={"items": items})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["n_success"] == 3 and data["n_errors"] == 0
+    assert [r["index"] for r in data["results"]] == [0, 1, 2]  # Ordre d'entrée conservé
+    assert [r["ville_modele"] for r in data["results"]] == ["Lille", "Bordeaux", "Lille"]
+    # Chaque résultat doit être identique à la prédiction unitaire
+    for item, result in zip(items, data["results"]):
+        single = client.post("/predict", json=item).json()
+        assert result["prix_m2_estime"] == single["prix_m2_estime"]
+
+# Test du batch avec un élément invalide : seule cette ligne est en erreur
+def test_predict_batch_invalid_item():
+    items = [
+        {"ville": "lille", "features": {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+        {"ville": "paris", "features": {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+        {"ville": "lille", "features": {"surface_bati": -5, "nombre_pieces": 4, "type_local": "Bureau", "surface_terrain": 0, "nombre_lots": 1}},
+    ]
+    response = client.post("/predict/batch", json={"items": items})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["n_success"] == 1 and data["n_errors"] == 2
+    assert data["results"][0]["error"] is None
+    assert data["results"][1]["error"] is not None
+    assert data["results"][2]["prix_m2_estime"] is None
+
+# Test d'erreur si le batch est vide
+def test_predict_batch_empty():
+    response = client.post("/predict/batch", json={"items": []})
+    assert response.status_code == 422
+
+# Une requête répétée est servie par le cache
+def test_predict_cache_hit():
+    payload = {
+        "surface_bati": 95,
+        "nombre_pieces": 4,
+        "type_local": "Appartement",
+        "surface_terrain": 0,
+        "nombre_lots": 1
+    }
+    if not client.get("/predict/cache/stats").json()["enabled"]:
+        pytest.skip("cache désactivé (PREDICTION_CACHE_SIZE=0)")
+    first = client.post("/predict/lille", json=payload).json()
+    hits_before = client.get("/predict/cache/stats").json()["hits"]
+    second = client.post("/predict/lille", json=payload).json()
+    assert second == first
+    assert client.get("/predict/cache/stats").json()["hits"] == hits_before + 1
+
+# Intervalle de prédiction : quantiles des arbres, prédiction ponctuelle inchangée
+def test_predict_interval():
+    payload = {"surface_bati": 120, "nombre_pieces": 4, "type_local": "Maison", "surface_terrain": 500, "nombre_lots": 0}
+    point = client.post("/predict/bordeaux", json=payload).json()
+    assert "quantiles" not in point  # Réponse ponctuelle sans champ supplémentaire
+    response = client.post("/predict/bordeaux?interval=true", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["prix_m2_estime"] == point["prix_m2_estime"]
+    assert list(data["quantiles"]) == ["p10", "p50", "p90"]
+    assert data["quantiles"]["p10"] <= data["quantiles"]["p50"] <= data["quantiles"]["p90"]
+    assert data["quantiles"]["p10"] < data["quantiles"]["p90"]  # Forêt de 200 arbres : bande non vide
+
+    custom = client.post("/predict", params={"quantiles": "0.025,0.975"},
+                         json={"ville": "lille", "features": payload}).json()
+    assert list(custom["quantiles"]) == ["p2.5", "p97.5"]
+    assert client.post("/predict/lille?quantiles=1.5", json=payload).status_code == 422
+    assert client.post("/predict/lille?quantiles=abc", json=payload).status_code == 422
+
+# Intervalle en batch : mêmes quantiles que les requêtes unitaires
+def test_predict_batch_interval():
+    items = [
+        {"ville": "lille", "features": {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+        {"ville": "bordeaux", "features": {"surface_bati": 120, "nombre_pieces": 4, "type_local": "Maison", "surface_terrain": 500, "nombre_lots": 0}},
+    ]
+    data = client.post("/predict/batch?interval=true", json={"items": items}).json()
+    for item, result in zip(items, data["results"]):
+        single = client.post("/predict?interval=true", json=item).json()
+        assert result["quantiles"] == single["quantiles"]
+        assert result["prix_m2_estime"] == single["prix_m2_estime"]
+
+# Sweep : grille d'une ou deux features, mêmes prix que les requêtes unitaires
+MAISON = {"surface_bati": 110, "nombre_pieces": 4, "type_local": "Maison", "surface_terrain": 350, "nombre_lots": 0}
+
+@pytest.mark.parametrize("use_lookup", [True, False])
+def test_predict_sweep(monkeypatch, use_lookup):
+    from app import config
+    monkeypatch.setattr(config, "SWEEP_USE_LOOKUP", use_lookup)
+    response = client.post("/predict/sweep", json={
+        "ville": "lille", "features": MAISON,
+        "axes": [{"feature": "surface_bati", "start": 20, "stop": 300, "step": 20}],
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["shape"] == [15]
+    assert data["axes"]["surface_bati"] == [20.0 + 20 * i for i in range(15)]
+    for surface, price in zip(data["axes"]["surface_bati"][::4], data["prix_m2_estime"][::4]):
+        single = client.post("/predict/lille", json=dict(MAISON, surface_bati=surface)).json()
+        assert price == single["prix_m2_estime"]
+
+def test_predict_sweep_two_axes_interval():
+    terrains = [0, 200, 1000]
+    data = client.post("/predict/sweep?interval=true", json={
+        "ville": "bordeaux", "features": MAISON,
+        "axes": [{"feature": "surface_bati", "values": [60, 90, 150]}, {"feature": "surface_terrain", "values": terrains}],
+    }).json()
+    assert data["shape"] == [3, 3] and len(data["prix_m2_estime"]) == 9
+    assert list(data["quantiles"]) == ["p10", "p50", "p90"]
+    # Premier axe le plus lent : point (i, j) à l'indice i * 3 + j
+    single = client.post("/predict/bordeaux?interval=true",
+                         json=dict(MAISON, surface_bati=90, surface_terrain=1000)).json()
+    assert data["prix_m2_estime"][1 * 3 + 2] == single["prix_m2_estime"]
+    assert data["quantiles"]["p90"][5] == single["quantiles"]["p90"]
+
+def test_predict_sweep_invalid():
+    def sweep(axes, features=MAISON):
+        return client.post("/predict/sweep", json={"ville": "lille", "features": features, "axes": axes})
+    # Grille trop grande : refusée avant tout calcul
+    assert sweep([{"feature": "surface_bati", "start": 1, "stop": 10000, "step": 0.01}]).status_code == 422
+    assert sweep([{"feature": "surface_bati", "start": 1, "stop": 100}]).status_code == 422
+    # Valeurs non finies ou pas trop petit : 422 plutôt qu'une erreur au calcul de la taille de la grille
+    for axis in ('{"feature": "surface_bati", "start": 1, "stop": Infinity, "step": 1}',
+                 '{"feature": "surface_bati", "start": 1, "stop": 100, "step": NaN}',
+                 '{"feature": "surface_bati", "values": [50, NaN]}',
+                 '{"feature": "surface_bati", "start": -1e308, "stop": 1e308, "step": 1e-300}'):
+        body = f'{{"ville": "lille", "features": {json.dumps(MAISON)}, "axes": [{axis}]}}'
+        response = client.post("/predict/sweep", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 422
+    assert sweep([{"feature": "surface_bati", "values": [50]}, {"feature": "surface_bati", "values": [60]}]).status_code == 422
+    assert sweep([{"feature": "nombre_pieces", "values": [3]}]).status_code == 422
+    # Valeurs hors bornes ou lots non entiers
+    assert sweep([{"feature": "surface_bati", "values": [0, 50]}]).status_code == 400
+    assert sweep([{"feature": "nombre_lots", "values": [0.5]}]).status_code == 400
+
+# Sonde de vivacité (GET /health/live)
+def test_health_live():
+    response = client.get("/health/live")
+    assert response.status_code == 200
+
+# Sonde de disponibilité : prête une fois le lifespan (chargement + warmup) terminé
+def test_health_ready():
+    import time
+    with TestClient(app) as started_client:
+        for _ in range(100):
+            response = started_client.get("/health/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.1)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["warmup_seconds"] is not None
+
+# Pas prête tant que les index des comparables et les statistiques ne sont pas chargés
+def test_health_ready_waits_for_all_startups(monkeypatch):
+    from app import config
+    from app.routes import predict, stats
+    seen = []
+    monkeypatch.setattr(config, "STARTUP_BACKGROUND_WARMUP", False)
+    monkeypatch.setitem(predict.service_state, "ready", False)
+    monkeypatch.setattr(stats, "startup", lambda: seen.append(predict.service_state["ready"]))
+    with TestClient(app) as started_client:
+        assert started_client.get("/health/ready").status_code == 200
+    assert seen == [False]
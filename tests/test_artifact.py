@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from app.dataset import load_dataset
+from app.models.artifact import ForestArtifact, convert_models, float32_floor
+from app.models.model_loader import MANIFEST_NAME, ModelLoader
+
+ROOT_PATH = Path(__file__).parent.parent
+MODEL_FEATURES = ['Surface reelle bati', 'Surface terrain', 'Nombre de lots']
+
+# ---
+# Fixtures : pickles du dépôt (sans les artefacts) et features brutes des CSV DVF
+# ---
+@pytest.fixture(scope="module")
+def pickle_loader():
+    return ModelLoader(use_artifacts=False)
+
+@pytest.fixture(scope="module")
+def dvf_features():
+    frames = [
+        load_dataset(ROOT_PATH / "data" / name, MODEL_FEATURES)
+        for name in ("lille_2022.csv", "bordeaux_2022.csv")
+    ]
+    X = pd.concat(frames).dropna().to_numpy(dtype=float)
+    # Plus des points aléatoires, dont beaucoup tombent loin des données d'entraînement
+    return np.vstack([X, np.random.default_rng(0).uniform(0, 1000, (5000, 3))])
+
+@pytest.fixture
+def models_dir(tmp_path):
+    for f in (ROOT_PATH / "models").glob("*.pkl"):
+        shutil.copy(f, tmp_path / f.name)
+    manifest = json.loads((ROOT_PATH / "models" / MANIFEST_NAME).read_text())
+    for item in manifest["models"]:
+        item.pop("artifact", None)
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest))
+    return tmp_path
+
+# ---
+# L'artefact donne exactement les prédictions de scaler_x -> modèle -> scaler_y
+# ---
+@pytest.mark.parametrize("type_local", ["Appartement", "Maison"])
+def test_artifact_matches_sklearn_exactly(pickle_loader, dvf_features, type_local, tmp_path):
+    model, scaler_x, scaler_y, _ = pickle_loader.get_model_and_scalers(type_local, "lille")
+    expected = scaler_y.inverse_transform(
+        model.predict(scaler_x.transform(pd.DataFrame(dvf_features, columns=MODEL_FEATURES))).reshape(-1, 1)
+    )[:, 0]
+    ForestArtifact.from_estimator(model, scaler_x, scaler_y, version="v1").save(tmp_path / "model.forest")
+    artifact = ForestArtifact.load(tmp_path / "model.forest")
+    assert np.array_equal(artifact.predict(dvf_features), expected)
+
+# Un seul parcours : prédiction identique à predict et prédiction de chaque arbre
+def test_predict_trees(pickle_loader, dvf_features, tmp_path):
+    model, scaler_x, scaler_y, _ = pickle_loader.get_model_and_scalers("Maison", "lille")
+    artifact = ForestArtifact.from_estimator(model, scaler_x, scaler_y)
+    X = dvf_features[:500]
+    predictions, tree_values = artifact.predict_trees(X)
+    assert np.array_equal(predictions, artifact.predict(X))
+    assert tree_values.shape == (len(model.estimators_), len(X))
+    x_scaled = scaler_x.transform(pd.DataFrame(X, columns=MODEL_FEATURES))
+    first_tree = scaler_y.inverse_transform(model.estimators_[0].predict(x_scaled).reshape(-1, 1))[:, 0]
+    np.testing.assert_allclose(tree_values[0], first_tree, rtol=1e-12)
+
+# Chargement sans copie : vues en lecture seule du fichier, types compacts
+def test_artifact_is_memory_mapped(pickle_loader, tmp_path):
+    model, scaler_x, scaler_y, _ = pickle_loader.get_model_and_scalers("Maison", "lille")
+    ForestArtifact.from_estimator(model, scaler_x, scaler_y, version="v1").save(tmp_path / "model.forest")
+    artifact = ForestArtifact.load(tmp_path / "model.forest")
+    assert artifact.feature_names == MODEL_FEATURES
+    assert artifact.version == "v1" and artifact.model_type == "RandomForestRegressor"
+    assert artifact.n_trees == len(model.estimators_)
+    assert artifact.feature.dtype == np.int32 and artifact.threshold.dtype == np.float32
+    for name in ("feature", "threshold", "left", "right", "value"):
+        array = getattr(artifact, name)
+        assert not array.flags.owndata and not array.flags.writeable
+        while array.base is not None and not isinstance(array, np.memmap):
+            array = array.base
+        assert isinstance(array, np.memmap)
+
+def test_float32_floor():
+    values = np.array([0.1, -0.1, 1.5, 1e-40, -3.0000001])
+    floored = float32_floor(values)
+    assert floored.dtype == np.float32
+    assert np.all(floored.astype(np.float64) <= values)
+    assert np.all(np.nextafter(floored, np.float32(np.inf)).astype(np.float64) > values)
+
+def test_invalid_artifact(tmp_path):
+    (tmp_path / "bad.forest").write_bytes(b"not a model")
+    with pytest.raises(ValueError):
+        ForestArtifact.load(tmp_path / "bad.forest")
+
+# ---
+# Conversion des pickles du manifeste et service par le registre
+# ---
+def test_convert_and_serve_from_artifacts(models_dir, pickle_loader):
+    converted = convert_models(models_dir, update_manifest=True)
+    assert {item["artifact"] for item in converted} == {"model_appartements.forest", "model_maisons.forest"}
+    manifest = json.loads((models_dir / MANIFEST_NAME).read_text())
+    assert all("artifact" in item for item in manifest["models"])
+
+    loader = ModelLoader(models_path=models_dir)
+    bundle = loader.get_bundle("Maison", "bordeaux")
+    assert bundle.artifact is not None and bundle._pickles is None  # Aucun pickle chargé
+    X = np.array([[120.0, 400.0, 0.0], [85.0, 0.0, 1.0]])
+    model, scaler_x, scaler_y, _ = pickle_loader.get_model_and_scalers("Maison", "bordeaux")
+    expected = scaler_y.inverse_transform(
+        model.predict(scaler_x.transform(pd.DataFrame(X, columns=MODEL_FEATURES))).reshape(-1, 1)
+    )[:, 0]
+    assert np.array_equal(bundle.artifact.predict(X), expected)
+    # Les pickles restent accessibles à la demande (mise à jour incrémentale, moteur natif)
+    assert bundle.model_name == "RandomForestRegressor"
+    assert type(bundle.model).__name__ == "RandomForestRegressor"
+
+# Entrée sans pickle : seul l'artefact est servi
+def test_artifact_only_entry(models_dir):
+    convert_models(models_dir)
+    (models_dir / MANIFEST_NAME).write_text(json.dumps({"models": [
+        {"ville": "lille", "type_local": "Maison", "version": "v1", "artifact": "model_maisons.forest"}
+    ]}))
+    loader = ModelLoader(models_path=models_dir)
+    assert loader.get_bundle("Maison", "lille").artifact.predict(np.array([[100.0, 200.0, 0.0]])).shape == (1,)
+    with pytest.raises(RuntimeError):
+        loader.get_model_and_scalers("Maison", "lille")
+
+# Moteur sklearn : les artefacts du manifeste ne sont pas ouverts, les pickles sont servis
+def test_sklearn_engine_ignores_artifacts(models_dir):
+    convert_models(models_dir, update_manifest=True)
+    bundle = ModelLoader(engine="sklearn", models_path=models_dir).get_bundle("Maison", "lille")
+    assert bundle.artifact is None
+    assert type(bundle.model).__name__ == "RandomForestRegressor"
+    assert ModelLoader(models_path=models_dir).get_bundle("Maison", "lille").artifact is not None
+
+# Pickle remplacé après la conversion : l'artefact obsolète n'est plus servi
+def test_stale_artifact_is_rebuilt_from_pickles(models_dir, pickle_loader):
+    convert_models(models_dir, update_manifest=True)
+    # Pickle seulement « touché » (copie, déploiement) : l'artefact reste valide
+    os.utime(models_dir / "model_maisons.pkl", ns=(0, 0))
+    assert ModelLoader(models_path=models_dir).get_bundle("Maison", "lille")._pickles is None
+
+    shutil.copy(models_dir / "model_appartements.pkl", models_dir / "model_maisons.pkl")
+    bundle = ModelLoader(models_path=models_dir).get_bundle("Maison", "lille")
+    model, _, _, _ = pickle_loader.get_model_and_scalers("Appartement", "lille")
+    _, scaler_x, scaler_y, _ = pickle_loader.get_model_and_scalers("Maison", "lille")
+    X = np.array([[120.0, 400.0, 0.0], [85.0, 0.0, 1.0]])
+    expected = scaler_y.inverse_transform(
+        model.predict(scaler_x.transform(pd.DataFrame(X, columns=MODEL_FEATURES))).reshape(-1, 1)
+    )[:, 0]
+    assert np.array_equal(bundle.artifact.predict(X), expected)
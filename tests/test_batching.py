@@ -0,0 +1,74 @@
+import asyncio
+import numpy as np
+import pytest
+from app.batching import MicroBatcher
+
+# ---
+# Tests du micro-batching des prédictions unitaires
+# ---
+
+# Fonction de prédiction factice : garde la trace des appels au "modèle"
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, rows, ville, type_local):
+        self.calls.append((ville, type_local, len(rows)))
+        return rows.sum(axis=1)
+
+# Les requêtes concurrentes d'un même modèle sont prédites en un seul appel
+def test_concurrent_requests_are_batched():
+    model = FakeModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_wait_ms=50, max_batch_size=8)
+        rows = [[float(i), 0.0, 1.0] for i in range(8)]
+        results = await asyncio.gather(*[
+            batcher.submit("lille", "Appartement", row) for row in rows
+        ])
+        await batcher.close()
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert results == [float(i) + 1.0 for i in range(8)]  # Chaque requête reçoit son résultat
+    assert model.calls == [("lille", "Appartement", 8)]
+    stats = batcher.stats.to_dict()
+    assert stats["n_batches"] == 1 and stats["n_requests"] == 8
+    assert stats["mean_batch_size"] == 8
+
+# Un batch ne mélange jamais deux modèles différents
+def test_batches_are_split_by_model():
+    model = FakeModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_wait_ms=5, max_batch_size=64)
+        results = await asyncio.gather(
+            batcher.submit("lille", "Appartement", [1.0, 0.0, 1.0]),
+            batcher.submit("lille", "Maison", [2.0, 0.0, 1.0]),
+            batcher.submit("bordeaux", "Appartement", [3.0, 0.0, 1.0]),
+        )
+        await batcher.close()
+        return results
+
+    assert asyncio.run(scenario()) == [2.0, 3.0, 4.0]
+    assert sorted(model.calls) == [
+        ("bordeaux", "Appartement", 1), ("lille", "Appartement", 1), ("lille", "Maison", 1)
+    ]
+
+# Une erreur du modèle est renvoyée à toutes les requêtes du batch
+def test_batch_error_is_propagated():
+    def failing_model(rows, ville, type_local):
+        raise RuntimeError("modèle indisponible")
+
+    async def scenario():
+        batcher = MicroBatcher(failing_model, max_wait_ms=1, max_batch_size=4)
+        with pytest.raises(RuntimeError):
+            await batcher.submit("lille", "Maison", [1.0, 0.0, 1.0])
+        await batcher.close()
+        return batcher
+
+    assert asyncio.run(scenario()).stats.n_errors == 1
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda rows, v, t: np.zeros(len(rows)), max_batch_size=0)
@@ -0,0 +1,80 @@
+import threading
+import pytest
+from app.cache import PredictionCache
+from app.models.model_loader import ModelLoader
+
+FEATURES = {"surface_bati": 100, "nombre_pieces": 4, "surface_terrain": 0, "nombre_lots": 1}
+
+# Horloge manuelle pour tester l'expiration sans attendre
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# ---
+# Tests du cache LRU des prédictions
+# ---
+def test_key_is_normalized():
+    key_int = PredictionCache.make_key("Lille", "Appartement", "v1", FEATURES)
+    key_float = PredictionCache.make_key("lille", "Appartement", "v1", {
+        "surface_bati": 100.0, "nombre_pieces": 5, "surface_terrain": 0.0, "nombre_lots": 1
+    })
+    assert key_int == key_float  # nombre_pieces n'est pas une feature du modèle
+    assert key_int != PredictionCache.make_key("lille", "Appartement", "v2", FEATURES)
+
+def test_hit_miss_and_lru_eviction():
+    cache = PredictionCache(max_size=2)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    assert cache.get("a") == 1.0  # "a" devient le plus récent
+    cache.put("c", 3.0)  # évince "b"
+    assert cache.get("b") is None
+    assert cache.get("c") == 3.0
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["evictions"] == 1
+    assert stats["size"] == 2
+
+def test_ttl_expiration():
+    clock = FakeClock()
+    cache = PredictionCache(max_size=10, ttl_seconds=60, clock=clock)
+    cache.put("a", 1.0)
+    clock.now = 30
+    assert cache.get("a") == 1.0
+    clock.now = 61
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_concurrent_access():
+    cache = PredictionCache(max_size=100)
+
+    def worker(offset):
+        for i in range(1000):
+            cache.put((offset, i % 150), float(i))
+            cache.get((offset, (i * 7) % 150))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["size"] == 100
+    assert stats["hits"] + stats["misses"] == 8000
+
+# Le cache est vidé quand ModelLoader charge de nouveaux artefacts
+def test_invalidated_on_model_reload():
+    loader = ModelLoader()
+    cache = PredictionCache(max_size=10)
+    loader.add_reload_listener(cache.clear)
+    cache.put(PredictionCache.make_key("lille", "Maison", loader.version, FEATURES), 2500.0)
+    loader.load_models()
+    assert len(cache) == 0
+    assert cache.stats()["invalidations"] == 1
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        PredictionCache(max_size=0)
+    with pytest.raises(ValueError):
+        PredictionCache(ttl_seconds=-1)
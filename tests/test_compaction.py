@@ -0,0 +1,109 @@
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from sklearn.tree import DecisionTreeRegressor
+from app.compaction import compact_all, compact_model, compact_tree, greedy_order
+from app.incremental import predict_raw
+from app.models.model_loader import LEGACY_FILES, ModelLoader
+from app.training import load_training_data, prepare_dataset
+
+ROOT_PATH = Path(__file__).parent.parent
+DATA_PATH = ROOT_PATH / "data"
+
+@pytest.fixture(scope="module")
+def maison_model():
+    model, scaler_x, scaler_y, _ = ModelLoader(use_artifacts=False).get_model_and_scalers("Maison", "lille")
+    return model, scaler_x, scaler_y
+
+@pytest.fixture(scope="module")
+def lille_maisons():
+    return prepare_dataset(load_training_data(DATA_PATH / "lille_2022.csv"), "Maison")
+
+@pytest.fixture
+def models_dir(tmp_path):
+    # Copie des artefacts historiques avec leur manifeste
+    path = tmp_path / "models"
+    path.mkdir()
+    for files in LEGACY_FILES.values():
+        for name in files:
+            shutil.copy(ROOT_PATH / "models" / name, path / name)
+    for artifact in (ROOT_PATH / "models").glob("*.forest"):
+        shutil.copy(artifact, path / artifact.name)
+    shutil.copy(ROOT_PATH / "models" / "manifest.json", path / "manifest.json")
+    return path
+
+# ---
+# Élagage et fusion des feuilles d'un arbre
+# ---
+def test_compact_tree_alpha_zero_is_lossless(maison_model, lille_maisons):
+    model, scaler_x, _ = maison_model
+    X = scaler_x.transform(lille_maisons[0])
+    for tree in model.estimators_[:20]:
+        compacted = compact_tree(tree, 0.0)
+        assert compacted.tree_.node_count <= tree.tree_.node_count
+        assert np.array_equal(compacted.predict(X), tree.predict(X))
+
+def test_compact_tree_merges_identical_leaves():
+    # Fils gauche coupé en deux feuilles (0 et 1), fils droit feuille (5)
+    X = np.array([[0.0], [1.0], [2.0], [3.0]])
+    tree = DecisionTreeRegressor(max_depth=2, random_state=0).fit(X, [0.0, 1.0, 5.0, 5.0])
+    assert tree.tree_.node_count == 5
+    # Les deux feuilles du fils gauche prennent la même valeur : la coupure devient inutile
+    state = tree.tree_.__getstate__()
+    state["values"] = state["values"].copy()
+    state["values"][3] = state["values"][2]
+    tree.tree_.__setstate__(state)
+    compacted = compact_tree(tree)
+    assert compacted.tree_.node_count == 3 and compacted.tree_.max_depth == 1
+    assert np.array_equal(compacted.predict(X), tree.predict(X))
+
+def test_compact_tree_prunes_to_root(maison_model):
+    model, _, _ = maison_model
+    stump = compact_tree(model.estimators_[0], alpha=np.inf)
+    assert stump.tree_.node_count == 1 and stump.tree_.max_depth == 0
+    assert stump.tree_.value[0, 0, 0] == model.estimators_[0].tree_.value[0, 0, 0]
+
+def test_greedy_order():
+    y = np.zeros(4)
+    predictions = np.array([[1.0] * 4, [0.1] * 4, [-1.0] * 4])
+    order = greedy_order(predictions, y)
+    assert order[0] == 1 and sorted(order) == [0, 1, 2]
+
+# ---
+# Compaction d'un modèle dans le budget
+# ---
+def test_compact_model_respects_budget(maison_model, lille_maisons):
+    model, scaler_x, scaler_y = maison_model
+    X, y = lille_maisons
+    half = len(X) // 2
+    result = compact_model(model, scaler_x, scaler_y, X[:half], y[:half], X[half:], y[half:],
+                           max_rmse_increase=0.02, max_r2_drop=0.01)
+    assert result["budget_met"]
+    compact = result["model"]
+    assert sum(t.tree_.node_count for t in compact.estimators_) < sum(t.tree_.node_count for t in model.estimators_)
+    assert result["compact"]["rmse"] <= result["base"]["rmse"] * 1.02
+    assert result["compact"]["r2"] >= result["base"]["r2"] - 0.01
+    # Le modèle d'origine n'est pas modifié
+    assert len(model.estimators_) == 200
+
+def test_compaction_writes_loadable_version(models_dir):
+    metrics = compact_all({"lille": DATA_PATH / "lille_2022.csv"}, "compact", models_dir,
+                          types_local=("Maison",), activate=True)
+    report = metrics["models"][0]
+    assert report["budget_met"]
+    assert report["after"]["node_count"] <= report["before"]["node_count"]
+    assert set(report["before"]) >= {"n_trees", "node_count", "pickle_bytes", "artifact_bytes", "latency_us", "holdout"}
+    assert json.loads((models_dir / "compact" / "metrics.json").read_text())["mode"] == "compaction"
+
+    loader = ModelLoader(models_path=models_dir)
+    bundle = loader.get_bundle("Maison", "lille")
+    assert bundle.version == "compact"
+    model, scaler_x, scaler_y, _ = loader.get_model_and_scalers("Maison", "lille")
+    X = pd.DataFrame([[110.0, 350.0, 0.0], [80.0, 0.0, 1.0]], columns=scaler_x.feature_names_in_)
+    assert np.array_equal(bundle.artifact.predict(X), predict_raw(model, scaler_x, scaler_y, X))
+    assert (models_dir / "compact" / "model_lille_maison.forest").exists()
+    # Autres villes inchangées
+    assert loader.get_bundle("Maison", "bordeaux").version != "compact"
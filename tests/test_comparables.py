@@ -0,0 +1,141 @@
+import time
+import numpy as np
+import pytest
+from pathlib import Path
+from fastapi.testclient import TestClient
+from app.comparables import INDEX_COLUMNS, ComparablesIndex, ComparablesService
+from app.dataset import DatasetCache
+from app.main import app
+
+ROOT_PATH = Path(__file__).parent.parent
+DATASETS = {"lille": ROOT_PATH / "data" / "lille_2022.csv"}
+
+client = TestClient(app)
+
+# ---
+# Fixtures : service avec son propre dossier de cache, index des appartements de Lille
+# ---
+@pytest.fixture
+def service(tmp_path):
+    return ComparablesService(DATASETS, cache=DatasetCache(tmp_path))
+
+@pytest.fixture(scope="module")
+def index():
+    df = DatasetCache().load(DATASETS["lille"], INDEX_COLUMNS)
+    return ComparablesIndex.build(df, "Appartement")
+
+# Distances calculées sur toutes les ventes, pour comparer avec le KD-tree
+def brute_force(index, X, mask=None):
+    X_scaled = ((X - index.mean) / index.scale).astype(np.float32).astype(np.float64)
+    distances = np.sqrt(((X_scaled[:, None, :] - index.points[None, :, :].astype(np.float64)) ** 2).sum(axis=2))
+    if mask is not None:
+        distances[:, ~mask] = np.inf
+    return np.sort(distances, axis=1)
+
+# ---
+# Même résultat que le calcul direct, avec et sans filtre
+# ---
+def test_query_matches_brute_force(index):
+    X = np.random.default_rng(0).uniform([10, 0, 0], [300, 500, 5], (50, 3))
+    distances, rows = index.query(X, k=10)
+    assert rows.shape == (50, 10)
+    np.testing.assert_allclose(distances, brute_force(index, X)[:, :10], rtol=1e-9, atol=1e-12)
+
+@pytest.mark.parametrize("code_postal,section", [(59000, None), (None, "AB"), (59000, "AB")])
+def test_filtered_query(index, code_postal, section):
+    X = np.array([[65.0, 0.0, 2.0], [120.0, 0.0, 1.0]])
+    section_code = index.sections.index("AB")
+    mask = np.ones(len(index), dtype=bool)
+    if code_postal is not None:
+        mask &= index.code_postal == code_postal
+    if section is not None:
+        mask &= index.section == section_code
+    distances, rows = index.query(X, k=5, code_postal=code_postal, section=section)
+    k = min(5, int(mask.sum()))
+    assert distances.shape == (2, k)
+    assert mask[rows].all()
+    np.testing.assert_allclose(distances, brute_force(index, X, mask)[:, :k], rtol=1e-9, atol=1e-12)
+
+# Filtre sans vente : aucun résultat
+def test_unknown_section(index):
+    distances, rows = index.query(np.array([[65.0, 0.0, 2.0]]), section="ZZZ")
+    assert rows.shape == (1, 0)
+
+# Vente présente dans l'index : retrouvée à distance nulle
+def test_describe(index):
+    row = 0
+    X = np.array([[index.surface_bati[row], index.surface_terrain[row], index.nombre_lots[row]]], dtype=float)
+    distances, rows = index.query(X, k=1)
+    sale = index.describe(rows[0], distances[0])[0]
+    assert sale["distance"] == 0
+    assert sale["surface_bati"] == float(index.surface_bati[row])
+    assert sale["prix_m2"] == pytest.approx(sale["valeur_fonciere"] / sale["surface_bati"], rel=1e-3)
+
+def test_query_latency(index):
+    X = np.array([[65.0, 0.0, 2.0]])
+    for _ in range(50):
+        index.query(X, k=10)
+    started = time.perf_counter()
+    for _ in range(200):
+        index.query(X, k=10)
+    assert (time.perf_counter() - started) / 200 < 1e-3
+
+# ---
+# Index enregistré puis rechargé, reconstruit quand le fichier ne correspond plus
+# ---
+def test_persisted_index(service, tmp_path):
+    index = service.get_index("lille", "Maison")
+    path = service.index_path("lille", "Maison")
+    assert path.exists()
+    reloaded = ComparablesService(DATASETS, cache=DatasetCache(tmp_path)).get_index("lille", "Maison")
+    assert reloaded.meta["sha256"] == index.meta["sha256"]
+    for name in ("points", "prix_m2", "code_postal", "section", "date_mutation"):
+        assert np.array_equal(getattr(reloaded, name), getattr(index, name))
+    assert reloaded.points.dtype == np.float32 and reloaded.section.dtype == np.int16
+
+    path.write_bytes(b"corrompu")
+    rebuilt = ComparablesService(DATASETS, cache=DatasetCache(tmp_path)).get_index("lille", "Maison")
+    assert len(rebuilt) == len(index)
+
+# Cache en lecture seule : index construit en mémoire, sans fichier .npz
+def test_read_only_cache(tmp_path, monkeypatch):
+    def read_only(*args, **kwargs):
+        raise PermissionError(30, "Read-only file system")
+    monkeypatch.setattr("app.dataset.tempfile.mkdtemp", read_only)
+    service = ComparablesService(DATASETS, cache=DatasetCache(tmp_path / "cache"))
+    assert service.index_path("lille", "Maison") is None
+    index = service.get_index("lille", "Maison")
+    assert len(index) > 0
+    distances, rows = index.query(np.array([[100.0, 200.0, 0.0]]), k=3)
+    assert rows.shape == (1, 3)
+    assert not (tmp_path / "cache").exists() or not any((tmp_path / "cache").rglob("*.npz"))
+
+def test_unknown_ville(service):
+    with pytest.raises(ValueError):
+        service.get_index("paris", "Maison")
+
+# ---
+# Route /comparables : plusieurs recherches dans une requête
+# ---
+def test_comparables_endpoint():
+    response = client.post("/comparables", json={"queries": [
+        {"ville": "lille", "type_local": "Appartement", "surface_bati": 65, "nombre_lots": 2, "k": 3},
+        {"ville": "bordeaux", "type_local": "Maison", "surface_bati": 120, "surface_terrain": 400},
+        {"ville": "lille", "type_local": "Appartement", "surface_bati": 40, "k": 2, "code_postal": 59000},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert [len(result["comparables"]) for result in results] == [3, 5, 2]
+    for result in results:
+        distances = [sale["distance"] for sale in result["comparables"]]
+        assert distances == sorted(distances)
+    assert all(sale["code_postal"] == 59000 for sale in results[2]["comparables"])
+    assert set(results[0]["comparables"][0]) >= set(["prix_m2", "date_mutation", "section"])
+
+def test_comparables_validation():
+    response = client.post("/comparables", json={"queries": [
+        {"ville": "lille", "type_local": "Appartement", "surface_bati": 65, "k": 500}
+    ]})
+    assert response.status_code == 422
+    assert client.post("/comparables", json={"queries": []}).status_code == 422
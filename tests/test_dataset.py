@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from app.dataset import DatasetCache
+
+@pytest.fixture
+def dvf_csv(tmp_path):
+    # Petit export au format DVF (dates jour/mois/année, textes répétés)
+    path = tmp_path / "dvf.csv"
+    pd.DataFrame({
+        "Date mutation": ["03/01/2022", "15/02/2022", "28/12/2022"],
+        "Valeur fonciere": [219900.0, 150000.0, None],
+        "Commune": ["LILLE", "LILLE", None],
+        "Type local": ["Maison", "Appartement", "Maison"],
+        "Nombre de lots": [0, 1, 2],
+    }).to_csv(path, index=False)
+    return path
+
+@pytest.fixture
+def cache(tmp_path):
+    return DatasetCache(tmp_path / "cache")
+
+# ---
+# Tests du cache binaire des datasets
+# ---
+def test_cache_roundtrip_types(dvf_csv, cache):
+    df = cache.load(dvf_csv)
+    assert df["Date mutation"].dtype == "datetime64[ns]"
+    assert df["Date mutation"].iloc[1] == pd.Timestamp("2022-02-15")
+    assert isinstance(df["Type local"].dtype, pd.CategoricalDtype)
+    assert df["Commune"].isna().tolist() == [False, False, True]
+    assert df["Type local"].tolist() == ["Maison", "Appartement", "Maison"]
+    np.testing.assert_array_equal(df["Nombre de lots"], [0, 1, 2])
+    assert np.isnan(df["Valeur fonciere"].iloc[2])
+
+def test_cache_hit_and_columns(dvf_csv, cache):
+    cache.load(dvf_csv)
+    df = cache.load(dvf_csv, ["Type local", "Valeur fonciere"])
+    assert list(df.columns) == ["Type local", "Valeur fonciere"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    with pytest.raises(ValueError):
+        cache.load(dvf_csv, ["Surface inconnue"])
+
+# Un CSV modifié est reconverti, un CSV seulement « touché » ne l'est pas
+def test_cache_invalidation(dvf_csv, cache):
+    cache.load(dvf_csv)
+    stat = dvf_csv.stat()
+    os.utime(dvf_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    cache.load(dvf_csv)
+    assert cache.misses == 1
+
+    dvf_csv.write_text(dvf_csv.read_text().replace("219900.0", "319900.0"))
+    df = cache.load(dvf_csv)
+    assert cache.misses == 2
+    assert df["Valeur fonciere"].iloc[0] == 319900.0
+
+# Sans dossier configuré, le cache est rangé à côté du CSV
+def test_cache_next_to_source(dvf_csv):
+    cache = DatasetCache("")
+    assert cache.cache_path(dvf_csv) == dvf_csv.parent / ".cache" / dvf_csv.name
+    cache.load(dvf_csv)
+    assert (dvf_csv.parent / ".cache" / dvf_csv.name / "meta.json").exists()
+
+# Seuls Type local et Commune sont des catégories : les autres textes gardent le type de pd.read_csv
+def test_text_columns_stay_objects(tmp_path, cache):
+    path = tmp_path / "sections.csv"
+    pd.DataFrame({"Section": ["AB", None, "AB"], "Commune": ["LILLE", "LILLE", "LOOS"]}).to_csv(path, index=False)
+    df = cache.load(path)
+    expected = pd.read_csv(path)
+    assert df["Section"].dtype == expected["Section"].dtype
+    assert df["Section"].tolist()[0::2] == ["AB", "AB"] and pd.isna(df["Section"].iloc[1])
+    assert isinstance(df["Commune"].dtype, pd.CategoricalDtype)
+    assert df["Commune"].tolist() == expected["Commune"].tolist()
+
+# Dossier du cache en lecture seule : lecture directe du CSV, mêmes types
+def test_read_only_cache_dir(dvf_csv, cache, monkeypatch):
+    def read_only(*args, **kwargs):
+        raise PermissionError(30, "Read-only file system")
+    monkeypatch.setattr("app.dataset.tempfile.mkdtemp", read_only)
+    df = cache.load(dvf_csv, ["Date mutation", "Type local", "Valeur fonciere"])
+    assert list(df.columns) == ["Date mutation", "Type local", "Valeur fonciere"]
+    assert df["Date mutation"].dtype == "datetime64[ns]"
+    assert isinstance(df["Type local"].dtype, pd.CategoricalDtype)
+    assert len(cache.sha256(dvf_csv)) == 64
+    assert not cache.cache_path(dvf_csv).exists()
+    # Fichier source absent : l'erreur n'est pas masquée
+    with pytest.raises(FileNotFoundError):
+        cache.load(dvf_csv.parent / "absent.csv")
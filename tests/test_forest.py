@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from pathlib import Path
+from app.dataset import load_dataset
+from app.models.forest import CompiledForest, tree_quantiles
+from app.models.model_loader import ModelLoader
+
+DATA_PATH = Path(__file__).parent.parent / "data"
+MODEL_FEATURES = ['Surface reelle bati', 'Surface terrain', 'Nombre de lots']
+
+# ---
+# Fixtures : modèles chargés une seule fois et features brutes des CSV DVF
+# ---
+@pytest.fixture(scope="module")
+def model_loader():
+    return ModelLoader(engine="native")
+
+@pytest.fixture(scope="module", params=["lille_2022.csv", "bordeaux_2022.csv"])
+def dvf_features(request):
+    df = load_dataset(DATA_PATH / request.param, MODEL_FEATURES + ['Type local'])
+    df = df[df['Type local'].isin(["Appartement", "Maison"])]
+    df['Surface terrain'] = df['Surface terrain'].fillna(0)
+    return df.dropna()
+
+# ---
+# La forêt compilée doit donner les mêmes prédictions que sklearn sur les données DVF
+# ---
+@pytest.mark.parametrize("type_local", ["Appartement", "Maison"])
+def test_native_matches_sklearn_on_dvf(model_loader, dvf_features, type_local):
+    X = dvf_features[MODEL_FEATURES]
+    model, scaler_x, scaler_y, _ = model_loader.get_model_and_scalers(type_local)
+    expected = scaler_y.inverse_transform(model.predict(scaler_x.transform(X)).reshape(-1, 1))[:, 0]
+    predicted = model_loader.get_compiled_model(type_local).predict(X.to_numpy())
+    np.testing.assert_allclose(predicted, expected, rtol=1e-9)
+
+# Les feuilles atteintes sont les mêmes que celles de sklearn, arbre par arbre
+def test_native_apply_matches_sklearn(model_loader, dvf_features):
+    X = dvf_features[MODEL_FEATURES]
+    model, scaler_x, _, _ = model_loader.get_model_and_scalers("Maison")
+    forest = model_loader.get_compiled_model("Maison")
+    leaves = forest.apply(X.to_numpy())
+    x_scaled = scaler_x.transform(X).astype(np.float32)
+    for i, tree in enumerate(model.estimators_):
+        assert np.array_equal(leaves[i] - forest.roots[i], tree.apply(x_scaled))
+
+def test_compiled_forest_shape_error(model_loader):
+    with pytest.raises(ValueError):
+        model_loader.get_compiled_model("Appartement").predict(np.zeros((2, 4)))
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        ModelLoader(engine="onnx")
+
+# Une forêt sauvegardée puis rouverte en mmap donne les mêmes prédictions
+def test_save_and_load_mmap(model_loader, tmp_path):
+    forest = model_loader.get_compiled_model("Maison")
+    forest.save(tmp_path / "maisons")
+    loaded = CompiledForest.load(tmp_path / "maisons", mmap_mode="r")
+    assert isinstance(loaded.threshold, np.memmap)
+    X = np.array([[120.0, 500.0, 0.0], [85.0, 0.0, 1.0]])
+    np.testing.assert_array_equal(loaded.predict(X), forest.predict(X))
+
+# Quantiles des arbres : mêmes valeurs que np.quantile (interpolation linéaire)
+def test_tree_quantiles_match_numpy():
+    values = np.random.default_rng(0).normal(size=(200, 50))
+    quantiles = (0.0, 0.025, 0.1, 0.5, 0.9, 1.0)
+    np.testing.assert_allclose(tree_quantiles(values, quantiles), np.quantile(values, quantiles, axis=0), rtol=1e-12)
+    np.testing.assert_array_equal(tree_quantiles(values[:1], (0.1, 0.9)), np.repeat(values[:1], 2, axis=0))
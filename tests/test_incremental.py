@@ -0,0 +1,91 @@
+import copy
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from app.incremental import predict_raw, refold_tree, update_all, update_model
+from app.models.model_loader import LEGACY_FILES, ModelLoader
+from app.training import load_training_data, prepare_dataset
+
+ROOT_PATH = Path(__file__).parent.parent
+DATA_PATH = ROOT_PATH / "data"
+
+@pytest.fixture(scope="module")
+def maison_model():
+    model, scaler_x, scaler_y, _ = ModelLoader().get_model_and_scalers("Maison", "lille")
+    return model, scaler_x, scaler_y
+
+@pytest.fixture(scope="module")
+def bordeaux_maisons():
+    return prepare_dataset(load_training_data(DATA_PATH / "bordeaux_2022.csv"), "Maison")
+
+@pytest.fixture
+def monthly_data(tmp_path):
+    # Export de Lille découpé en historique (janvier-octobre) et nouveau mois (novembre-décembre)
+    df = pd.read_csv(DATA_PATH / "lille_2022.csv", low_memory=False)
+    month = df["Date mutation"].str[3:5].astype(int)
+    history, new = tmp_path / "history.csv", tmp_path / "new.csv"
+    df[month <= 10].to_csv(history, index=False)
+    df[month > 10].to_csv(new, index=False)
+    return history, new
+
+@pytest.fixture
+def models_dir(tmp_path):
+    # Copie des artefacts historiques avec leur manifeste
+    path = tmp_path / "models"
+    path.mkdir()
+    for files in LEGACY_FILES.values():
+        for name in files:
+            shutil.copy(ROOT_PATH / "models" / name, path / name)
+    for artifact in (ROOT_PATH / "models").glob("*.forest"):
+        shutil.copy(artifact, path / artifact.name)
+    shutil.copy(ROOT_PATH / "models" / "manifest.json", path / "manifest.json")
+    return path
+
+# ---
+# Les arbres réexprimés dans l'échelle des nouveaux scalers prédisent les mêmes prix
+# ---
+def test_refold_tree_preserves_predictions(maison_model, bordeaux_maisons):
+    model, scaler_x, scaler_y = maison_model
+    X, y = bordeaux_maisons
+    scaler_x_new = copy.deepcopy(scaler_x).partial_fit(X)
+    scaler_y_new = copy.deepcopy(scaler_y).partial_fit(y.to_numpy().reshape(-1, 1))
+    assert not np.allclose(scaler_x_new.mean_, scaler_x.mean_)
+
+    refolded = copy.deepcopy(model)
+    refolded.estimators_ = [refold_tree(t, scaler_x, scaler_x_new, scaler_y, scaler_y_new) for t in model.estimators_]
+    np.testing.assert_allclose(
+        predict_raw(refolded, scaler_x_new, scaler_y_new, X), predict_raw(model, scaler_x, scaler_y, X), rtol=1e-12
+    )
+
+def test_update_model_caps_old_trees(maison_model, bordeaux_maisons):
+    model, scaler_x, scaler_y = maison_model
+    X, y = bordeaux_maisons
+    forest, scaler_x_new, _ = update_model(model, scaler_x, scaler_y, X, y, new_trees=10, max_old_trees=30)
+    assert len(forest.estimators_) == 40
+    assert scaler_x_new.n_samples_seen_ == scaler_x.n_samples_seen_ + len(X)
+    # Le modèle actif n'est pas modifié
+    assert len(model.estimators_) == 200
+
+# ---
+# Mise à jour de bout en bout : nouvelle version, manifeste et rapport de comparaison
+# ---
+def test_update_all(models_dir, monthly_data):
+    history, new = monthly_data
+    metrics = update_all(new, ["lille"], "2022-12", models_dir, activate=True, history=[history],
+                         new_trees=10, max_old_trees=50)
+    report = {m["type_local"]: m for m in metrics["models"]}
+    assert report["Maison"]["n_trees"] == 60
+    # L'appartement était un arbre seul : il devient une forêt de 1 + 10 arbres
+    assert report["Appartement"]["n_trees"] == 11
+    for m in metrics["models"]:
+        assert set(m["delta_vs_full_retrain"]) == {"rmse", "r2"}
+        assert m["incremental"]["rmse"] > 0
+
+    loader = ModelLoader(models_path=models_dir)
+    assert loader.resolve("Maison", "lille").version == "2022-12"
+    assert loader.resolve("Maison", "bordeaux").version == "dvf2022"
+    saved = json.loads((models_dir / "2022-12" / "metrics.json").read_text())
+    assert saved["mode"] == "incremental"
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.inference import DeadlineExceeded, InferenceExecutor, Overloaded
+from app.main import app
+from app.routes import predict
+
+# ---
+# Tests de l'exécuteur d'inférence et du contrôle d'admission
+# ---
+
+KEY = ("lille", "Appartement")
+
+# Au-delà de max_in_flight, une requête est rejetée tout de suite au lieu d'attendre
+def test_overload_is_rejected():
+    executor = InferenceExecutor(kind="thread", workers=2, max_in_flight=1)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run(KEY, release.wait, 5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await executor.run(KEY, lambda: None)
+        # Un autre modèle n'est pas concerné par la limite
+        assert await executor.run(("bordeaux", "Maison"), lambda: 42) == 42
+        release.set()
+        return await first
+
+    assert asyncio.run(scenario()) is True
+    stats = executor.stats()
+    assert stats["rejected"] == 1 and stats["in_flight"] == {}
+    executor.shutdown()
+
+# Une prédiction trop longue expire ; sa place n'est libérée qu'à la fin réelle du calcul
+def test_deadline_exceeded():
+    executor = InferenceExecutor(kind="thread", workers=1, max_in_flight=4, timeout_seconds=0.05)
+
+    async def scenario():
+        with pytest.raises(DeadlineExceeded):
+            await executor.run(KEY, time.sleep, 0.3)
+        return executor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["timeouts"] == 1
+    assert stats["in_flight"] == {"lille/Appartement": 1}
+    executor.shutdown(wait=True)
+    assert executor.stats()["in_flight"] == {}
+
+# Flux : la place est réservée avant l'exécution dans le pool des flux et libérée à la fin du thread
+def test_reserve_runs_in_bounded_pool():
+    executor = InferenceExecutor(kind="thread", workers=1, max_in_flight=1)
+    release = threading.Event()
+    submit = executor.reserve(("stream", "*"))
+    with pytest.raises(Overloaded):
+        executor.reserve(("stream", "*"))
+    future = submit(lambda: (release.wait(5), threading.current_thread().name)[1])
+    assert executor.stats()["in_flight"] == {"stream/*": 1}
+    release.set()
+    assert future.result(5).startswith("inference-stream")
+    executor.shutdown(wait=True)
+    assert executor.stats()["in_flight"] == {}
+    assert executor.stats()["rejected"] == 1
+
+# Mode inline : même contrôle d'admission, calcul dans la boucle
+def test_inline_executor():
+    executor = InferenceExecutor(kind="inline", max_in_flight=1)
+    assert asyncio.run(executor.run(KEY, sum, [1, 2, 3])) == 6
+    assert executor.executor is None
+    with pytest.raises(ValueError):
+        InferenceExecutor(kind="gpu")
+
+# Pool de processus : chaque processus charge ses modèles et donne le même résultat
+def test_process_executor_matches_in_process_prediction():
+    predict.init_service()
+    rows = np.array([[80.0, 0.0, 1.0], [120.0, 300.0, 0.0]])
+    expected = predict._predict_rows(rows, "lille", "Appartement")
+    executor = InferenceExecutor(kind="process", workers=1, initializer=predict._init_process_worker)
+    try:
+        result = asyncio.run(executor.run(KEY, predict._predict_rows, rows, "lille", "Appartement"))
+    finally:
+        executor.shutdown()
+    np.testing.assert_allclose(result, expected)
+
+# L'API répond 429 ou 503 avec Retry-After quand la prédiction est refusée
+def test_api_sheds_load(monkeypatch):
+    client = TestClient(app)
+    client.get("/predict/inference/stats")  # Initialise le service
+    payload = {
+        "surface_bati": 77.7,
+        "nombre_pieces": 4,
+        "type_local": "Appartement",
+        "surface_terrain": 0,
+        "nombre_lots": 3
+    }
+    monkeypatch.setattr(predict, "prediction_cache", None)
+    saturated = InferenceExecutor(kind="thread", workers=1, max_in_flight=1, retry_after=2)
+    saturated._acquire(KEY)
+    monkeypatch.setattr(predict, "inference", saturated)
+    response = client.post("/predict/lille", json=payload)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    def slow_predict(*args):
+        time.sleep(0.3)
+        return 1.0
+
+    monkeypatch.setattr(predict, "micro_batcher", None)
+    monkeypatch.setattr(predict, "predict_price", slow_predict)
+    monkeypatch.setattr(predict, "inference", InferenceExecutor(kind="thread", workers=1, timeout_seconds=0.05))
+    response = client.post("/predict", json={"ville": "lille", "features": payload})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/predict/inference/stats").json()["timeouts"] == 1
+    saturated.shutdown()
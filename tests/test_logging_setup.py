@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+import pytest
+from fastapi.testclient import TestClient
+from app.logging_setup import JsonFormatter, LazyQueueHandler, RequestLogSampler, setup_logging, shutdown_logging
+from app.main import app
+
+# Objet qui compte les conversions en texte (formatage paresseux)
+class CountingRepr:
+    def __init__(self):
+        self.calls = 0
+
+    def __repr__(self):
+        self.calls += 1
+        return "CountingRepr()"
+
+    __str__ = __repr__
+
+@pytest.fixture
+def log_stream():
+    # Logs JSON écrits dans un buffer ; shutdown_logging vide la file avant la lecture
+    shutdown_logging()
+    stream = io.StringIO()
+    setup_logging(level="INFO", fmt="json", stream=stream)
+    yield stream
+    shutdown_logging()
+
+# ---
+# Tests du sous-système de logs
+# ---
+def test_json_formatter_includes_extra():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "prix %s", (2500,), None)
+    record.ville = "lille"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "prix 2500"
+    assert entry["level"] == "INFO"
+    assert entry["ville"] == "lille"
+
+def test_queue_handler_does_not_format_in_caller():
+    value = CountingRepr()
+    handler = LazyQueueHandler(None)
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "valeur %r", (value,), None)
+    assert handler.prepare(record) is record
+    assert value.calls == 0
+
+def test_sampler():
+    never, always = RequestLogSampler(0), RequestLogSampler(1)
+    assert not never.should_log(200)
+    assert never.should_log(503)
+    assert always.should_log(200)
+    sampled = RequestLogSampler(0.5)
+    sampled._random = iter([0.2, 0.8]).__next__
+    assert [sampled.should_log(200), sampled.should_log(200)] == [True, False]
+    with pytest.raises(ValueError):
+        RequestLogSampler(1.5)
+
+def test_records_written_by_listener(log_stream):
+    logging.getLogger("app.test").info("modèle %s chargé", "lille", extra={"version": "v1"})
+    shutdown_logging()
+    entry = json.loads(log_stream.getvalue().splitlines()[-1])
+    assert entry["message"] == "modèle lille chargé"
+    assert entry["version"] == "v1"
+
+# La trace de debug n'est pas formatée quand le niveau DEBUG est désactivé
+def test_debug_trace_not_formatted_at_info(log_stream):
+    value = CountingRepr()
+    logging.getLogger("app.routes.predict").debug("features %r", value)
+    shutdown_logging()
+    assert value.calls == 0
+    assert "CountingRepr" not in log_stream.getvalue()
+
+def test_access_log(log_stream):
+    assert TestClient(app).get("/").status_code == 200
+    shutdown_logging()
+    entries = [json.loads(line) for line in log_stream.getvalue().splitlines()]
+    access = [e for e in entries if e["logger"] == "app.access"]
+    assert access[-1]["path"] == "/"
+    assert access[-1]["status"] == 200
+    assert access[-1]["duration_ms"] >= 0
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from app.dataset import load_dataset
+from app.models.artifact import ForestArtifact
+from app.models.lookup import LookupTable
+from app.models.model_loader import ModelLoader
+from app.routes import predict
+
+ROOT_PATH = Path(__file__).parent.parent
+MODEL_FEATURES = ['Surface reelle bati', 'Surface terrain', 'Nombre de lots']
+
+# ---
+# Fixtures : registre avec le moteur "lookup" et features brutes des CSV DVF
+# ---
+@pytest.fixture(scope="module")
+def loader():
+    return ModelLoader(engine="lookup", use_artifacts=False)
+
+@pytest.fixture(scope="module")
+def dvf_features():
+    frames = [
+        load_dataset(ROOT_PATH / "data" / name, MODEL_FEATURES)
+        for name in ("lille_2022.csv", "bordeaux_2022.csv")
+    ]
+    X = pd.concat(frames).dropna().to_numpy(dtype=float)
+    # Plus des points aléatoires, dont beaucoup tombent loin des données d'entraînement
+    return np.vstack([X, np.random.default_rng(0).uniform(0, 1000, (5000, 3))])
+
+def sklearn_predict(loader, type_local, X):
+    model, scaler_x, scaler_y, _ = loader.get_model_and_scalers(type_local, "lille")
+    x_scaled = scaler_x.transform(pd.DataFrame(X, columns=MODEL_FEATURES))
+    return scaler_y.inverse_transform(model.predict(x_scaled).reshape(-1, 1))[:, 0]
+
+# Features brutes tombant exactement sur les seuils (et juste à côté) de chaque feature
+def boundary_features(table, n=3000, seed=1):
+    rng = np.random.default_rng(seed)
+    columns = []
+    for i, edges in enumerate(table.edges):
+        scaled = rng.choice(edges, n).astype(np.float64) if len(edges) else np.zeros(n)
+        raw = scaled * table.x_scale[i] + table.x_mean[i]
+        columns.append(raw + rng.choice([-1e-9, 0.0, 1e-9], n) * np.abs(raw))
+    return np.column_stack(columns)
+
+# ---
+# La table donne exactement les prédictions de scaler_x -> modèle -> scaler_y
+# ---
+@pytest.mark.parametrize("type_local", ["Appartement", "Maison"])
+def test_lookup_matches_sklearn_exactly(loader, dvf_features, type_local):
+    table = loader.get_lookup_table(type_local, "lille")
+    assert table is not None
+    X = np.vstack([dvf_features, boundary_features(table)])
+    assert np.array_equal(table.predict(X), sklearn_predict(loader, type_local, X))
+
+# Une case par intervalle entre seuils successifs de chaque feature
+def test_table_shape(loader):
+    table = loader.get_lookup_table("Maison", "lille")
+    assert table.shape == tuple(len(edges) + 1 for edges in table.edges)
+    assert all(np.all(np.diff(edges) > 0) for edges in table.edges)
+    assert table.table.dtype == np.float64
+
+# ---
+# Au-delà du budget : pas de table, la prédiction parcourt les arbres
+# ---
+def test_over_budget_falls_back_to_traversal(dvf_features):
+    artifact = ForestArtifact.load(ROOT_PATH / "models" / "model_maisons.forest")
+    assert LookupTable.from_artifact(artifact, max_bytes=LookupTable.table_bytes(artifact) - 1) is None
+
+    small = ModelLoader(engine="lookup", lookup_max_bytes=1024)
+    assert small.get_lookup_table("Maison", "lille") is None
+    assert small.get_lookup_table("Appartement", "lille") is not None  # Arbre unique : 8 cases
+
+    previous = predict.model_loader
+    predict.model_loader = small
+    try:
+        X = dvf_features[:1000]
+        assert np.array_equal(predict.predict_prices(X, "lille", "Maison"), artifact.predict(X))
+    finally:
+        predict.model_loader = previous
+
+def test_lookup_invalid_shape(loader):
+    with pytest.raises(ValueError):
+        loader.get_lookup_table("Maison", "lille").predict(np.zeros((2, 4)))
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from fastapi.testclient import TestClient
+from app.dataset import DatasetCache
+from app.main import app
+from app.market_stats import STATS_COLUMNS, MarketStats, MarketStatsService, sales_columns, sorted_quantiles
+
+ROOT_PATH = Path(__file__).parent.parent
+LILLE_CSV = ROOT_PATH / "data" / "lille_2022.csv"
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def lille():
+    return DatasetCache().load(LILLE_CSV, STATS_COLUMNS)
+
+@pytest.fixture(scope="module")
+def stats(lille):
+    return MarketStats.build(lille, "lille")
+
+# Statistiques de tous les groupes, pour comparer deux constructions
+def all_groups(stats):
+    return {key: stats.lookup(*key) for key in stats.keys}
+
+# ---
+# Mêmes valeurs qu'un calcul direct avec pandas / numpy
+# ---
+def test_group_matches_pandas(lille, stats):
+    sales = pd.DataFrame(sales_columns(lille))
+    group = sales[(sales["code_postal"] == 59000) & (sales["type_local"] == "Appartement")
+                  & (sales["nombre_pieces"] == 3)]
+    result = stats.lookup(59000, "Appartement", 3)
+    prix = group["prix_m2"].to_numpy(dtype=np.float64)
+    assert result["count"] == len(group)
+    assert result["prix_m2"]["p50"] == round(float(np.quantile(prix, 0.5)), 2)
+    assert result["prix_m2"]["p90"] == round(float(np.quantile(prix, 0.9)), 2)
+    assert result["prix_m2"]["mean"] == pytest.approx(prix.mean(), abs=0.01)
+    # Tendance mensuelle
+    months = group["month"].to_numpy()
+    assert sum(item["count"] for item in result["monthly"]) == len(group)
+    january = prix[months == np.datetime64("2022-01", "M").astype(np.int64)]
+    assert result["monthly"][0] == {"month": "2022-01", "count": len(january),
+                                    "median": round(float(np.median(january)), 2)}
+
+def test_rollup_levels(stats):
+    everything = stats.lookup()
+    assert everything["count"] == len(stats)
+    # Chaque vente est dans exactement un groupe par type de bien
+    types = [key[1] for key in stats.keys if key[0] is None and key[1] is not None and key[2] is None]
+    assert set(types) >= {"Appartement", "Maison"}
+    assert sum(stats.lookup(type_local=type_local)["count"] for type_local in types) == everything["count"]
+    assert stats.lookup(59000, "Appartement", 99) is None
+
+def test_custom_quantiles(stats):
+    group = stats.keys[(None, "Maison", None)]
+    prix = stats.member_prix[stats.offsets[group]:stats.offsets[group + 1]]
+    result = stats.lookup(type_local="Maison", quantiles=(0.05, 0.95))
+    assert set(result["prix_m2"]) == {"mean", "p5", "p95"}
+    assert result["prix_m2"]["p95"] == round(float(np.quantile(prix.astype(np.float64), 0.95)), 2)
+
+def test_sorted_quantiles():
+    values = np.sort(np.random.default_rng(0).normal(size=101))
+    assert np.allclose(sorted_quantiles(values, (0, 0.33, 0.5, 1)), np.quantile(values, (0, 0.33, 0.5, 1)))
+    assert np.isnan(sorted_quantiles(values[:0], (0.5,))).all()
+
+# ---
+# Mise à jour incrémentale : identique à une construction complète
+# ---
+def test_add_rows_matches_full_build(lille, stats):
+    months = lille["Date mutation"].dt.month
+    incremental = MarketStats.build(lille[months <= 6], "lille")
+    before = incremental.lookup(59000, "Appartement", 3)
+    for month in range(7, 13):
+        incremental.add_rows(lille[months == month])
+    assert all_groups(incremental) == all_groups(stats)
+    assert before["count"] < stats.lookup(59000, "Appartement", 3)["count"]
+
+def test_service_refresh_adds_new_files(tmp_path, lille, stats):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    csv = pd.read_csv(LILLE_CSV, low_memory=False)
+    december = csv["Date mutation"].str.slice(3, 5) == "12"
+    csv[~december].to_csv(data_dir / "lille_2022.csv", index=False)
+    service = MarketStatsService(["lille"], data_dir, cache=DatasetCache(tmp_path / "cache"))
+    assert service.refresh() == [str(data_dir / "lille_2022.csv")]
+    previous = service.get("lille")
+    assert previous.lookup()["monthly"][-1]["month"] == "2022-11"
+
+    # Nouvel export : seul ce fichier est lu, l'ancienne version reste intacte
+    csv[december].to_csv(data_dir / "lille_2022-12.csv", index=False)
+    assert service.refresh() == [str(data_dir / "lille_2022-12.csv")]
+    assert service.refresh() == []
+    assert all_groups(service.get("lille")) == all_groups(stats)
+    assert previous.lookup()["monthly"][-1]["month"] == "2022-11"
+
+    # Fichier déjà intégré modifié : reconstruction de la ville
+    csv[december].to_csv(data_dir / "lille_2022.csv", index=False)
+    assert len(service.refresh()) == 2
+    assert service.get("lille").lookup()["count"] < len(stats)
+
+    with pytest.raises(ValueError):
+        service.get("paris")
+
+# ---
+# API
+# ---
+def test_stats_endpoint():
+    response = client.get("/stats", params={"ville": "lille", "code_postal": 59000, "type_local": "Appartement",
+                                            "nombre_pieces": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] > 0 and body["nombre_pieces"] == 2
+    assert set(body["prix_m2"]) == {"mean", "p10", "p25", "p50", "p75", "p90"}
+    assert [item["month"] for item in body["monthly"]] == sorted(item["month"] for item in body["monthly"])
+
+    response = client.get("/stats", params={"ville": "bordeaux", "quantiles": "0.5"})
+    assert response.status_code == 200 and set(response.json()["prix_m2"]) == {"mean", "p50"}
+
+    assert client.get("/stats/info").json()["villes"][0]["n_groups"] > 0
+
+def test_stats_endpoint_errors():
+    assert client.get("/stats", params={"ville": "paris"}).status_code == 400
+    assert client.get("/stats", params={"ville": "lille", "quantiles": "2"}).status_code == 400
+    assert client.get("/stats", params={"ville": "lille", "code_postal": 1}).status_code == 404
+    assert client.get("/stats").status_code == 422
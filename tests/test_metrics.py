@@ -0,0 +1,81 @@
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.metrics import LATENCY_BUCKETS, LatencyHistograms
+
+LABELS = ("lille", "Maison", "v1")
+
+# ---
+# Tests des histogrammes de latence
+# ---
+def test_observe_and_quantiles():
+    histograms = LatencyHistograms()
+    for _ in range(99):
+        histograms.observe("predict", LABELS, 0.0002)
+    histograms.observe("predict", LABELS, 0.3)
+    [row] = histograms.summary()
+    assert row["stage"] == "predict" and row["ville"] == "lille" and row["model_version"] == "v1"
+    assert row["count"] == 100
+    assert 0.1 < row["p50_ms"] <= 0.25
+    assert row["p99_ms"] <= 0.25 < histograms.quantile(histograms.snapshot()[("predict",) + LABELS], 0.999) * 1000
+
+# Chaque thread écrit dans son shard, la lecture additionne les shards
+def test_thread_shards_are_merged():
+    histograms = LatencyHistograms()
+
+    def work():
+        for _ in range(1000):
+            histograms.observe("encode", LABELS, 0.00001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    series = histograms.snapshot()[("encode",) + LABELS]
+    assert sum(series[:-1]) == 4000
+    assert series[-1] == pytest.approx(0.04)
+
+# Shards des threads terminés additionnés puis oubliés : pas de croissance avec les threads courts
+def test_dead_thread_shards_are_folded():
+    histograms = LatencyHistograms()
+    for _ in range(50):
+        thread = threading.Thread(target=histograms.observe, args=("encode", LABELS, 0.00001))
+        thread.start()
+        thread.join()
+    histograms.observe("encode", LABELS, 0.00001)
+    assert sum(histograms.snapshot()[("encode",) + LABELS][:-1]) == 51
+    assert len(histograms._shards) == 1
+    histograms.reset()
+    assert sum(histograms.snapshot().get(("encode",) + LABELS, [0])[:-1]) == 0
+
+def test_render_prometheus():
+    histograms = LatencyHistograms()
+    histograms.observe("scale", LABELS, 0.002)
+    histograms.observe("scale", LABELS, 20.0)
+    text = histograms.render_prometheus()
+    assert "# TYPE predict_stage_duration_seconds histogram" in text
+    labels = 'stage="scale",ville="lille",type_local="Maison",model_version="v1"'
+    assert f'predict_stage_duration_seconds_bucket{{{labels},le="0.0025"}} 1' in text
+    assert f'predict_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"predict_stage_duration_seconds_count{{{labels}}} 2" in text
+    # Buckets cumulatifs : un par borne plus +Inf
+    assert text.count("predict_stage_duration_seconds_bucket{") == len(LATENCY_BUCKETS) + 1
+
+# ---
+# Les étapes d'une prédiction sont exposées sur /metrics
+# ---
+def test_metrics_endpoint_records_stages():
+    client = TestClient(app)
+    response = client.post("/predict/lille", json={
+        "surface_bati": 91.5, "nombre_pieces": 4, "type_local": "Appartement",
+        "surface_terrain": 0, "nombre_lots": 3
+    })
+    assert response.status_code == 200
+    text = client.get("/metrics").text
+    for stage in ("parse", "predict", "serialize", "total"):
+        assert f'stage="{stage}",ville="lille",type_local="Appartement"' in text
+
+    stages = {row["stage"] for row in client.get("/metrics/latency").json()["stages"]}
+    assert {"parse", "predict", "serialize", "total"} <= stages
@@ -0,0 +1,150 @@
+import json
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from app.models.model_loader import ModelLoader, MANIFEST_NAME
+
+MODELS_PATH = Path(__file__).parent.parent / "models"
+
+# ---
+# Fixture : copie des artefacts dans un dossier temporaire avec un manifeste à 3 villes
+# ---
+@pytest.fixture
+def models_dir(tmp_path):
+    for f in MODELS_PATH.glob("*.pkl"):
+        shutil.copy(f, tmp_path / f.name)
+    entries = []
+    for ville in ["lille", "bordeaux", "nantes"]:
+        for type_local, suffix in [("Appartement", "appartements"), ("Maison", "maisons")]:
+            entries.append({
+                "ville": ville, "type_local": type_local, "version": "v1",
+                "model": f"model_{suffix}.pkl",
+                "scaler_x": f"scaler_x_{suffix}.pkl", "scaler_y": f"scaler_y_{suffix}.pkl"
+            })
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps({"models": entries}))
+    return tmp_path
+
+def loaded_models(loader):
+    return {(m["ville"], m["type_local"]) for m in loader.available_models() if m["loaded"]}
+
+# ---
+# Tests du registre des modèles
+# ---
+def test_models_are_loaded_lazily(models_dir):
+    loader = ModelLoader(models_path=models_dir)
+    assert len(loader.available_models()) == 6
+    assert loaded_models(loader) == set()
+    model, scaler_x, scaler_y, name = loader.get_model_and_scalers("Maison", ville="nantes")
+    assert name == "RandomForestRegressor"
+    assert loaded_models(loader) == {("nantes", "Maison")}
+
+def test_resident_models_are_capped(models_dir):
+    loader = ModelLoader(models_path=models_dir, max_resident=2)
+    loader.get_bundle("Appartement", "lille")
+    loader.get_bundle("Appartement", "bordeaux")
+    loader.get_bundle("Appartement", "lille")  # lille devient le plus récent
+    loader.get_bundle("Appartement", "nantes")  # évince bordeaux
+    assert loaded_models(loader) == {("lille", "Appartement"), ("nantes", "Appartement")}
+
+def test_unknown_ville_or_version(models_dir):
+    loader = ModelLoader(models_path=models_dir)
+    with pytest.raises(ValueError):
+        loader.get_bundle("Maison", "paris")
+    with pytest.raises(ValueError):
+        loader.get_bundle("Maison", "lille", version="v2")
+    with pytest.raises(ValueError):
+        loader.get_bundle("Bureau", "lille")
+
+# Un fichier modifié est rechargé et remplacé sans recréer le registre
+def test_hot_reload_of_changed_artifact(models_dir):
+    loader = ModelLoader(models_path=models_dir)
+    reloads = []
+    loader.add_reload_listener(lambda: reloads.append(loader.version))
+    old_bundle = loader.get_bundle("Appartement", "lille")
+    old_version = loader.version
+    assert loader.check_for_updates() is False
+
+    # On remplace le modèle appartements par le modèle maisons
+    shutil.copy(models_dir / "model_maisons.pkl", models_dir / "model_appartements.pkl")
+    assert loader.check_for_updates() is True
+    new_bundle = loader.get_bundle("Appartement", "lille")
+    assert new_bundle is not old_bundle
+    assert new_bundle.model_name == "RandomForestRegressor"
+    assert old_bundle.model_name == "DecisionTreeRegressor"  # l'ancien reste utilisable
+    assert loader.version != old_version and reloads == [loader.version]
+
+# Moteurs native et lookup : forêt compilée et table reconstruites au rechargement, pas celles de l'ancien modèle
+@pytest.mark.parametrize("engine", ["native", "lookup"])
+def test_hot_reload_rebuilds_compiled_models(models_dir, engine):
+    loader = ModelLoader(engine=engine, models_path=models_dir)
+    old_bundle = loader.get_bundle("Appartement", "lille")
+    shutil.copy(models_dir / "model_maisons.pkl", models_dir / "model_appartements.pkl")
+    assert loader.check_for_updates() is True
+    new_bundle = loader.get_bundle("Appartement", "lille")
+    # Construits par le rechargement, avant la première requête
+    built = new_bundle._compiled if engine == "native" else new_bundle._lookup
+    assert built is not None
+    assert built is not (old_bundle._compiled if engine == "native" else old_bundle._lookup)
+    model, scaler_x, scaler_y, _ = loader.get_model_and_scalers("Appartement", "lille")
+    X = pd.DataFrame([[120.0, 400.0, 0.0], [85.0, 0.0, 1.0]], columns=scaler_x.feature_names_in_)
+    expected = scaler_y.inverse_transform(model.predict(scaler_x.transform(X)).reshape(-1, 1))[:, 0]
+    assert np.allclose(built.predict(X.to_numpy()), expected)
+
+# Une nouvelle version ajoutée au manifeste devient la version active
+def test_manifest_change_adds_version(models_dir):
+    loader = ModelLoader(models_path=models_dir)
+    manifest = json.loads((models_dir / MANIFEST_NAME).read_text())
+    manifest["models"].append({
+        "ville": "lille", "type_local": "Appartement", "version": "v2",
+        "model": "model_maisons.pkl", "scaler_x": "scaler_x_maisons.pkl", "scaler_y": "scaler_y_maisons.pkl"
+    })
+    (models_dir / MANIFEST_NAME).write_text(json.dumps(manifest))
+    assert loader.check_for_updates() is True
+    assert loader.get_bundle("Appartement", "lille").version == "v2"
+    assert loader.get_bundle("Appartement", "lille", version="v1").model_name == "DecisionTreeRegressor"
+
+# Sans manifeste, les six fichiers historiques sont utilisés pour lille et bordeaux
+def test_legacy_layout_without_manifest(models_dir):
+    (models_dir / MANIFEST_NAME).unlink()
+    loader = ModelLoader(models_path=models_dir)
+    assert loader.get_bundle("Maison", "bordeaux").version == "legacy"
+
+def test_missing_artifact(models_dir):
+    (models_dir / "scaler_y_maisons.pkl").unlink()
+    with pytest.raises(RuntimeError):
+        ModelLoader(models_path=models_dir)
+
+# Chargement hors verrou : un modèle lent ne bloque pas les modèles résidents,
+# et les appels concurrents pour le même modèle attendent un seul chargement
+def test_slow_load_does_not_block_other_models(models_dir, monkeypatch):
+    loader = ModelLoader(models_path=models_dir)
+    loader.get_bundle("Appartement", "lille")
+    started, release = threading.Event(), threading.Event()
+    load_bundle = loader._load_bundle
+    loads = []
+
+    def slow_load(entry):
+        loads.append(entry.key)
+        started.set()
+        release.wait(10)
+        return load_bundle(entry)
+
+    monkeypatch.setattr(loader, "_load_bundle", slow_load)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(loader.get_bundle("Maison", "nantes")))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(10)
+    # Modèle résident servi pendant le chargement de nantes
+    assert loader.get_bundle("Appartement", "lille").entry.ville == "lille"
+    assert ("nantes", "Maison") not in loaded_models(loader)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert len(loads) == 1
+    assert len(results) == 3 and all(bundle is results[0] for bundle in results)
+    assert ("nantes", "Maison") in loaded_models(loader)
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from app import config, scoring
+from app.models.model_loader import ModelLoader
+from app.scoring import score_csv
+
+DATA_PATH = Path(__file__).parent.parent / "data"
+
+@pytest.fixture(scope="module")
+def model_loader():
+    return ModelLoader(engine="native")
+
+@pytest.fixture
+def dvf_sample(tmp_path):
+    # Extrait de 2000 lignes de l'export DVF de Lille
+    path = tmp_path / "dvf.csv"
+    pd.read_csv(DATA_PATH / "lille_2022.csv", nrows=2000, low_memory=False).to_csv(path, index=False)
+    return path
+
+# ---
+# Tests du scoring en masse
+# ---
+def test_score_csv_streams_chunks(dvf_sample, tmp_path, model_loader):
+    output = tmp_path / "predictions.csv"
+    report = score_csv(dvf_sample, output, chunksize=300, model_loader=model_loader)
+    assert report["rows_read"] == 2000
+    assert report["rows_scored"] + report["rows_skipped"] == 2000
+    assert report["peak_rss_mb"] > 0
+
+    predictions = pd.read_csv(output)
+    assert len(predictions) == report["rows_scored"]
+    assert set(predictions["type_local"]) <= {"Appartement", "Maison"}
+    assert predictions["prix_m2_estime"].notna().all()
+
+    # Même résultat que la prédiction directe du modèle
+    row = predictions.iloc[0]
+    expected = model_loader.get_compiled_model(row["type_local"], "lille").predict(
+        [[row["surface_bati"], row["surface_terrain"], row["nombre_lots"]]]
+    )[0]
+    assert row["prix_m2_estime"] == pytest.approx(round(expected, 2))
+
+# La taille des morceaux ne change pas le résultat
+def test_score_csv_chunksize_invariant(dvf_sample, tmp_path, model_loader):
+    small, large = tmp_path / "small.csv", tmp_path / "large.csv"
+    score_csv(dvf_sample, small, chunksize=128, model_loader=model_loader)
+    score_csv(dvf_sample, large, chunksize=100_000, model_loader=model_loader)
+    pd.testing.assert_frame_equal(pd.read_csv(small), pd.read_csv(large))
+
+def test_score_csv_pieces_filter(dvf_sample, tmp_path, model_loader):
+    report = score_csv(dvf_sample, tmp_path / "p.csv", pieces=4, model_loader=model_loader)
+    all_rows = score_csv(dvf_sample, tmp_path / "all.csv", model_loader=model_loader)
+    assert 0 < report["rows_scored"] < all_rows["rows_scored"]
+
+# Le mode parallèle donne le même fichier que le mode séquentiel, dans le même ordre
+def test_score_csv_parallel_matches_sequential(dvf_sample, tmp_path, model_loader):
+    sequential, parallel = tmp_path / "seq.csv", tmp_path / "par.csv"
+    score_csv(dvf_sample, sequential, chunksize=250, model_loader=model_loader)
+    report = score_csv(dvf_sample, parallel, chunksize=250, model_loader=model_loader, workers=2)
+    assert report["workers"] == 2
+    pd.testing.assert_frame_equal(pd.read_csv(sequential), pd.read_csv(parallel))
+
+# Le moteur "lookup" donne le même fichier que les estimateurs sklearn
+def test_score_csv_lookup_engine(dvf_sample, tmp_path):
+    traversal, lookup = tmp_path / "traversal.csv", tmp_path / "lookup.csv"
+    score_csv(dvf_sample, traversal, model_loader=ModelLoader(engine="sklearn", use_artifacts=False))
+    score_csv(dvf_sample, lookup, model_loader=ModelLoader(engine="lookup"))
+    pd.testing.assert_frame_equal(pd.read_csv(traversal), pd.read_csv(lookup))
+
+# Sans --engine : moteur de l'API (PREDICT_ENGINE), mêmes prix que les estimateurs sklearn
+def test_score_csv_defaults_to_api_engine(dvf_sample, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PREDICT_ENGINE", "artifact")
+    loaders = []
+    monkeypatch.setattr(scoring, "ModelLoader", lambda engine: loaders.append(engine) or ModelLoader(engine=engine))
+    reference, default = tmp_path / "sklearn.csv", tmp_path / "default.csv"
+    score_csv(dvf_sample, reference, model_loader=ModelLoader(engine="sklearn", use_artifacts=False))
+    assert scoring.main([str(dvf_sample), "-o", str(default)]) == 0
+    assert loaders == ["artifact"]
+    pd.testing.assert_frame_equal(pd.read_csv(reference), pd.read_csv(default))
@@ -0,0 +1,103 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import pytest
+from pathlib import Path
+from app.memory import SERVER_PID_ENV, child_pids, memory_report, process_memory
+
+ROOT_PATH = Path(__file__).parent.parent
+
+pytestmark = pytest.mark.skipif(not Path("/proc/self/smaps").exists() or not hasattr(os, "fork"),
+                                reason="Linux uniquement (fork, /proc)")
+
+PREDICTION = {"surface_bati": 80, "nombre_pieces": 4, "type_local": "Appartement",
+              "surface_terrain": 0, "nombre_lots": 1}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def get_json(url: str, data: dict = None):
+    request = urllib.request.Request(url, data=json.dumps(data).encode() if data is not None else None,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status, json.loads(response.read())
+
+def wait_until(condition, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+# ---
+# Mémoire lue dans /proc
+# ---
+def test_process_memory():
+    memory = process_memory()
+    assert set(memory) == {"rss_bytes", "pss_bytes", "uss_bytes", "shared_bytes", "swap_bytes"}
+    assert 0 < memory["uss_bytes"] <= memory["rss_bytes"]
+    assert memory["pss_bytes"] <= memory["rss_bytes"]
+    assert process_memory(2 ** 31 - 1) is None
+
+def test_child_pids_and_report(monkeypatch):
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        assert child.pid in child_pids(os.getpid())
+        # Hors app.server : mémoire du processus seul
+        monkeypatch.delenv(SERVER_PID_ENV, raising=False)
+        assert "workers" not in memory_report()
+        monkeypatch.setenv(SERVER_PID_ENV, str(os.getpid()))
+        report = memory_report()
+        assert child.pid in [worker["pid"] for worker in report["workers"]]
+        assert report["total_pss_bytes"] >= report["server"]["pss_bytes"]
+    finally:
+        child.kill()
+        child.wait()
+
+# ---
+# Serveur multi-workers : partage, recyclage, SIGHUP et arrêt
+# ---
+def test_prefork_server():
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--port", str(port), "--workers", "2", "--max-requests", "10",
+         "--memory-report-interval", "0", "--graceful-timeout", "5"],
+        cwd=ROOT_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        assert wait_until(lambda: get_json(f"{url}/health/ready")[1]["status"] == "ready")
+        status, report = get_json(f"{url}/metrics/memory")
+        assert report["server"]["pid"] == process.pid
+        first_workers = {worker["pid"] for worker in report["workers"]}
+        assert len(first_workers) == 2 and report["pid"] in first_workers
+        # Modèles chargés une fois dans le parent : l'essentiel des pages d'un worker est partagé
+        worker = report["workers"][0]
+        assert worker["shared_bytes"] > worker["uss_bytes"]
+
+        # Recyclage après 10 requêtes : les prédictions continuent sans erreur
+        for _ in range(40):
+            status, body = get_json(f"{url}/predict/lille", PREDICTION)
+            assert status == 200 and body["prix_m2_estime"] > 0
+        assert wait_until(lambda: len(set(child_pids(process.pid)) - first_workers) == 2, timeout=20)
+
+        # SIGHUP : tous les workers remplacés
+        before = set(child_pids(process.pid))
+        process.send_signal(signal.SIGHUP)
+        assert wait_until(lambda: len(child_pids(process.pid)) == 2 and not before & set(child_pids(process.pid)),
+                          timeout=20)
+        assert get_json(f"{url}/predict/lille", PREDICTION)[0] == 200
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
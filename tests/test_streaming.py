@@ -0,0 +1,112 @@
+import io
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app import config
+from app.main import app
+from app.streaming import negotiate
+
+client = TestClient(app)
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+ARROW = "application/vnd.apache.arrow.stream"
+
+ITEMS = [
+    {"ville": "lille", "features": {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+    {"ville": "bordeaux", "features": {"surface_bati": 120, "nombre_pieces": 4, "type_local": "Maison", "surface_terrain": 500, "nombre_lots": 0}},
+    {"ville": "paris", "features": {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+    {"ville": "lille", "features": {"surface_bati": -5, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 1}},
+    {"ville": "lille", "features": {"surface_bati": 80, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 0, "nombre_lots": 2}},
+]
+
+def ndjson(items) -> str:
+    return "".join(json.dumps(item) + "\n" for item in items)
+
+def read_ndjson(text: str):
+    return [json.loads(line) for line in text.splitlines()]
+
+# Négociation du format de réponse (Accept)
+def test_negotiate():
+    assert negotiate(None, "ndjson") == "ndjson"
+    assert negotiate("*/*", "arrow") == "arrow"
+    assert negotiate("application/json", "ndjson") == "json"
+    assert negotiate(f"application/json;q=0.5, {ARROW}", "ndjson") == "arrow"
+    assert negotiate("text/html, application/x-ndjson;q=0", "ndjson") is None
+
+# NDJSON : mêmes prédictions que /predict/batch, erreurs par ligne, ordre conservé entre morceaux
+def test_stream_ndjson(monkeypatch):
+    monkeypatch.setattr(config, "STREAM_CHUNK_ROWS", 2)
+    response = client.post("/predict/stream?interval=true", content=ndjson(ITEMS) + "\n", headers=NDJSON)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = read_ndjson(response.text)
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4]
+    batch = client.post("/predict/batch?interval=true", json={"items": ITEMS}).json()["results"]
+    for result, expected in zip(results, batch):
+        if expected["error"] is None:
+            assert result["prix_m2_estime"] == expected["prix_m2_estime"]
+            assert result["quantiles"] == expected["quantiles"]
+        else:
+            assert "prix_m2_estime" not in result and result["error"]
+
+# Lignes à plat, JSON invalide et features manquantes : une erreur par ligne, réponse JSON
+def test_stream_ndjson_to_json():
+    body = ndjson([{"ville": "lille", "type_local": "Maison", "surface_bati": 120, "surface_terrain": 300, "nombre_lots": 0}])
+    body += "pas du json\n" + ndjson([{"ville": "lille", "type_local": "Maison", "nombre_lots": 0},
+                                      {"ville": "lille", "type_local": "Maison", "surface_bati": 120, "nombre_lots": 1.5}])
+    response = client.post("/predict/stream", content=body, headers={**NDJSON, "Accept": "application/json"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["n_success"] == 1 and data["n_errors"] == 3
+    assert data["results"][0]["prix_m2_estime"] > 0
+    assert "NDJSON" in data["results"][1]["error"]
+    assert "surface_bati" in data["results"][2]["error"]
+    assert "nombre_lots" in data["results"][3]["error"]
+
+    empty = client.post("/predict/stream", content=b"", headers={**NDJSON, "Accept": "application/json"})
+    assert empty.json() == {"results": [], "n_success": 0, "n_errors": 0}
+
+# Formats non pris en charge
+def test_stream_unsupported_formats():
+    assert client.post("/predict/stream", content="a,b\n", headers={"Content-Type": "text/csv"}).status_code == 415
+    response = client.post("/predict/stream", content=ndjson(ITEMS), headers={**NDJSON, "Accept": "text/html"})
+    assert response.status_code == 406
+
+# Arrow IPC en entrée et en sortie : colonnes typées, nulls pour les lignes en erreur
+def test_stream_arrow():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({
+        "ville": ["Lille", "bordeaux", "lille"],
+        "type_local": pa.array(["Appartement", "Maison", "Appartement"]).dictionary_encode(),
+        "surface_bati": pa.array([100, 120, 80], pa.int32()),
+        "surface_terrain": [0.0, 500.0, None],
+        "nombre_lots": pa.array([1, 0, None], pa.int16()),
+    })
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    response = client.post("/predict/stream?quantiles=0.1,0.9", content=sink.getvalue(),
+                           headers={"Content-Type": ARROW})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == ARROW
+    result = pa.ipc.open_stream(response.content).read_all()
+    assert result.column_names == ["index", "prix_m2_estime", "p10", "p90", "error"]
+    rows = result.to_pylist()
+    batch = client.post("/predict/batch?quantiles=0.1,0.9", json={"items": ITEMS[:2]}).json()["results"]
+    for row, expected in zip(rows, batch):
+        assert row["prix_m2_estime"] == expected["prix_m2_estime"]
+        assert row["p10"] == expected["quantiles"]["p10"] and row["error"] is None
+    assert rows[2]["prix_m2_estime"] is None and rows[2]["error"]
+
+    # NDJSON en entrée, Arrow en sortie
+    response = client.post("/predict/stream", content=ndjson(ITEMS), headers={**NDJSON, "Accept": ARROW})
+    assert pa.ipc.open_stream(response.content).read_all().num_rows == len(ITEMS)
+
+    # Flux Arrow invalide ou colonne manquante : 400 avant tout résultat
+    response = client.post("/predict/stream", content=b"pas un flux arrow", headers={"Content-Type": ARROW})
+    assert response.status_code == 400
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.drop_columns(["ville"]).schema) as writer:
+        writer.write_table(table.drop_columns(["ville"]))
+    response = client.post("/predict/stream", content=sink.getvalue(), headers={"Content-Type": ARROW})
+    assert response.status_code == 400 and "ville" in response.json()["detail"]
@@ -0,0 +1,64 @@
+import json
+import numpy as np
+import pytest
+from pathlib import Path
+from app.dataset import load_dataset
+from app.models.model_loader import ModelLoader
+from app.training import prepare_dataset, train_all
+
+DATA_PATH = Path(__file__).parent.parent / "data"
+
+@pytest.fixture(scope="module")
+def lille_data():
+    return load_dataset(DATA_PATH / "lille_2022.csv")
+
+@pytest.fixture
+def models_dir(tmp_path):
+    # Dossier models vide, avec un manifeste sans entrée
+    path = tmp_path / "models"
+    path.mkdir()
+    (path / "manifest.json").write_text(json.dumps({"models": []}))
+    return path
+
+# ---
+# Tests du prétraitement
+# ---
+def test_prepare_dataset_filters_and_fills(lille_data):
+    X, y = prepare_dataset(lille_data, "Maison")
+    assert list(X.columns) == ["Surface reelle bati", "Surface terrain", "Nombre de lots"]
+    assert len(X) == len(y) > 0
+    assert not X.isna().any().any()
+    # Coupure IQR : aucun prix au-delà de Q3 + 1.5 IQR du jeu filtré
+    raw = lille_data[(lille_data["Type local"] == "Maison") & (lille_data["Nombre pieces principales"] == 4)]
+    prix = raw["Valeur fonciere"] / raw["Surface reelle bati"]
+    q1, q3 = np.percentile(prix, [25, 75])
+    assert y.max() <= q3 + 1.5 * (q3 - q1)
+
+def test_prepare_dataset_appartement_terrain_zero(lille_data):
+    X, _ = prepare_dataset(lille_data, "Appartement")
+    assert (X["Surface terrain"] == 0).mean() > 0.9
+
+# ---
+# Tests de l'entraînement
+# ---
+def test_train_all_writes_version_and_manifest(models_dir):
+    metrics = train_all({"lille": DATA_PATH / "lille_2022.csv"}, "v1", models_dir, grid="quick", cv=3, activate=True)
+    assert {(m["ville"], m["type_local"]) for m in metrics["models"]} == {("lille", "Appartement"), ("lille", "Maison")}
+    assert json.loads((models_dir / "v1" / "metrics.json").read_text())["version"] == "v1"
+
+    # Les nouveaux modèles sont servis par le registre
+    loader = ModelLoader(models_path=models_dir)
+    model, scaler_x, scaler_y, _ = loader.get_model_and_scalers("Maison", "lille")
+    assert loader.resolve("Maison", "lille").version == "v1"
+    assert scaler_x.n_features_in_ == 3
+
+    # Une version existante n'est jamais écrasée
+    with pytest.raises(ValueError):
+        train_all({"lille": DATA_PATH / "lille_2022.csv"}, "v1", models_dir, grid="quick", cv=3)
+
+# Deux entraînements avec la même graine donnent les mêmes modèles
+def test_train_all_reproducible(models_dir):
+    first = train_all({"lille": DATA_PATH / "lille_2022.csv"}, "a", models_dir, types_local=("Maison",), grid="quick", cv=3)
+    second = train_all({"lille": DATA_PATH / "lille_2022.csv"}, "b", models_dir, types_local=("Maison",), grid="quick", cv=3)
+    assert first["models"][0]["params"] == second["models"][0]["params"]
+    assert first["models"][0]["test"] == second["models"][0]["test"]
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from app.utils import FeatureProcessor, load_and_validate_dataset
@@ -104,4 +105,40 @@ def test_load_and_validate_dataset_missing_col(sample_dataset, tmp_path):
     # On enlève une colonne
     sample_dataset.drop(columns=['surface_bati']).to_csv(file_path, index=False)
     with pytest.raises(ValueError):
-        load_and_validate_dataset(file_path)
\ No newline at end of file
+        load_and_validate_dataset(file_path)
+# ---
+# Tests de l'encodage rapide dans un buffer NumPy
+# ---
+def test_encode_writes_into_buffer(feature_processor):
+    buffer = np.empty((1, 3))
+    features = {"surface_bati": 100, "nombre_pieces": 4, "type_local": "Appartement", "surface_terrain": 20, "nombre_lots": 1}
+    row = feature_processor.encode(features, out=buffer)
+    assert row is buffer  # Pas de nouvelle allocation
+    assert row.tolist() == [[100.0, 20.0, 1.0]]
+
+def test_encode_rejects_invalid_values(feature_processor):
+    with pytest.raises(ValueError):
+        feature_processor.encode({"surface_bati": 0, "surface_terrain": 0, "nombre_lots": 1})
+    with pytest.raises(ValueError):
+        feature_processor.encode({"surface_bati": 100, "surface_terrain": 0, "nombre_lots": 101})
+    with pytest.raises(ValueError):
+        feature_processor.encode({"surface_terrain": 0, "nombre_lots": 1})
+    with pytest.raises(TypeError):
+        feature_processor.encode({"surface_bati": "100", "surface_terrain": 0, "nombre_lots": 1})
+
+# Les contrôles vectorisés indiquent quelles lignes sont invalides
+def test_encode_batch_reports_invalid_rows(feature_processor):
+    X, errors = feature_processor.encode_batch([
+        {"surface_bati": 100, "surface_terrain": 0, "nombre_lots": 1},
+        {"surface_bati": -1, "surface_terrain": 0, "nombre_lots": 1},
+        {"surface_bati": 80, "nombre_lots": 2},
+        {"surface_bati": 80, "surface_terrain": 20000, "nombre_lots": 2},
+        {"surface_bati": 80},
+    ])
+    assert X.shape == (5, 3)
+    assert X[2].tolist() == [80.0, 0.0, 2.0]  # surface_terrain vaut 0 par défaut
+    assert sorted(errors) == [1, 3, 4]
+    assert "surface_terrain" in errors[3]
+
+def test_check_rows_valid_matrix(feature_processor):
+    assert feature_processor.check_rows(np.array([[100.0, 0.0, 1.0], [50.0, 300.0, 0.0]])) == {}